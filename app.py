@@ -1,13 +1,49 @@
 import os
 import csv
 import json 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import click
+from flask import Flask, Response, g, render_template, request, jsonify, send_from_directory, url_for
 from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import logging
 import uuid 
 import time 
-from collections import defaultdict
+import threading
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import mimetypes
+import pickle
+import re
+import bisect
+import sqlite3
+import sys
+import tempfile
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from operator import itemgetter
 from dotenv import load_dotenv 
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    import fcntl
+except ImportError: # Windows : les verrous restent limités au process courant
+    fcntl = None
+
+try:
+    import brotli
+except ImportError: # index.html et réponses JSON compressés en gzip uniquement
+    brotli = None
+
+try:
+    import orjson
+except ImportError: # encodage JSON de la bibliothèque standard
+    orjson = None
 
 # --- Configuration des chemins des fichiers CSV ---
 # Définir BASE_DIR avant son utilisation
@@ -34,200 +70,2794 @@ else:
         logging.warning("Fichier .env non trouvé à la racine ou dans backend/. Les variables d'environnement système seront utilisées si définies.")
 
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+
+# Utiliser BASE_DIR pour les autres chemins de fichiers (PRONOZONE_DATA_DIR permet de pointer ailleurs)
+DATA_DIR = os.getenv("PRONOZONE_DATA_DIR", BASE_DIR)
+USERS_FILE = os.path.join(DATA_DIR, 'users.csv')
+MATCHES_FILE = os.path.join(DATA_DIR, 'matches.csv')
+PARIS_FILE = os.path.join(DATA_DIR, 'paris.csv')
+PARIS_PARTITIONS_DIR = os.path.join(DATA_DIR, 'paris.d')
+SUIVIS_FILE = os.path.join(DATA_DIR, 'suivis.csv')
+BILANS_FILE = os.path.join(DATA_DIR, 'bilans.csv')
+USERS_JOURNAL_FILE = os.path.join(DATA_DIR, 'users.journal')
+USERS_LOCK_DIR = os.path.join(DATA_DIR, 'users.locks')
+SUIVIS_JOURNAL_FILE = os.path.join(DATA_DIR, 'suivis.journal')
+SUIVIS_LOCK_DIR = os.path.join(DATA_DIR, 'suivis.locks')
+MATCHES_JOURNAL_FILE = os.path.join(DATA_DIR, 'matches.journal')
+MATCHES_LOCK_FILE = os.path.join(DATA_DIR, 'matches.lock')
+MATCH_SCHEDULER_LOCK_FILE = os.path.join(DATA_DIR, 'matches.scheduler.lock')
+SETTLEMENT_LOCK_FILE = os.path.join(DATA_DIR, 'settlement.lock')
+SNAPSHOTS_DIR = os.path.join(DATA_DIR, 'snapshots.d')
+NOTIFICATIONS_OUTBOX_FILE = os.path.join(DATA_DIR, 'notifications.outbox')
+SQLITE_DB_FILE = os.getenv("PRONOZONE_SQLITE_PATH", os.path.join(DATA_DIR, 'pronozone.db'))
+ASSETS_DIR = os.path.join(BASE_DIR, 'assets_dist') # produit par build_assets.py
+
+# --- Définition des en-têtes pour les fichiers CSV ---
+USERS_HEADER = ['user_id', 'pseudo', 'join_date', 'xp', 'level', 'email', 'pronocoins_balance', 
+                'last_daily_reward_date', 'tutorial_completed_reward_claimed', 
+                'google_linked_reward_claimed', 'pseudo_created_reward_claimed', 
+                'unlocked_pronos', 'bet_count', 'three_bets_reward_claimed',
+                'tiktok_follow_reward_claimed', 'x_follow_reward_claimed', 
+                'instagram_follow_reward_claimed', 'telegram_channel_reward_claimed',
+                'telegram_chat_reward_claimed', 
+                'last_ad_reward_timestamp',
+                'telegram_first_name', 'telegram_last_name', 'telegram_username',
+                'bilan_paris_regles', 'bilan_paris_gagnes', 'bilan_gains_nets', 'bilan_mises_reglees',
+                'gains_verses'
+                ]
+MATCHES_HEADER = ['Date', 'Heure', 'Match', 'Pari', 'Cote', 'Risque', 'Note', 'Niveau', 'Statut', 'MatchID']
+PARIS_HEADER = ['bet_id', 'user_id', 'MatchID', 'MatchName', 'DatePari', 'Montant', 'StatutPari', 
+                'CotePari', 'BetType', 'CoteGagnante', 'Gain']
+SUIVIS_HEADER = ['user_id', 'MatchID', 'date_suivi']
+BILANS_HEADER = ['user_id', 'date', 'gagnes', 'perdus', 'pnl']
+
+# --- Constantes de Gamification ---
+PRONOCOINS_INITIAL_BALANCE = 50
+PRONOCOINS_UNLOCK_COST = 10
+PRONOCOINS_BET_COST = 10 
+PRONOCOINS_DAILY_REWARD = 5
+PRONOCOINS_AD_REWARD = 1 
+XP_PER_BET = 1
+XP_PER_UNLOCK = 2
+XP_PER_DAILY_REWARD = 5 
+XP_PER_AD_WATCH = 1 
+REWARD_SOCIAL_PC = 3
+REWARD_SOCIAL_XP = 5
+AD_REWARD_COOLDOWN_SECONDS = 3600 
+
+
+TASKS_CONFIG = {
+    'tutorial': {'name': 'Terminer le tutoriel', 'pc_reward': 1, 'xp_reward': 5, 'claimed_field': 'tutorial_completed_reward_claimed'},
+    'google': {'name': 'Lier son compte Google', 'pc_reward': 5, 'xp_reward': 10, 'claimed_field': 'google_linked_reward_claimed'},
+    'pseudo': {'name': 'Créer son pseudo', 'pc_reward': 2, 'xp_reward': 5, 'claimed_field': 'pseudo_created_reward_claimed'},
+    'three_bets': {'name': 'Faire 3 paris', 'pc_reward': 10, 'xp_reward': 15, 'claimed_field': 'three_bets_reward_claimed', 'condition_bet_count': 3},
+    'tiktok': {'name': 'Suivre sur TikTok', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'tiktok_follow_reward_claimed'},
+    'x': {'name': 'Suivre sur X (Twitter)', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'x_follow_reward_claimed'},
+    'instagram': {'name': 'Suivre sur Instagram', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'instagram_follow_reward_claimed'},
+    'tg_channel': {'name': 'Rejoindre le Canal Telegram', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'telegram_channel_reward_claimed'},
+    'tg_chat': {'name': 'Rejoindre le Chat Telegram', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'telegram_chat_reward_claimed'}
+}
+LEVELS_XP = [0, 100, 250, 500, 1000, 2000, 5000, 10000] 
+BET_OUTCOMES = ('gagne', 'perdu')
+BILAN_TOTAL_FIELDS = ['bilan_paris_regles', 'bilan_paris_gagnes', 'bilan_gains_nets', 'bilan_mises_reglees']
+LEADERBOARD_PAGE_SIZE = 20
+LEADERBOARD_MAX_PAGE_SIZE = 100
+PARIS_PAGE_SIZE = 20
+PARIS_MAX_PAGE_SIZE = 100
+PARIS_KEEP_MONTHS = int(os.getenv("PARIS_KEEP_MONTHS", 3))
+PARIS_ARCHIVE_BLOCK_BYTES = 64 * 1024
+MATCH_STATUS_UPCOMING = 'à venir'
+MATCH_STATUS_LIVE = 'en cours'
+MATCH_STATUS_FINISHED = 'terminé'
+MATCH_TIME_FORMAT = '%Y-%m-%d %H:%M' # Date + Heure des matchs, dans le fuseau MATCH_TIMEZONE
+MATCH_TIMEZONE = os.getenv("MATCH_TIMEZONE", "Europe/Paris") # indépendant du fuseau du serveur (UTC sur Heroku)
+MATCH_SCHEDULER_ENABLED = os.getenv("MATCH_SCHEDULER", "1") != "0"
+MATCH_SCHEDULER_MAX_SLEEP = float(os.getenv("MATCH_SCHEDULER_MAX_SLEEP", 30))
+SSE_HEARTBEAT_SECONDS = 25
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", 1.0))
+SSE_MAX_QUEUED_EVENTS = 100
+JSON_COMPRESS_MIN_BYTES = 1024
+
+# --- Stockage et journal des utilisateurs ---
+STORAGE_BACKEND = os.getenv("PRONOZONE_STORAGE", "csv").lower()
+USERS_JOURNAL_COMPACT_BYTES = int(os.getenv("USERS_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+USERS_JOURNAL_COMPACT_ROWS = int(os.getenv("USERS_JOURNAL_COMPACT_ROWS", 10000))
+USER_LOCK_STRIPES = int(os.getenv("USER_LOCK_STRIPES", 64))
+SUIVIS_JOURNAL_COMPACT_BYTES = int(os.getenv("SUIVIS_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+SUIVIS_JOURNAL_COMPACT_ROWS = int(os.getenv("SUIVIS_JOURNAL_COMPACT_ROWS", 10000))
+MATCHES_JOURNAL_COMPACT_BYTES = int(os.getenv("MATCHES_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+MATCHES_JOURNAL_COMPACT_ROWS = int(os.getenv("MATCHES_JOURNAL_COMPACT_ROWS", 10000))
+
+# --- Notifications Telegram ---
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+NOTIFICATIONS_OUTBOX_COMPACT_BYTES = int(os.getenv("NOTIFICATIONS_OUTBOX_COMPACT_BYTES", 1024 * 1024))
+
+# --- Métriques (Prometheus) ---
+# Exposées par /metrics au format texte Prometheus (METRICS_TOKEN exige alors
+# "Authorization: Bearer <token>"). Sous gunicorn, gunicorn.conf.py positionne
+# PROMETHEUS_MULTIPROC_DIR : chaque worker écrit ses valeurs dans ce dossier et /metrics
+# agrège tous les workers, y compris ceux déjà arrêtés pour les compteurs. Les tailles des
+# fichiers et le contenu des stores résidents sont lus au moment de la collecte.
+METRICS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_SECONDS = Histogram('pronozone_http_request_duration_seconds', "Durée de traitement des requêtes",
+                                 ['route', 'method'], buckets=LATENCY_BUCKETS)
+HTTP_REQUESTS = Counter('pronozone_http_requests_total', "Requêtes traitées", ['route', 'method', 'status'])
+STORAGE_SECONDS = Histogram('pronozone_storage_duration_seconds', "Durée des opérations de stockage",
+                            ['file', 'op'], buckets=LATENCY_BUCKETS)
+STORAGE_ROWS = Counter('pronozone_storage_rows_total', "Lignes lues ou écrites", ['file', 'op'])
+STORAGE_TABLE_ROWS = Gauge('pronozone_storage_table_rows', "Lignes du fichier à sa dernière lecture ou réécriture complète",
+                           ['file'], multiprocess_mode='mostrecent')
+CACHE_LOOKUPS = Counter('pronozone_cache_lookups_total', "Consultations des caches en mémoire (miss : rechargement)",
+                        ['cache', 'result'])
+USER_COMMIT_BATCH_RECORDS = Histogram('pronozone_user_commit_batch_records', "Enregistrements par écriture groupée du journal utilisateurs",
+                                      buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+USER_LOCK_HOLD_SECONDS = Histogram('pronozone_user_lock_hold_seconds', "Durée de détention des verrous utilisateurs en écriture",
+                                   ['op'], buckets=LATENCY_BUCKETS)
+BETS_PLACED = Counter('pronozone_bets_total', "Paris placés")
+PRONOS_UNLOCKED = Counter('pronozone_unlocks_total', "Pronostics débloqués")
+REWARDS_GRANTED = Counter('pronozone_rewards_total', "Récompenses accordées", ['reward'])
+REWARDS_REFUSED_EARLY = Counter('pronozone_rewards_refused_early_total', "Réclamations refusées en délai sans verrou ni stockage",
+                                ['reward'])
+SSE_SUBSCRIPTIONS = Gauge('pronozone_sse_subscriptions', "Flux SSE ouverts", multiprocess_mode='livesum')
+
+def observe_storage(op, file_path, started, rows=None, full=False):
+    """Enregistre la durée d'une opération de stockage commencée à `started` et le nombre de lignes concernées."""
+    file_name = os.path.basename(file_path)
+    STORAGE_SECONDS.labels(file_name, op).observe(time.perf_counter() - started)
+    if rows is not None:
+        STORAGE_ROWS.labels(file_name, op).inc(rows)
+        if full:
+            STORAGE_TABLE_ROWS.labels(file_name).set(rows)
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+class StorageCollector:
+    """Jauges calculées à la collecte : taille des fichiers de données, contenu des stores du worker qui répond."""
+
+    def describe(self):
+        return [] # évite une collecte à l'enregistrement, avant la création des stores
+
+    def collect(self):
+        file_bytes = GaugeMetricFamily('pronozone_storage_file_bytes', "Taille des fichiers de données", labels=['file'])
+        for file_path in (USERS_FILE, MATCHES_FILE, PARIS_FILE, SUIVIS_FILE, BILANS_FILE, USERS_JOURNAL_FILE, SUIVIS_JOURNAL_FILE,
+                          MATCHES_JOURNAL_FILE, SQLITE_DB_FILE):
+            try:
+                file_bytes.add_metric([os.path.basename(file_path)], os.path.getsize(file_path))
+            except OSError:
+                pass
+        for dir_path in (PARIS_PARTITIONS_DIR, SNAPSHOTS_DIR):
+            try:
+                with os.scandir(dir_path) as entries:
+                    file_bytes.add_metric([os.path.basename(dir_path)], sum(entry.stat().st_size for entry in entries))
+            except OSError:
+                pass
+        yield file_bytes
+        yield GaugeMetricFamily('pronozone_resident_users', "Utilisateurs dans le store résident", value=len(user_store.rows))
+        yield GaugeMetricFamily('pronozone_upcoming_matches', "Matchs à venir dans le catalogue", value=len(match_catalog.upcoming_sorted))
+
+storage_collector = StorageCollector()
+if not METRICS_MULTIPROC_DIR:
+    REGISTRY.register(storage_collector)
+
+def metrics_registry():
+    if not METRICS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(storage_collector)
+    return registry
+
+# --- Verrous de fichiers ---
+# Avec des workers gevent (voir Procfile), flock bloquant est un appel système que gevent
+# ne patche pas : attendre un verrou tenu par un autre worker figerait tout le worker,
+# flux SSE inactifs compris. lock_fd le prend alors en non bloquant et, tant qu'il est
+# tenu ailleurs, cède la main aux autres greenlets (time.sleep patché) avant de réessayer.
+# Hors gevent (workers synchrones, commandes CLI, telegram_notifier.py) : flock bloquant.
+# SQLiteStorage applique la même règle à l'attente du verrou d'écriture de la base.
+LOCK_RETRY_MIN_SECONDS = 0.0005
+LOCK_RETRY_MAX_SECONDS = 0.02
+
+def _gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('time')
+
+COOPERATIVE_LOCKS = _gevent_patched() # gunicorn.conf.py patche avant l'import de app
+# Fenêtre des écritures groupées (voir GroupCommit). Par défaut, elle n'est ouverte que sous
+# gevent : l'attente y cède la main aux autres greenlets, qui rejoignent le lot. Un worker
+# synchrone ne sert qu'une requête à la fois, et chaque mise à jour ne ferait qu'attendre.
+USER_GROUP_COMMIT_MS = float(os.getenv("USER_GROUP_COMMIT_MS", 2 if COOPERATIVE_LOCKS else 0))
+
+def lock_fd(fd, exclusive=True):
+    """flock(fd), exclusif ou partagé ; sous gevent, sans bloquer le worker. Sans fcntl (Windows) : sans effet."""
+    if not fcntl:
+        return
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if not COOPERATIVE_LOCKS:
+        fcntl.flock(fd, operation)
+        return
+    delay = LOCK_RETRY_MIN_SECONDS
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            time.sleep(delay)
+            delay = min(delay * 2, LOCK_RETRY_MAX_SECONDS)
+
+# --- Moteurs de stockage ---
+# Toute la persistance passe par l'objet `storage`, choisi par PRONOZONE_STORAGE :
+#   - "csv" (défaut) : les fichiers users.csv, matches.csv, paris.csv, suivis.csv ;
+#   - "sqlite" : une base SQLite embarquée (PRONOZONE_SQLITE_PATH) avec une table
+#     par fichier et des index sur les colonnes interrogées par utilisateur.
+# Les tables sont identifiées par le chemin du fichier CSV correspondant, et les
+# valeurs restent des chaînes dans les deux moteurs, comme dans les CSV.
+# Chaque moteur fournit aussi le journal des mutations utilisateurs (users_journal)
+# sur lequel s'appuie le UserStore : des enregistrements "create" ou "set" portant
+# les seuls champs modifiés, en valeurs absolues. Les suivis de pronostics ont le
+# leur (follows_journal), fait d'enregistrements "follow" et "unfollow", et les matchs
+# aussi (matches_journal), fait d'enregistrements "upsert" (match complet ou champs modifiés).
+# select_page sert les listes paginées d'un utilisateur (historique des paris) : index
+# SQLite, ou pour le CSV un CSVUserIndex par fichier qui ne relit que la page demandée.
+def apply_user_record(rows, record, header):
+    """Applique un enregistrement à rows ; renvoie les champs réellement modifiés (vide si aucun)."""
+    user_id = record.get('user_id')
+    fields = record.get('fields', {})
+    if record.get('op') == 'create':
+        if user_id not in rows:
+            rows[user_id] = {col: fields.get(col, '') for col in header}
+            return rows[user_id]
+    elif record.get('op') == 'set' and user_id in rows:
+        row = rows[user_id]
+        changed = {col: val for col, val in fields.items() if row.get(col) != val}
+        row.update(changed)
+        return changed
+    return {}
+
+def apply_follow_record(follows, record):
+    """Applique un enregistrement follow/unfollow à follows ({user_id: {MatchID: date_suivi}})."""
+    if record.get('op') == 'follow':
+        follows.setdefault(record['user_id'], {}).setdefault(record['MatchID'], record.get('date_suivi', ''))
+    elif record.get('op') == 'unfollow':
+        follows.get(record['user_id'], {}).pop(record['MatchID'], None)
+
+def apply_match_record(matches, record):
+    """Applique un enregistrement "upsert" à matches ({MatchID: ligne}) ; renvoie les champs modifiés (tous pour un nouveau match).
+
+    Une ligne modifiée est remplacée par une copie plutôt que modifiée en place : les listes déjà servies restent intactes.
+    """
+    match_id = record.get('MatchID')
+    fields = record.get('fields', {})
+    if record.get('op') != 'upsert' or not match_id or not fields:
+        return {}
+    row = matches.get(match_id)
+    if row is None:
+        row = matches[match_id] = {col: fields.get(col, '') for col in MATCHES_HEADER}
+        row['MatchID'] = match_id
+        return row
+    changed = {col: val for col, val in fields.items() if row.get(col) != val}
+    if changed:
+        matches[match_id] = {**row, **changed}
+    return changed
+
+# StatutPari est comparé normalisé, comme le faisait la lecture d'origine en .lower() :
+# casse, espaces et accents ignorés ("Gagné" vaut "gagne"). Le CSV normalise à la
+# comparaison (row_filter, CSVUserIndex) ; SQLite à l'écriture, par des triggers sur la
+# table paris qui couvrent aussi les écritures faites hors de l'application.
+BET_STATUS_ACCENTS = {'é': 'e', 'è': 'e', 'ê': 'e', 'É': 'e', 'È': 'e', 'Ê': 'e'}
+BET_STATUS_TRANSLATION = str.maketrans(BET_STATUS_ACCENTS)
+
+def bet_status(value):
+    return (value or '').strip().translate(BET_STATUS_TRANSLATION).lower()
+
+def bet_status_sql(expr):
+    """bet_status en SQL ; lower() de SQLite ne connaît que l'ASCII, d'où les accents remplacés d'abord."""
+    for accented, plain in BET_STATUS_ACCENTS.items():
+        expr = f"replace({expr}, '{accented}', '{plain}')"
+    return f"lower(trim({expr}))"
+
+NORMALIZED_COLUMNS = {'StatutPari': bet_status}
+
+def criteria_values(criteria):
+    """{colonne: valeurs acceptées}, normalisées pour les colonnes de NORMALIZED_COLUMNS."""
+    wanted = {}
+    for col, val in criteria.items():
+        vals = set(val) if isinstance(val, (list, tuple, set)) else {val}
+        normalize = NORMALIZED_COLUMNS.get(col)
+        wanted[col] = {normalize(v) for v in vals} if normalize else vals
+    return wanted
+
+def row_filter(criteria):
+    """Prédicat vrai pour les lignes dont chaque colonne de criteria vaut la valeur donnée (ou une de la liste)."""
+    wanted = [(col, NORMALIZED_COLUMNS.get(col), vals) for col, vals in criteria_values(criteria).items()]
+    return lambda row: all((normalize(row.get(col)) if normalize else row.get(col)) in vals for col, normalize, vals in wanted)
+
+def page_key(row, order_by, tie_by=None):
+    """Clé de tri d'une ligne pour select_page : (order_by,) ou (order_by, tie_by)."""
+    return (row.get(order_by, ''), row.get(tie_by, '')) if tie_by else (row.get(order_by, ''),)
+
+def page_bound(upper):
+    """Borne haute de select_page en clé : une valeur d'order_by, ou un curseur (valeur, départage)."""
+    return tuple(upper) if isinstance(upper, (list, tuple)) else (upper,)
+
+def _parse_csv_record(raw):
+    return next(csv.reader(raw.decode('utf-8').splitlines(True)), [])
+
+class CSVUserIndex:
+    """Index secondaire d'un CSV : par user_id, les (clé de tri, offset en octets, colonnes filtrables) triés.
+
+    La clé de tri est (order_by,) ou, avec tie_by, (order_by, tie_by) : les lignes de même
+    valeur d'order_by gardent ainsi un ordre total, et un curseur (valeur, départage) n'en saute aucune.
+    Le fichier n'est parcouru qu'une fois ; ensuite seuls les octets ajoutés depuis le
+    dernier appel sont lus. Une réécriture (changement d'inode, fichier raccourci ou
+    dernier enregistrement indexé modifié) provoque une reconstruction complète.
+    """
+
+    def __init__(self, order_by, filter_cols, tie_by=None):
+        self.order_by = order_by
+        self.tie_by = tie_by
+        self.filter_cols = list(filter_cols)
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key != 'lock'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _reset(self, signature):
+        self.signature = signature
+        self.entries = {}
+        self.fieldnames = None
+        self.scanned = 0
+        self.last_record = None # (offset, octets) du dernier enregistrement lu
+
+    @staticmethod
+    def _read_record(f):
+        """Lit un enregistrement complet (guillemets équilibrés, fin de ligne comprise) ; b'' s'il est incomplet."""
+        raw = b''
+        while True:
+            line = f.readline()
+            if not line:
+                return b''
+            raw += line
+            if line.endswith(b'\n') and raw.count(b'"') % 2 == 0:
+                return raw
+
+    def _last_record_intact(self, f):
+        if self.last_record is None:
+            return True
+        offset, raw = self.last_record
+        f.seek(offset)
+        return f.read(len(raw)) == raw
+
+    def refresh(self, f):
+        st = os.fstat(f.fileno())
+        signature = (st.st_dev, st.st_ino)
+        rebuild = signature != self.signature or st.st_size < self.scanned or not self._last_record_intact(f)
+        cache_lookup('paris_index', not rebuild)
+        if rebuild:
+            self._reset(signature)
+        if st.st_size == self.scanned:
+            return
+        f.seek(self.scanned)
+        if self.fieldnames is None:
+            raw = self._read_record(f)
+            if not raw:
+                return
+            self.fieldnames = _parse_csv_record(raw)
+            self.last_record = (0, raw)
+            self.scanned = f.tell()
+        key_pos = [self.fieldnames.index(col) for col in (self.order_by, self.tie_by) if col]
+        user_pos = self.fieldnames.index('user_id')
+        filter_pos = [(self.fieldnames.index(col), NORMALIZED_COLUMNS.get(col)) for col in self.filter_cols]
+        while True:
+            offset = self.scanned
+            raw = self._read_record(f) # une ligne en cours d'ajout par un autre worker sera relue au prochain appel
+            if not raw:
+                break
+            self.scanned = f.tell()
+            self.last_record = (offset, raw)
+            values = _parse_csv_record(raw)
+            if len(values) < len(self.fieldnames):
+                continue
+            # Les paris arrivent dans l'ordre chronologique : l'insertion se fait presque toujours en fin de liste.
+            bisect.insort(self.entries.setdefault(values[user_pos], []),
+                          (tuple(values[pos] for pos in key_pos), offset,
+                           tuple(normalize(values[pos]) if normalize else values[pos] for pos, normalize in filter_pos)))
+
+    def page(self, f, user_id, criteria, lower, upper, limit):
+        entries = self.entries.get(user_id, [])
+        lo = bisect.bisect_left(entries, ((lower,),)) if lower else 0
+        hi = bisect.bisect_left(entries, (page_bound(upper),)) if upper else len(entries)
+        wanted = [(self.filter_cols.index(col), vals) for col, vals in criteria.items()]
+        rows = []
+        for i in range(hi - 1, lo - 1, -1):
+            _, offset, filters = entries[i]
+            if all(filters[pos] in vals for pos, vals in wanted):
+                f.seek(offset)
+                rows.append(dict(zip(self.fieldnames, _parse_csv_record(self._read_record(f)))))
+                if limit and len(rows) >= limit:
+                    break
+        return rows
+
+class CSVStorage:
+    name = 'csv'
+
+    def __init__(self, users_file, users_journal_path, journal_compact_bytes, user_indexes=None):
+        self.users_file = users_file
+        self.users_journal_path = users_journal_path
+        self.journal_compact_bytes = journal_compact_bytes
+        self.user_indexes = user_indexes or {}
+
+    def initialize(self, file_path, header):
+        """Crée file_path avec son en-tête s'il n'existe pas ; renvoie True s'il a été créé."""
+        if not os.path.exists(file_path):
+            try:
+                with open(file_path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(header)
+                logging.info(f"Fichier {file_path} créé avec les en-têtes.")
+                return True
+            except IOError as e:
+                logging.error(f"Erreur lors de la création du fichier {file_path}: {e}")
+        return False
+
+    def read_rows(self, file_path):
+        data = []
+        try:
+            with open(file_path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    data.append(row)
+        except FileNotFoundError:
+            logging.warning(f"Le fichier {file_path} n'a pas été trouvé.")
+            if file_path in TABLE_HEADERS: self.initialize(file_path, TABLE_HEADERS[file_path])
+        except Exception as e:
+            logging.error(f"Erreur lors de la lecture de {file_path}: {e}")
+        return data
+
+    def stream_rows(self, file_path):
+        """Lignes du fichier une à une, sans tout charger (fichier absent : aucune)."""
+        try:
+            with open(file_path, 'r', newline='', encoding='utf-8') as f:
+                yield from csv.DictReader(f)
+        except FileNotFoundError:
+            return
+
+    @contextmanager
+    def file_lock(self, file_path, exclusive):
+        # Les ajouts en O_APPEND peuvent se faire en parallèle (verrou partagé) ; une
+        # réécriture complète les exclut (verrou exclusif) pour qu'aucune ligne ajoutée
+        # pendant la réécriture ne soit perdue au remplacement du fichier.
+        if not fcntl:
+            yield
+            return
+        fd = os.open(file_path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            lock_fd(fd, exclusive)
+            yield
+        finally:
+            os.close(fd)
+
+    def _write_file(self, file_path, data, header):
+        with open(file_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(data)
+
+    def write_rows(self, file_path, data, header):
+        if file_path in self.user_indexes: # l'index repère une réécriture au changement d'inode
+            self.replace_rows(file_path, data, header)
+            return
+        with self.file_lock(file_path, exclusive=True):
+            self._write_file(file_path, data, header)
+
+    def replace_rows(self, file_path, data, header):
+        with self.file_lock(file_path, exclusive=True):
+            tmp_path = file_path + '.tmp'
+            self._write_file(tmp_path, data, header)
+            os.replace(tmp_path, file_path)
+
+    def append_row(self, file_path, data_row_dict, header):
+        with self.file_lock(file_path, exclusive=False):
+            file_exists_non_empty = os.path.exists(file_path) and os.path.getsize(file_path) > 0
+            with open(file_path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+                if not file_exists_non_empty:
+                    writer.writeheader()
+                writer.writerow(data_row_dict)
+
+    def append_rows(self, file_path, rows, header):
+        with self.file_lock(file_path, exclusive=False):
+            file_exists_non_empty = os.path.exists(file_path) and os.path.getsize(file_path) > 0
+            with open(file_path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+                if not file_exists_non_empty:
+                    writer.writeheader()
+                writer.writerows(rows)
+
+    def delete_rows(self, file_path, criteria):
+        """Retire les lignes vérifiant criteria en une seule passe ; renvoie leur nombre."""
+        matches = row_filter(criteria)
+        deleted = 0
+        tmp_path = file_path + '.tmp'
+        with self.file_lock(file_path, exclusive=True):
+            with open(file_path, 'r', newline='', encoding='utf-8') as src, \
+                 open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+                reader = csv.DictReader(src)
+                writer = csv.DictWriter(dst, fieldnames=reader.fieldnames or [], extrasaction='ignore')
+                writer.writeheader()
+                for row in reader:
+                    if matches(row):
+                        deleted += 1
+                    else:
+                        writer.writerow(row)
+            if deleted:
+                os.replace(tmp_path, file_path)
+            else:
+                os.remove(tmp_path)
+        return deleted
+
+    def update_rows(self, file_path, header, transform, criteria):
+        """Réécrit le fichier en une seule passe ; transform reçoit chaque ligne vérifiant criteria."""
+        matches = row_filter(criteria)
+        updated = []
+        tmp_path = file_path + '.tmp'
+        with self.file_lock(file_path, exclusive=True):
+            with open(file_path, 'r', newline='', encoding='utf-8') as src, \
+                 open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+                writer = csv.DictWriter(dst, fieldnames=header, extrasaction='ignore')
+                writer.writeheader()
+                for row in csv.DictReader(src):
+                    if matches(row):
+                        new_row = transform(dict(row))
+                        if new_row is not None:
+                            row = new_row
+                            updated.append(new_row)
+                    writer.writerow(row)
+            if updated:
+                os.replace(tmp_path, file_path)
+            else:
+                os.remove(tmp_path)
+        return updated
+
+    def select_rows(self, file_path, criteria, order_by=None, descending=False):
+        matches = row_filter(criteria)
+        rows = [r for r in self.read_rows(file_path) if matches(r)]
+        if order_by:
+            rows.sort(key=lambda r: r.get(order_by, ''), reverse=descending)
+        return rows
+
+    def select_page(self, file_path, criteria, order_by, lower=None, upper=None, limit=None, tie_by=None):
+        index = self.user_indexes.get(file_path)
+        other_criteria = {col: val for col, val in criteria.items() if col != 'user_id'}
+        if index is None or index.order_by != order_by or tie_by not in (None, index.tie_by) \
+                or not isinstance(criteria.get('user_id'), str) or not set(other_criteria) <= set(index.filter_cols):
+            upper_key = page_bound(upper)
+            rows = [r for r in self.select_rows(file_path, criteria)
+                    if (not lower or r.get(order_by, '') >= lower) and (not upper or page_key(r, order_by, tie_by) < upper_key)]
+            rows.sort(key=lambda r: page_key(r, order_by, tie_by), reverse=True)
+            return rows[:limit] if limit else rows
+        wanted = criteria_values(other_criteria)
+        try:
+            with self.file_lock(file_path, exclusive=False), open(file_path, 'rb') as f, index.lock:
+                index.refresh(f)
+                return index.page(f, criteria['user_id'], wanted, lower, upper, limit)
+        except FileNotFoundError: # ou partition de paris archivée entre-temps
+            if file_path in TABLE_HEADERS:
+                self.initialize(file_path, TABLE_HEADERS[file_path])
+            return []
+
+    def refresh_index(self, file_path):
+        """Construit ou complète l'index de file_path ; renvoie True s'il a fallu lire le fichier."""
+        index = self.user_indexes[file_path]
+        try:
+            with self.file_lock(file_path, exclusive=False), open(file_path, 'rb') as f, index.lock:
+                before = (index.signature, index.scanned)
+                index.refresh(f)
+                return (index.signature, index.scanned) != before
+        except FileNotFoundError:
+            return False
+
+    def users_journal(self):
+        return FileJournal(self, self.users_file, self.users_journal_path, self.journal_compact_bytes)
+
+    def follows_journal(self):
+        return FileJournal(self, SUIVIS_FILE, SUIVIS_JOURNAL_FILE, SUIVIS_JOURNAL_COMPACT_BYTES)
+
+    def matches_journal(self):
+        return FileJournal(self, MATCHES_FILE, MATCHES_JOURNAL_FILE, MATCHES_JOURNAL_COMPACT_BYTES)
+
+
+class FileJournal:
+    """Fichier CSV (dernière compaction) + journal append-only d'enregistrements JSON (users.journal, suivis.journal, matches.journal)."""
+
+    def __init__(self, csv_storage, file_path, journal_path, compact_bytes):
+        self.csv_storage = csv_storage
+        self.file_path = file_path
+        self.journal_path = journal_path
+        self.compact_bytes = compact_bytes
+        self.csv_signature = None
+        self.journal_ino = None
+        self.journal_offset = 0
+
+    def _csv_signature(self):
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _journal_stat(self):
+        try:
+            return os.stat(self.journal_path)
+        except FileNotFoundError:
+            return None
+
+    def _read_records(self, truncate_torn_tail=False):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                self.journal_ino = os.fstat(f.fileno()).st_ino
+                f.seek(self.journal_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            self.journal_ino = None
+            self.journal_offset = 0
+            return []
+        complete_len = chunk.rfind(b'\n') + 1
+        records = []
+        for line in chunk[:complete_len].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                logging.warning(f"Enregistrement illisible ignoré dans {self.journal_path}: {e}")
+        self.journal_offset += complete_len
+        if truncate_torn_tail and complete_len < len(chunk):
+            logging.warning(f"Fin de {self.journal_path} incomplète ({len(chunk) - complete_len} octets), tronquée.")
+            os.truncate(self.journal_path, self.journal_offset)
+        return records
+
+    def base_key(self):
+        """Identifie le CSV de base (remplacé à chaque compaction), pour valider un instantané."""
+        return self._csv_signature()
+
+    def load(self, truncate_torn_tail=False, base_key=None):
+        """(lignes du CSV, enregistrements du journal) ; lignes à None si base_key désigne encore le CSV (instantané à jour)."""
+        # users.csv est remplacé avant le journal lors d'une compaction : si le csv lu est
+        # plus récent que le journal rejoué, le rejouer ne fait que réappliquer des valeurs
+        # déjà présentes, et le changement d'inode du journal déclenchera un nouveau load.
+        self.csv_signature = self._csv_signature()
+        rows = None if base_key is not None and base_key == self.csv_signature else self.csv_storage.read_rows(self.file_path)
+        self.journal_offset = 0
+        return rows, self._read_records(truncate_torn_tail)
+
+    def poll(self):
+        """Enregistrements ajoutés depuis le dernier appel, ou None s'il faut tout recharger."""
+        journal_st = self._journal_stat()
+        journal_ino = journal_st.st_ino if journal_st else None
+        if self._csv_signature() != self.csv_signature or journal_ino != self.journal_ino:
+            return None
+        if journal_st and journal_st.st_size > self.journal_offset:
+            return self._read_records()
+        return []
+
+    def append(self, records):
+        """Ajoute les enregistrements par un seul os.write en O_APPEND ; renvoie True si une compaction est due."""
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            return os.fstat(fd).st_size >= self.compact_bytes
+        finally:
+            os.close(fd)
+
+    def compaction_needed(self):
+        journal_st = self._journal_stat()
+        return journal_st is not None and journal_st.st_size >= self.compact_bytes
+
+    def compact(self, rows, header):
+        self.csv_storage.replace_rows(self.file_path, rows, header)
+        tmp_journal = self.journal_path + '.tmp'
+        open(tmp_journal, 'wb').close()
+        os.replace(tmp_journal, self.journal_path)
+        self.csv_signature = self._csv_signature()
+        self.journal_ino = self._journal_stat().st_ino
+        self.journal_offset = 0
+
+
+class SQLiteStorage:
+    # Sous gevent, SQLite n'attend pas le verrou d'écriture (busy timeout, qui bloquerait le
+    # worker) : BEGIN IMMEDIATE est retenté en cédant la main, jusqu'à BUSY_TIMEOUT secondes.
+    # En WAL, les lectures n'attendent pas les écritures.
+    name = 'sqlite'
+    BUSY_TIMEOUT = 30
+
+    def __init__(self, db_path, journal_compact_rows):
+        self.db_path = db_path
+        self.journal_compact_rows = journal_compact_rows
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or getattr(self.local, 'pid', None) != os.getpid(): # une connexion par thread et par worker
+            conn = sqlite3.connect(self.db_path, timeout=0 if COOPERATIVE_LOCKS else self.BUSY_TIMEOUT,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def _begin(self, conn):
+        if not COOPERATIVE_LOCKS:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        deadline = time.monotonic() + self.BUSY_TIMEOUT
+        delay = LOCK_RETRY_MIN_SECONDS
+        while True:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e) or time.monotonic() >= deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, LOCK_RETRY_MAX_SECONDS)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        self._begin(conn)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def table_of(file_path):
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    @staticmethod
+    def row_values(row, header):
+        return [str(row.get(col, '')) if row.get(col) is not None else '' for col in header]
+
+    def insert_sql(self, file_path, header, verb="INSERT"):
+        cols = ', '.join(f'"{col}"' for col in header)
+        marks = ', '.join('?' for _ in header)
+        return f'{verb} INTO "{self.table_of(file_path)}" ({cols}) VALUES ({marks})'
+
+    def initialize(self, file_path, header):
+        """Crée ou complète la table de file_path ; renvoie True si la table a été créée."""
+        table = self.table_of(file_path)
+        with self.transaction() as conn:
+            created = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None
+            cols = ', '.join(f'"{col}" TEXT NOT NULL DEFAULT \'\'' for col in header)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({cols})')
+            existing_cols = {r['name'] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+            for col in header:
+                if col not in existing_cols: # colonne ajoutée à l'en-tête depuis la création de la table
+                    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}" TEXT NOT NULL DEFAULT \'\'')
+            for index_sql in SQLITE_INDEXES.get(table, []):
+                conn.execute(index_sql)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            if table in SQLITE_JOURNALED_TABLES:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL)")
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '0')", (f"{table}_journal_floor",))
+            for col, normalize_sql in SQLITE_NORMALIZED_COLUMNS.get(table, {}).items():
+                normalized = normalize_sql(f'NEW."{col}"')
+                for event in ('INSERT', f'UPDATE OF "{col}"'):
+                    conn.execute(f'CREATE TRIGGER IF NOT EXISTS "{table}_normalize_{col}_{event.split()[0].lower()}" AFTER {event} ON "{table}" '
+                                 f'WHEN NEW."{col}" != {normalized} '
+                                 f'BEGIN UPDATE "{table}" SET "{col}" = {normalized} WHERE rowid = NEW.rowid; END')
+                # Lignes écrites avant les triggers : normalisées une seule fois.
+                if conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '1')", (f"normalized:{table}.{col}",)).rowcount:
+                    normalized = normalize_sql(f'"{col}"')
+                    conn.execute(f'UPDATE "{table}" SET "{col}" = {normalized} WHERE "{col}" != {normalized}')
+            if table in SQLITE_VERSIONED_TABLES:
+                # Compteur de version incrémenté à chaque écriture, y compris hors de l'application ;
+                # journaled:<table> compte celles passées par le journal.
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '0')", (f"version:{table}",))
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, '0')", (f"journaled:{table}",))
+                for event in ('INSERT', 'UPDATE', 'DELETE'):
+                    conn.execute(f'CREATE TRIGGER IF NOT EXISTS "{table}_version_{event.lower()}" AFTER {event} ON "{table}" '
+                                 f"BEGIN UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version:{table}'; END")
+            is_empty = conn.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone() is None
+        if is_empty and os.path.exists(file_path):
+            # Première utilisation : reprise des données du CSV existant (journaux compris).
+            csv_storage = CSVStorage(file_path, USERS_JOURNAL_FILE, 0)
+            rows = csv_storage.read_rows(file_path)
+            if table == 'users':
+                by_user_id = {}
+                for row in rows:
+                    by_user_id.setdefault(row['user_id'], row)
+                for record in csv_storage.users_journal().load()[1]:
+                    apply_user_record(by_user_id, record, header)
+                rows = list(by_user_id.values())
+            elif table == 'suivis':
+                follows = {}
+                for row in rows:
+                    apply_follow_record(follows, {'op': 'follow', **row})
+                for record in csv_storage.follows_journal().load()[1]:
+                    apply_follow_record(follows, record)
+                rows = [{'user_id': user_id, 'MatchID': match_id, 'date_suivi': date_suivi}
+                        for user_id, user_follows in follows.items() for match_id, date_suivi in user_follows.items()]
+            elif table == 'matches':
+                by_match_id = {}
+                for row in rows:
+                    by_match_id.setdefault(row['MatchID'], row)
+                for record in csv_storage.matches_journal().load()[1]:
+                    apply_match_record(by_match_id, record)
+                rows = list(by_match_id.values())
+            elif table == 'paris':
+                # Paris réglés déjà déplacés dans les partitions mensuelles du stockage CSV.
+                for month, archived in BetStore.list_partitions(PARIS_PARTITIONS_DIR):
+                    if not archived:
+                        rows.extend(csv_storage.read_rows(BetStore.partition_path(PARIS_PARTITIONS_DIR, month)))
+            if rows:
+                with self.transaction() as conn:
+                    conn.executemany(self.insert_sql(file_path, header, "INSERT OR IGNORE"), [self.row_values(r, header) for r in rows])
+                logging.info(f"{len(rows)} lignes importées de {file_path} dans la table SQLite {table}.")
+        return created
+
+    def read_rows(self, file_path):
+        return [dict(r) for r in self.connection().execute(f'SELECT * FROM "{self.table_of(file_path)}" ORDER BY rowid')]
+
+    def stream_rows(self, file_path):
+        for r in self.connection().execute(f'SELECT * FROM "{self.table_of(file_path)}" ORDER BY rowid'):
+            yield dict(r)
+
+    def write_rows(self, file_path, data, header):
+        with self.transaction() as conn:
+            conn.execute(f'DELETE FROM "{self.table_of(file_path)}"')
+            conn.executemany(self.insert_sql(file_path, header), [self.row_values(r, header) for r in data])
+
+    replace_rows = write_rows
+
+    def append_row(self, file_path, data_row_dict, header):
+        with self.transaction() as conn:
+            conn.execute(self.insert_sql(file_path, header), self.row_values(data_row_dict, header))
+
+    def append_rows(self, file_path, rows, header):
+        with self.transaction() as conn:
+            conn.executemany(self.insert_sql(file_path, header), [self.row_values(r, header) for r in rows])
+
+    def delete_rows(self, file_path, criteria):
+        where, params = self._where(criteria)
+        with self.transaction() as conn:
+            return conn.execute(f'DELETE FROM "{self.table_of(file_path)}"' + where, params).rowcount
+
+    @staticmethod
+    def _where(criteria):
+        clauses, params = [], []
+        for col, val in criteria.items():
+            if isinstance(val, (list, tuple, set)):
+                clauses.append(f'"{col}" IN ({", ".join("?" for _ in val)})')
+                params.extend(val)
+            else:
+                clauses.append(f'"{col}" = ?')
+                params.append(val)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def select_rows(self, file_path, criteria, order_by=None, descending=False):
+        where, params = self._where(criteria)
+        sql = f'SELECT * FROM "{self.table_of(file_path)}"' + where
+        if order_by:
+            sql += f' ORDER BY "{order_by}" {"DESC" if descending else "ASC"}'
+        return [dict(r) for r in self.connection().execute(sql, params)]
+
+    def select_page(self, file_path, criteria, order_by, lower=None, upper=None, limit=None, tie_by=None):
+        where, params = self._where(criteria)
+        bounds = []
+        if lower:
+            bounds.append(f'"{order_by}" >= ?')
+            params.append(lower)
+        if upper:
+            upper_key = page_bound(upper)
+            if tie_by and len(upper_key) > 1:
+                bounds.append(f'("{order_by}", "{tie_by}") < (?, ?)')
+                params.extend(upper_key[:2])
+            else:
+                bounds.append(f'"{order_by}" < ?')
+                params.append(upper_key[0])
+        if bounds:
+            where += (' AND ' if where else ' WHERE ') + ' AND '.join(bounds)
+        order = f'"{order_by}" DESC' + (f', "{tie_by}" DESC' if tie_by else '')
+        sql = f'SELECT * FROM "{self.table_of(file_path)}"{where} ORDER BY {order}'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(r) for r in self.connection().execute(sql, params)]
+
+    def update_rows(self, file_path, header, transform, criteria):
+        table = self.table_of(file_path)
+        where, params = self._where(criteria)
+        assignments = ', '.join(f'"{col}" = ?' for col in header)
+        updated = []
+        with self.transaction() as conn:
+            for r in conn.execute(f'SELECT rowid AS _rowid, * FROM "{table}"' + where, params).fetchall():
+                row = dict(r)
+                rowid = row.pop('_rowid')
+                new_row = transform(row)
+                if new_row is not None:
+                    conn.execute(f'UPDATE "{table}" SET {assignments} WHERE rowid = ?', [*self.row_values(new_row, header), rowid])
+                    updated.append(new_row)
+        return updated
+
+    def users_journal(self):
+        return SQLiteUserJournal(self, self.journal_compact_rows)
+
+    def follows_journal(self):
+        return SQLiteFollowJournal(self, SUIVIS_JOURNAL_COMPACT_ROWS)
+
+    def matches_journal(self):
+        return SQLiteMatchJournal(self, MATCHES_JOURNAL_COMPACT_ROWS)
+
+
+class SQLiteJournal(ABC):
+    """La table `table` est mise à jour en place ; `table`_journal ne sert qu'à propager les mutations aux autres workers.
+
+    Chaque sous-classe fixe `table` et définit apply, qui reporte un enregistrement dans la table.
+    """
+    table = None
+
+    def __init__(self, sqlite_storage, compact_rows):
+        self.sqlite_storage = sqlite_storage
+        self.compact_rows = compact_rows
+        self.last_seq = 0
+        self.external_writes = None
+
+    def _floor(self, conn):
+        return int(conn.execute("SELECT value FROM meta WHERE key = ?", (f"{self.table}_journal_floor",)).fetchone()[0])
+
+    def _external_writes(self, conn):
+        # Écritures de la table faites hors du journal : version:<table>, tenu par trigger,
+        # qui s'écarte de journaled:<table> (voir SQLITE_VERSIONED_TABLES).
+        return conn.execute("SELECT CAST(v.value AS INTEGER) - CAST(j.value AS INTEGER) FROM meta v, meta j "
+                            "WHERE v.key = ? AND j.key = ?", (f"version:{self.table}", f"journaled:{self.table}")).fetchone()[0]
+
+    def base_key(self, conn=None):
+        # La table vaut l'état au plancher du journal juste après une compaction ; l'inode
+        # distingue une base recréée (plancher revenu à 0), le compteur d'écritures externes
+        # une table modifiée sans passer par le journal (import, script, outil SQL).
+        conn = conn or self.sqlite_storage.connection()
+        return (os.stat(self.sqlite_storage.db_path).st_ino, self._floor(conn), self._external_writes(conn))
+
+    def load(self, truncate_torn_tail=False, base_key=None):
+        with self.sqlite_storage.transaction() as conn: # lecture cohérente de la table et du curseur
+            self.external_writes = self._external_writes(conn)
+            floor = self._floor(conn)
+            if base_key is not None and base_key == self.base_key(conn):
+                # Instantané à jour : seuls les enregistrements postérieurs au plancher sont relus.
+                records = []
+                self.last_seq = floor
+                for seq, record in conn.execute(f"SELECT seq, record FROM {self.table}_journal WHERE seq > ? ORDER BY seq", (floor,)):
+                    records.append(json.loads(record))
+                    self.last_seq = seq
+                return None, records
+            self.last_seq = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.table}_journal").fetchone()[0]
+            self.last_seq = max(self.last_seq, floor)
+            rows = [dict(r) for r in conn.execute(f'SELECT * FROM "{self.table}" ORDER BY rowid')]
+        return rows, []
+
+    def poll(self):
+        conn = self.sqlite_storage.connection()
+        if self._external_writes(conn) != self.external_writes: # table modifiée hors du journal
+            return None
+        if self._floor(conn) > self.last_seq: # des enregistrements non lus ont été compactés
+            return None
+        records = []
+        for seq, record in conn.execute(f"SELECT seq, record FROM {self.table}_journal WHERE seq > ? ORDER BY seq", (self.last_seq,)):
+            records.append(json.loads(record))
+            self.last_seq = seq
+        return records
+
+    @abstractmethod
+    def apply(self, conn, record):
+        """Reporte record dans la table ; renvoie le nombre de lignes écrites."""
+
+    def append(self, records):
+        with self.sqlite_storage.transaction() as conn:
+            written = 0
+            for record in records:
+                seq = conn.execute(f"INSERT INTO {self.table}_journal (record) VALUES (?)", (json.dumps(record, ensure_ascii=False),)).lastrowid
+                written += self.apply(conn, record)
+            # Autant que les triggers de version : ces écritures ne comptent pas comme externes.
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + ? WHERE key = ?", (written, f"journaled:{self.table}"))
+            floor = self._floor(conn)
+        return seq - floor >= self.compact_rows
+
+    def compaction_needed(self):
+        conn = self.sqlite_storage.connection()
+        max_seq = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.table}_journal").fetchone()[0]
+        return max_seq - self._floor(conn) >= self.compact_rows
+
+    def compact(self, rows, header):
+        # La table est déjà à jour : il suffit d'oublier les enregistrements déjà diffusés.
+        with self.sqlite_storage.transaction() as conn:
+            max_seq = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.table}_journal").fetchone()[0]
+            conn.execute(f"DELETE FROM {self.table}_journal WHERE seq <= ?", (max_seq,))
+            conn.execute("UPDATE meta SET value = ? WHERE key = ?", (str(max_seq), f"{self.table}_journal_floor"))
+        self.last_seq = max(self.last_seq, max_seq)
+
+
+class SQLiteUserJournal(SQLiteJournal):
+    table = 'users'
+
+    def apply(self, conn, record):
+        fields = record['fields']
+        if record['op'] == 'create':
+            return conn.execute(self.sqlite_storage.insert_sql(USERS_FILE, USERS_HEADER, "INSERT OR IGNORE"),
+                                self.sqlite_storage.row_values(fields, USERS_HEADER)).rowcount
+        assignments = ', '.join(f'"{col}" = ?' for col in fields)
+        return conn.execute(f'UPDATE users SET {assignments} WHERE user_id = ?', [*fields.values(), record['user_id']]).rowcount
+
+
+class SQLiteFollowJournal(SQLiteJournal):
+    table = 'suivis'
+
+    def apply(self, conn, record):
+        if record['op'] == 'follow':
+            return conn.execute('INSERT INTO suivis (user_id, MatchID, date_suivi) SELECT ?, ?, ? '
+                                'WHERE NOT EXISTS (SELECT 1 FROM suivis WHERE user_id = ? AND MatchID = ?)',
+                                (record['user_id'], record['MatchID'], record.get('date_suivi', ''),
+                                 record['user_id'], record['MatchID'])).rowcount
+        return conn.execute('DELETE FROM suivis WHERE user_id = ? AND MatchID = ?', (record['user_id'], record['MatchID'])).rowcount
+
+
+class SQLiteMatchJournal(SQLiteJournal):
+    table = 'matches'
+
+    def apply(self, conn, record):
+        fields = record['fields']
+        assignments = ', '.join(f'"{col}" = ?' for col in fields)
+        written = conn.execute(f'UPDATE matches SET {assignments} WHERE MatchID = ?', [*fields.values(), record['MatchID']]).rowcount
+        if not written:
+            conn.execute(self.sqlite_storage.insert_sql(MATCHES_FILE, MATCHES_HEADER),
+                         self.sqlite_storage.row_values({**fields, 'MatchID': record['MatchID']}, MATCHES_HEADER))
+            written = 1
+        return written
+
+
+TABLE_HEADERS = {USERS_FILE: USERS_HEADER, MATCHES_FILE: MATCHES_HEADER, PARIS_FILE: PARIS_HEADER, SUIVIS_FILE: SUIVIS_HEADER,
+                 BILANS_FILE: BILANS_HEADER}
+# Une écriture faite hors du journal (version:<table> qui s'écarte de journaled:<table>)
+# provoque un rechargement complet du store, comme un CSV remplacé.
+SQLITE_VERSIONED_TABLES = ['users', 'suivis', 'matches']
+SQLITE_JOURNALED_TABLES = ['users', 'suivis', 'matches']
+SQLITE_NORMALIZED_COLUMNS = {'paris': {'StatutPari': bet_status_sql}}
+SQLITE_INDEXES = {
+    'users': ['CREATE UNIQUE INDEX IF NOT EXISTS idx_users_user_id ON users (user_id)'],
+    'matches': ['CREATE INDEX IF NOT EXISTS idx_matches_match_id ON matches (MatchID)'],
+    'paris': ['CREATE INDEX IF NOT EXISTS idx_paris_user_statut_date_bet ON paris (user_id, StatutPari, DatePari, bet_id)',
+              'CREATE INDEX IF NOT EXISTS idx_paris_user_date_bet ON paris (user_id, DatePari, bet_id)',
+              # remplacés par les index ci-dessus, qui départagent les paris de même DatePari
+              'DROP INDEX IF EXISTS idx_paris_user_statut_date',
+              'DROP INDEX IF EXISTS idx_paris_user_date'],
+    'suivis': ['CREATE INDEX IF NOT EXISTS idx_suivis_user_match ON suivis (user_id, MatchID)'],
+    'bilans': ['CREATE INDEX IF NOT EXISTS idx_bilans_user_date ON bilans (user_id, date)'],
+}
+
+if STORAGE_BACKEND == 'sqlite':
+    storage = SQLiteStorage(SQLITE_DB_FILE, USERS_JOURNAL_COMPACT_ROWS)
+else:
+    if STORAGE_BACKEND != 'csv':
+        logging.warning(f"PRONOZONE_STORAGE={STORAGE_BACKEND} inconnu, utilisation du stockage CSV.")
+    storage = CSVStorage(USERS_FILE, USERS_JOURNAL_FILE, USERS_JOURNAL_COMPACT_BYTES,
+                         user_indexes={PARIS_FILE: CSVUserIndex('DatePari', ['StatutPari'], tie_by='bet_id'), BILANS_FILE: CSVUserIndex('date', [])})
+logging.info(f"Moteur de stockage : {storage.name}")
+
+# --- Instantanés binaires ---
+# Chaque store résident (utilisateurs, suivis, matchs) enregistre dans snapshots.d/ son
+# état déjà décodé, en pickle, à chaque compaction de son journal et au démarrage s'il
+# n'en avait pas d'utilisable. L'instantané porte la clé de la base du journal
+# (base_key : signature du CSV, ou plancher du journal SQLite et nombre d'écritures
+# faites hors du journal) : tant qu'elle n'a pas changé, le store charge l'instantané au
+# lieu de relire et décoder le CSV ou la table, puis rejoue le journal comme d'habitude. Les index par utilisateur des partitions de
+# paris (CSVUserIndex) sont enregistrés de la même façon, et ne relisent ensuite que les
+# octets ajoutés depuis. Avec gunicorn --preload (voir gunicorn.conf.py), tout est chargé
+# une seule fois dans le master et partagé en copy-on-write par les workers.
+# Un instantané illisible ou d'un autre format (schema) est ignoré : il ne fait que
+# remplacer une lecture du stockage, jamais une écriture.
+SNAPSHOT_LOG_SUFFIX = ", depuis l'instantané"
+
+class Snapshot:
+    MAGIC = b'PRONOZONE-SNAPSHOT-1\n'
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = tuple(schema)
+
+    def read(self, key):
+        """Données enregistrées pour la base key, ou None (absent, périmé ou illisible)."""
+        if key is None:
+            return None
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    return None
+                schema, snapshot_key, data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Instantané {self.path} illisible, ignoré : {e}")
+            return None
+        if schema != self.schema or snapshot_key != key:
+            return None
+        observe_storage('load_snapshot', self.path, started)
+        return data
+
+    def write(self, key, data):
+        if key is None:
+            return
+        started = time.perf_counter()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(self.MAGIC)
+                pickle.dump((self.schema, key, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Erreur lors de l'écriture de l'instantané {self.path}: {e}")
+            return
+        observe_storage('write_snapshot', self.path, started)
+
+# --- Fonctions Utilitaires pour les CSV ---
+# Conservées comme points d'entrée de la persistance ; elles délèguent au moteur `storage`.
+def initialize_csv(file_path, header):
+    return storage.initialize(file_path, header)
+
+def read_csv_as_list_of_dicts(file_path):
+    data = []
+    started = time.perf_counter()
+    try:
+        data = storage.read_rows(file_path)
+        observe_storage('read', file_path, started, len(data), full=True)
+    except Exception as e:
+        logging.error(f"Erreur lors de la lecture de {file_path}: {e}")
+    return data
+
+def write_csv_from_list_of_dicts(file_path, data, header):
+    started = time.perf_counter()
+    try:
+        storage.write_rows(file_path, data, header)
+        observe_storage('write', file_path, started, len(data), full=True)
+    except Exception as e:
+        logging.error(f"Erreur lors de l'écriture dans {file_path}: {e}")
+
+def append_to_csv(file_path, data_row_dict, header):
+    started = time.perf_counter()
+    try:
+        storage.append_row(file_path, data_row_dict, header)
+        observe_storage('append', file_path, started, 1)
+    except Exception as e:
+        logging.error(f"Erreur lors de l'ajout à {file_path}: {e}")
+
+def append_rows(file_path, rows, header):
+    started = time.perf_counter()
+    storage.append_rows(file_path, rows, header)
+    observe_storage('append', file_path, started, len(rows))
+
+def delete_rows(file_path, **criteria):
+    """Retire les lignes vérifiant criteria ; renvoie leur nombre."""
+    started = time.perf_counter()
+    deleted = storage.delete_rows(file_path, criteria)
+    observe_storage('delete', file_path, started, deleted)
+    return deleted
+
+def update_rows(file_path, header, transform, **criteria):
+    """Applique transform aux lignes vérifiant criteria en une seule passe ; renvoie les lignes modifiées."""
+    started = time.perf_counter()
+    updated = storage.update_rows(file_path, header, transform, criteria)
+    observe_storage('update', file_path, started, len(updated))
+    return updated
+
+def select_page(file_path, order_by, lower=None, upper=None, limit=None, tie_by=None, **criteria):
+    """Lignes vérifiant criteria avec lower <= order_by < upper, par order_by décroissant, au plus limit.
+
+    Avec tie_by, les lignes sont triées par (order_by, tie_by) décroissants et upper peut
+    être un curseur (valeur, départage) : seules les lignes de clé inférieure sont renvoyées.
+    """
+    started = time.perf_counter()
+    try:
+        rows = storage.select_page(file_path, criteria, order_by, lower=lower, upper=upper, limit=limit, tie_by=tie_by)
+        observe_storage('select_page', file_path, started, len(rows))
+        return rows
+    except Exception as e:
+        logging.error(f"Erreur lors de la lecture de {file_path}: {e}")
+        return []
+
+def select_rows(file_path, order_by=None, descending=False, **criteria):
+    """Lignes dont chaque colonne de `criteria` vaut la valeur donnée (ou une des valeurs d'une liste)."""
+    started = time.perf_counter()
+    try:
+        rows = storage.select_rows(file_path, criteria, order_by=order_by, descending=descending)
+        observe_storage('select', file_path, started, len(rows))
+        return rows
+    except Exception as e:
+        logging.error(f"Erreur lors de la lecture de {file_path}: {e}")
+        return []
+
+# --- Paris partitionnés par mois ---
+# paris.csv n'est que la partition chaude : les paris en cours, plus les paris réglés
+# jusqu'à ce que flush_settled (appelé après chaque règlement) les déplace dans la
+# partition du mois de leur DatePari, paris.d/AAAA-MM.csv, à laquelle on ne fait
+# qu'ajouter. Chaque partition a son CSVUserIndex, construit à sa première lecture :
+# une requête ne lit que la partition chaude et les mois couverts par son filtre de
+# dates, ou pour une page les mois les plus récents jusqu'à la remplir. Les paris en
+# cours ne lisent que la partition chaude. `flask archive-paris` compresse les mois
+# antérieurs aux PARIS_KEEP_MONTHS derniers en paris.d/AAAA-MM.csv.gz : paris triés par
+# user_id, un membre gzip par bloc d'utilisateurs (~PARIS_ARCHIVE_BLOCK_BYTES), dont
+# AAAA-MM.csv.gz.idx donne le premier user_id et la position. Une requête ne décompresse
+# que le bloc de son utilisateur ; le fichier reste lisible en entier par gzip/zcat.
+# Avec SQLite, la table paris (index user_id, DatePari, bet_id) tient lieu de partitions
+# vivantes : seuls l'archivage et la lecture des archives s'y ajoutent.
+# Un pari présent dans deux partitions (arrêt pendant un déplacement) n'est renvoyé
+# qu'une fois, et le déplacement suivant termine le travail.
+PARIS_PARTITION_PATTERN = re.compile(r'(\d{4}-\d{2})\.csv(\.gz)?')
+
+def _month_key(months):
+    return f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+def _next_month(month):
+    return _month_key(int(month[:4]) * 12 + int(month[5:7]))
+
+def _bet_key(row):
+    return page_key(row, 'DatePari', 'bet_id')
+
+def _dedupe_bets(rows, limit=None):
+    """rows triés par (DatePari, bet_id) décroissants, sans doublon de bet_id, au plus limit."""
+    rows.sort(key=_bet_key, reverse=True)
+    seen, unique = set(), []
+    for row in rows:
+        if row.get('bet_id') not in seen:
+            seen.add(row.get('bet_id'))
+            unique.append(row)
+    return unique[:limit] if limit else unique
+
+class BetStore:
+    def __init__(self, hot_path, partitions_dir, partitioned, snapshot=None):
+        self.hot_path = hot_path
+        self.partitions_dir = partitions_dir
+        self.partitioned = partitioned
+        self.snapshot = snapshot
+        self.archive_blocks = {} # chemin -> (signature du .gz, (premiers user_id, [(offset, longueur)]) ou None)
+
+    @staticmethod
+    def partition_path(partitions_dir, month, archived=False):
+        return os.path.join(partitions_dir, f"{month}.csv" + ('.gz' if archived else ''))
+
+    @staticmethod
+    def list_partitions(partitions_dir):
+        """[(mois, archivée)] du plus récent au plus ancien."""
+        try:
+            names = os.listdir(partitions_dir)
+        except FileNotFoundError:
+            return []
+        partitions = []
+        for name in names:
+            match = PARIS_PARTITION_PATTERN.fullmatch(name)
+            if match:
+                partitions.append((match.group(1), bool(match.group(2))))
+        return sorted(partitions, reverse=True)
+
+    def _partitions(self, lower=None, upper=None):
+        return [(month, archived) for month, archived in self.list_partitions(self.partitions_dir)
+                if (not lower or _next_month(month) > lower[:10]) and (not upper or (f"{month}-01",) < page_bound(upper))]
+
+    def _index_key(self):
+        # Les index se valident eux-mêmes (inode, dernier enregistrement lu) : la clé ne sert
+        # qu'à écarter d'un coup ceux d'une partition chaude réécrite.
+        try:
+            st = os.stat(self.hot_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def _live_paths(self):
+        return [self.hot_path] + [self.partition_path(self.partitions_dir, month)
+                                  for month, archived in self._partitions() if not archived]
+
+    def streams(self):
+        """Tous les paris en flux : ([partitions vivantes, dans le désordre], [archives, triées par user_id])."""
+        live = [storage.stream_rows(path) for path in self._live_paths()]
+        archives = [self._stream_archive(month) for month, archived in self._partitions() if archived]
+        return live, archives
+
+    def _stream_archive(self, month):
+        try:
+            with gzip.open(self.partition_path(self.partitions_dir, month, archived=True), 'rt', encoding='utf-8', newline='') as text:
+                yield from csv.DictReader(text)
+        except FileNotFoundError:
+            return
+
+    def load_indexes(self):
+        """Reprend les index par utilisateur de l'instantané, les complète, et réenregistre l'instantané s'il a fallu lire."""
+        if not isinstance(storage, CSVStorage) or self.snapshot is None:
+            return
+        base_dir = os.path.dirname(self.hot_path)
+        for name, index in (self.snapshot.read(self._index_key()) or {}).items():
+            storage.user_indexes[os.path.join(base_dir, name)] = index
+        read = False
+        for path in self._live_paths():
+            storage.user_indexes.setdefault(path, CSVUserIndex('DatePari', ['StatutPari'], tie_by='bet_id'))
+            read = storage.refresh_index(path) or read
+        if read:
+            self.save_indexes()
+
+    def save_indexes(self):
+        if not isinstance(storage, CSVStorage) or self.snapshot is None:
+            return
+        base_dir = os.path.dirname(self.hot_path)
+        key = self._index_key() # avant les refresh : une réécriture entretemps rendra l'instantané périmé
+        indexes = {}
+        for path in self._live_paths():
+            storage.user_indexes.setdefault(path, CSVUserIndex('DatePari', ['StatutPari'], tie_by='bet_id'))
+            storage.refresh_index(path)
+            indexes[os.path.relpath(path, base_dir)] = storage.user_indexes[path]
+        self.snapshot.write(key, indexes)
+
+    def _blocks(self, path, st):
+        signature = (st.st_ino, st.st_size)
+        cached = self.archive_blocks.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        blocks = None
+        try:
+            with open(path + '.idx', 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('size') == st.st_size: # sinon .idx d'une version précédente de l'archive
+                blocks = ([first for first, _, _ in index['blocks']], [(offset, length) for _, offset, length in index['blocks']])
+        except (OSError, ValueError, KeyError):
+            pass
+        self.archive_blocks[path] = (signature, blocks)
+        return blocks
+
+    def _read_archive(self, month, user_id=None):
+        """Paris archivés du mois, ou seulement ceux de user_id (un seul bloc lu si l'index est à jour)."""
+        path = self.partition_path(self.partitions_dir, month, archived=True)
+        started = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                blocks = self._blocks(path, os.fstat(f.fileno()))
+                if user_id is None or blocks is None:
+                    with io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding='utf-8', newline='') as text:
+                        rows = list(csv.DictReader(text))
+                else:
+                    i = bisect.bisect_right(blocks[0], user_id) - 1
+                    if i < 0:
+                        return []
+                    offset, length = blocks[1][i]
+                    f.seek(offset)
+                    text = gzip.decompress(f.read(length)).decode('utf-8')
+                    rows = [r for r in csv.DictReader(io.StringIO(text, newline=''), fieldnames=PARIS_HEADER) if r['user_id'] == user_id]
+        except FileNotFoundError:
+            return []
+        observe_storage('read_archive', path, started, len(rows))
+        return rows
+
+    def _select(self, month, archived, user_id=None, lower=None, upper=None, limit=None, **criteria):
+        if archived:
+            if user_id is not None:
+                criteria['user_id'] = user_id
+            matches = row_filter(criteria)
+            rows = [r for r in self._read_archive(month, user_id) if matches(r)
+                    and (not lower or r.get('DatePari', '') >= lower) and (not upper or _bet_key(r) < page_bound(upper))]
+            return _dedupe_bets(rows, limit)
+        path = self.partition_path(self.partitions_dir, month)
+        if user_id is None:
+            return select_rows(path, **criteria)
+        if isinstance(storage, CSVStorage):
+            storage.user_indexes.setdefault(path, CSVUserIndex('DatePari', ['StatutPari'], tie_by='bet_id'))
+        return select_page(path, 'DatePari', lower=lower, upper=upper, limit=limit, tie_by='bet_id', user_id=user_id, **criteria)
+
+    def add(self, bet):
+        append_to_csv(self.hot_path, bet, PARIS_HEADER)
+
+    def page(self, user_id, lower=None, upper=None, limit=None, **criteria):
+        """Comme select_page(PARIS_FILE, 'DatePari', tie_by='bet_id', ...), en ne lisant que les partitions utiles."""
+        rows = select_page(self.hot_path, 'DatePari', lower=lower, upper=upper, limit=limit, tie_by='bet_id', user_id=user_id, **criteria)
+        if criteria.get('StatutPari') == 'en_cours': # seuls les paris réglés quittent la partition chaude
+            return rows
+        for month, archived in self._partitions(lower, upper):
+            if limit and len(rows) >= limit and _bet_key(rows[limit - 1]) >= (_next_month(month),):
+                break # page déjà remplie par des paris plus récents que ce mois
+            rows = _dedupe_bets(rows + self._select(month, archived, user_id, lower, upper, limit, **criteria), limit)
+        return rows
+
+    def settled_bets(self):
+        """Tous les paris réglés, partitions et archives comprises."""
+        rows = select_rows(self.hot_path, StatutPari=list(BET_OUTCOMES))
+        for month, archived in self._partitions():
+            rows.extend(self._select(month, archived, StatutPari=list(BET_OUTCOMES)))
+        return _dedupe_bets(rows)
+
+    def flush_settled(self):
+        """Déplace les paris réglés de la partition chaude vers leur mois ; appelé sous settlement_lock()."""
+        if not self.partitioned:
+            return 0
+        by_month = defaultdict(list)
+        for bet in select_rows(self.hot_path, StatutPari=list(BET_OUTCOMES)):
+            month = bet.get('DatePari', '')[:7]
+            if re.fullmatch(r'\d{4}-\d{2}', month): # sans date lisible, le pari reste dans la partition chaude
+                by_month[month].append(bet)
+        if not by_month:
+            return 0
+        os.makedirs(self.partitions_dir, exist_ok=True)
+        moved = []
+        for month, bets in by_month.items():
+            path = self.partition_path(self.partitions_dir, month)
+            known = {row['bet_id'] for row in select_rows(path)} if os.path.exists(path) else set()
+            append_rows(path, [bet for bet in bets if bet['bet_id'] not in known], PARIS_HEADER)
+            moved.extend(bet['bet_id'] for bet in bets)
+        delete_rows(self.hot_path, bet_id=moved, StatutPari=list(BET_OUTCOMES))
+        self.save_indexes() # partition chaude réécrite
+        logging.info(f"{len(moved)} paris réglés déplacés dans {len(by_month)} partitions mensuelles.")
+        return len(moved)
+
+    def _write_archive(self, month, rows):
+        path = self.partition_path(self.partitions_dir, month, archived=True)
+        rows = _dedupe_bets(self._read_archive(month) + rows)
+        rows.sort(key=lambda r: (r.get('user_id', ''), r.get('DatePari', '')))
+        buffer = io.StringIO(newline='')
+        writer = csv.DictWriter(buffer, fieldnames=PARIS_HEADER, extrasaction='ignore')
+        writer.writeheader()
+        ends = [buffer.tell()] # ends[i] : fin de l'en-tête (i = 0) ou de la ligne i - 1
+        for row in rows:
+            writer.writerow(row)
+            ends.append(buffer.tell())
+        text = buffer.getvalue()
+        index = []
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(text[:ends[0]].encode('utf-8')))
+            block_start = 0
+            for i in range(1, len(rows) + 1):
+                # Un bloc se ferme entre deux utilisateurs, une fois assez gros (ou en fin de fichier).
+                if i < len(rows) and (rows[i]['user_id'] == rows[i - 1]['user_id']
+                                      or ends[i] - ends[block_start] < PARIS_ARCHIVE_BLOCK_BYTES):
+                    continue
+                data = gzip.compress(text[ends[block_start]:ends[i]].encode('utf-8'))
+                index.append([rows[block_start]['user_id'], f.tell(), len(data)])
+                f.write(data)
+                block_start = i
+            size = f.tell()
+        with open(tmp_path + '.idx', 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'blocks': index}, f)
+        # Archive d'abord : un lecteur qui verrait le nouveau .gz avec l'ancien .idx lirait tout le fichier.
+        os.replace(tmp_path, path)
+        os.replace(tmp_path + '.idx', path + '.idx')
+        return len(rows)
+
+    def archive(self, keep_months):
+        """Compresse les paris réglés des mois antérieurs aux keep_months derniers ; renvoie {mois: paris archivés}.
+
+        Appelé sous settlement_lock().
+        """
+        today = date.today()
+        cutoff = _month_key(today.year * 12 + today.month - 1 - keep_months)
+        self.flush_settled()
+        archived = {}
+        if self.partitioned:
+            for month, is_archive in self._partitions(upper=f"{cutoff}-01"):
+                if is_archive:
+                    continue
+                path = self.partition_path(self.partitions_dir, month)
+                archived[month] = self._write_archive(month, select_rows(path))
+                with storage.file_lock(path, exclusive=True):
+                    os.remove(path)
+                os.remove(path + '.lock')
+                storage.user_indexes.pop(path, None)
+            if archived:
+                self.save_indexes()
+        else:
+            by_month = defaultdict(list)
+            for bet in select_page(self.hot_path, 'DatePari', upper=f"{cutoff}-01", StatutPari=list(BET_OUTCOMES)):
+                if re.fullmatch(r'\d{4}-\d{2}', bet.get('DatePari', '')[:7]):
+                    by_month[bet['DatePari'][:7]].append(bet)
+            if by_month:
+                os.makedirs(self.partitions_dir, exist_ok=True)
+            for month, bets in by_month.items():
+                archived[month] = self._write_archive(month, bets)
+                bet_ids = [bet['bet_id'] for bet in bets]
+                for i in range(0, len(bet_ids), 500):
+                    delete_rows(self.hot_path, bet_id=bet_ids[i:i + 500], StatutPari=list(BET_OUTCOMES))
+        logging.info(f"Archivage des paris antérieurs à {cutoff} : {len(archived)} mois compressés.")
+        return archived
+
+bet_store = BetStore(PARIS_FILE, PARIS_PARTITIONS_DIR, partitioned=storage.name == 'csv',
+                     snapshot=Snapshot(os.path.join(SNAPSHOTS_DIR, 'paris.snap'), [*PARIS_HEADER, 'clé:DatePari,bet_id']))
+
+initialize_csv(USERS_FILE, USERS_HEADER)
+initialize_csv(MATCHES_FILE, MATCHES_HEADER)
+initialize_csv(PARIS_FILE, PARIS_HEADER)
+initialize_csv(SUIVIS_FILE, SUIVIS_HEADER)
+
+# --- Catalogue des matchs ---
+# Chaque worker garde les matchs en mémoire (par MatchID, à venir triés par date et heure,
+# à venir par date), alimentés comme le store utilisateurs par le journal des matchs.
+# Une ingestion du flux (flask ingest-matches) ou un règlement n'y ajoute que les
+# insertions et les changements, que chaque worker applique sans relire matches.csv :
+# seuls l'index des matchs à venir et les réponses encodées des dates touchées sont
+# refaits. Remplacer matches.csv à la main reste possible (rechargement complet, comme
+# pour une table SQLite modifiée hors de l'application), à condition de supprimer
+# matches.journal en même temps.
+# Les listes renvoyées sont partagées : les appelants ne doivent pas les modifier.
+# Les abonnés (add_listener) reçoivent matches_changed(rows) avec les matchs nouveaux
+# ou dont le Statut a changé, à chaque changement suivant le premier chargement.
+# Le coup d'envoi (Date + Heure) des matchs à venir est indexé : un match commencé
+# n'accepte plus de paris, même avant que le MatchScheduler ne le passe "en cours".
+def is_upcoming(row):
+    return row.get('Statut', '').lower() == MATCH_STATUS_UPCOMING
+
+def _match_timezone():
+    try:
+        return ZoneInfo(MATCH_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning(f"MATCH_TIMEZONE={MATCH_TIMEZONE} inconnu, utilisation du fuseau du serveur.")
+        return datetime.now().astimezone().tzinfo
+
+MATCH_TZ = _match_timezone()
+
+def match_kickoff(row):
+    """Coup d'envoi du match (datetime avec fuseau, MATCH_TZ), ou None si Date ou Heure est illisible.
+
+    À comparer à un instant avec fuseau, par exemple datetime.now(timezone.utc).
+    """
+    try:
+        return datetime.strptime(f"{row.get('Date', '')} {row.get('Heure', '')}", MATCH_TIME_FORMAT).replace(tzinfo=MATCH_TZ)
+    except ValueError:
+        return None
+
+def diff_match_feed(by_id, feed_rows):
+    """Compare un lot du flux aux matchs connus ; renvoie (enregistrements "upsert" à journaliser, change set).
+
+    Un MatchID inconnu est inséré tel quel. D'un match connu, seuls la Cote et le Statut sont
+    repris, et un match terminé ne change plus. Les lignes sans MatchID, en double dans le lot
+    ou dont la Cote n'est pas un nombre sont rejetées.
+    """
+    records, seen = [], set()
+    change_set = {'inserted': [], 'cote_changes': [], 'statut_changes': [], 'unchanged': 0, 'rejected': []}
+    for feed_row in feed_rows:
+        feed_row = {col: str(val if val is not None else '').strip() for col, val in feed_row.items() if col}
+        match_id = feed_row.get('MatchID', '')
+        error = None
+        if not match_id:
+            error = "MatchID manquant"
+        elif match_id in seen:
+            error = "MatchID en double dans le lot"
+        elif feed_row.get('Cote'):
+            try:
+                float(feed_row['Cote'])
+            except ValueError:
+                error = f"Cote invalide : {feed_row['Cote']}"
+        if error:
+            change_set['rejected'].append({'MatchID': match_id, 'error': error})
+            continue
+        seen.add(match_id)
+
+        current = by_id.get(match_id)
+        if current is None:
+            records.append({'op': 'upsert', 'MatchID': match_id, 'fields': {col: feed_row.get(col, '') for col in MATCHES_HEADER}})
+            change_set['inserted'].append(match_id)
+            continue
+        fields = {}
+        if feed_row.get('Cote') and feed_row['Cote'] != current.get('Cote'):
+            fields['Cote'] = feed_row['Cote']
+        if feed_row.get('Statut') and feed_row['Statut'].lower() != current.get('Statut', '').lower():
+            fields['Statut'] = feed_row['Statut']
+        if not fields:
+            change_set['unchanged'] += 1
+            continue
+        if current.get('Statut', '').lower() == MATCH_STATUS_FINISHED:
+            change_set['rejected'].append({'MatchID': match_id, 'error': "Match déjà terminé"})
+            continue
+        for col, value in fields.items():
+            change_set['cote_changes' if col == 'Cote' else 'statut_changes'].append(
+                {'MatchID': match_id, 'old': current.get(col, ''), 'new': value})
+        records.append({'op': 'upsert', 'MatchID': match_id, 'fields': fields})
+    return records, change_set
+
+class MatchCatalog:
+    def __init__(self, journal, lock_path, snapshot=None):
+        self.journal = journal
+        self.lock_path = lock_path
+        self.snapshot = snapshot
+        self.snapshot_used = False
+        self.loaded = False
+        self.by_id = {}
+        self.upcoming_by_id = {}
+        self.upcoming_sorted = []
+        self.upcoming_by_date = {}
+        self.kickoff_of = {}
+        self.encoded = {}
+        self.listeners = []
+        self.compaction_due = False
+        self.lock = threading.RLock()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _notify(self, changed_rows):
+        if changed_rows:
+            for listener in self.listeners:
+                listener.matches_changed(changed_rows)
+
+    def _index_upcoming(self):
+        upcoming_sorted = sorted(self.upcoming_by_id.values(), key=lambda x: (x.get('Date', 'zzzz'), x.get('Heure', '99:99')))
+        upcoming_by_date = defaultdict(list)
+        kickoff_of = {}
+        for row in upcoming_sorted:
+            upcoming_by_date[row.get('Date')].append(row)
+            kickoff = match_kickoff(row)
+            if kickoff is not None:
+                kickoff_of[row['MatchID']] = kickoff
+        self.upcoming_sorted, self.upcoming_by_date, self.kickoff_of = upcoming_sorted, dict(upcoming_by_date), kickoff_of
+
+    def _load(self, truncate_torn_tail=False):
+        started = time.perf_counter()
+        base_key = self.journal.base_key() if self.snapshot else None
+        by_id = self.snapshot.read(base_key) if self.snapshot else None
+        base_rows, records = self.journal.load(truncate_torn_tail, base_key if by_id is not None else None)
+        self.snapshot_used = base_rows is None
+        if base_rows is not None:
+            by_id = {}
+            for row in base_rows:
+                by_id.setdefault(row.get('MatchID'), row)
+        for record in records:
+            apply_match_record(by_id, record)
+        changed = [row for match_id, row in by_id.items()
+                   if match_id not in self.by_id or self.by_id[match_id].get('Statut') != row.get('Statut')] if self.loaded else []
+        self.by_id = by_id
+        self.upcoming_by_id = {match_id: row for match_id, row in by_id.items() if is_upcoming(row)}
+        self._index_upcoming()
+        self.encoded = {}
+        self.loaded = True
+        observe_storage('load_store', MATCHES_FILE, started, len(by_id), full=True)
+        self._notify(changed)
+        logging.info(f"Catalogue des matchs chargé ({len(by_id)} matchs, {len(self.upcoming_sorted)} à venir, "
+                     f"{len(records)} enregistrements rejoués{SNAPSHOT_LOG_SUFFIX if self.snapshot_used else ''}).")
+
+    def _save_snapshot(self):
+        # Appelé dans _writing() : les lignes ne sont jamais modifiées en place (apply_match_record).
+        if self.snapshot:
+            self.snapshot.write(self.journal.base_key(), self.by_id)
+
+    def recover(self):
+        """Premier chargement, au démarrage (dans le master avec --preload)."""
+        with self._writing():
+            self._load(truncate_torn_tail=True)
+            if not self.snapshot_used:
+                self._save_snapshot()
+
+    def _apply(self, records):
+        changed_rows, touched_dates = [], set()
+        for record in records:
+            previous = self.by_id.get(record.get('MatchID'))
+            changed_fields = apply_match_record(self.by_id, record)
+            if not changed_fields:
+                continue
+            row = self.by_id[record['MatchID']]
+            if previous is None or 'Statut' in changed_fields:
+                changed_rows.append(row)
+            if previous is not None and is_upcoming(previous):
+                touched_dates.add(previous.get('Date'))
+            if is_upcoming(row):
+                self.upcoming_by_id[row['MatchID']] = row
+                touched_dates.add(row.get('Date'))
+            else:
+                self.upcoming_by_id.pop(row['MatchID'], None)
+        if touched_dates:
+            self._index_upcoming()
+            # Seules les réponses de la liste complète et des dates touchées sont à réencoder.
+            self.encoded = {key: variants for key, variants in self.encoded.items()
+                            if key[0] is not None and key[0] not in touched_dates}
+        self._notify(changed_rows)
+
+    def refresh(self):
+        with self.lock:
+            records = self.journal.poll() if self.loaded else None
+            cache_lookup('matches', records is not None)
+            if records is None:
+                self._load()
+            elif records:
+                self._apply(records)
+
+    @contextmanager
+    def _writing(self):
+        # Ingestions, règlements et compactions se succèdent, y compris entre process.
+        with open(self.lock_path, 'a') as f:
+            lock_fd(f.fileno())
+            with self.lock:
+                yield
+
+    def _append(self, records):
+        # Appelé dans _writing(), le catalogue à jour.
+        if records:
+            self.compaction_due = self.journal.append(records) or self.compaction_due
+            self._apply(records)
+
+    def ingest(self, feed_rows):
+        """Applique un lot du flux de matchs (voir diff_match_feed) en un seul ajout au journal ; renvoie le change set."""
+        with self._writing():
+            self.refresh()
+            records, change_set = diff_match_feed(self.by_id, feed_rows)
+            self._append(records)
+        self.compact_if_due()
+        logging.info(f"Flux des matchs intégré : {len(change_set['inserted'])} nouveaux, {len(change_set['cote_changes'])} cotes "
+                     f"et {len(change_set['statut_changes'])} statuts modifiés, {len(change_set['rejected'])} lignes rejetées.")
+        return change_set
+
+    def update_fields(self, changes):
+        """changes : {MatchID: champs modifiés}, écrits en un seul ajout au journal ; les MatchID inconnus sont ignorés."""
+        with self._writing():
+            self.refresh()
+            self._append([{'op': 'upsert', 'MatchID': match_id, 'fields': fields}
+                          for match_id, fields in changes.items() if match_id in self.by_id and fields])
+        self.compact_if_due()
+
+    def compact_if_due(self):
+        if not self.compaction_due:
+            return
+        with self._writing():
+            self.compaction_due = False
+            if not self.journal.compaction_needed():
+                return # déjà compacté par un autre worker
+            self.refresh()
+            self.journal.compact(list(self.by_id.values()), MATCHES_HEADER)
+            self._save_snapshot()
+            logging.info(f"Journal des matchs compacté ({len(self.by_id)} matchs).")
+
+    def get(self, match_id):
+        self.refresh()
+        return self.by_id.get(match_id)
+
+    def get_upcoming(self, match_id):
+        self.refresh()
+        return self.upcoming_by_id.get(match_id)
+
+    def betting_open(self, match_id, now):
+        """Vrai si match_id est à venir et pas encore commencé (coup d'envoi illisible : ouvert)."""
+        self.refresh()
+        if match_id not in self.upcoming_by_id:
+            return False
+        kickoff = self.kickoff_of.get(match_id)
+        return kickoff is None or now < kickoff
+
+    def due_kickoffs(self, now):
+        """MatchID encore à venir dont le coup d'envoi est passé."""
+        self.refresh()
+        return [match_id for match_id, kickoff in self.kickoff_of.items() if kickoff <= now]
+
+    def start_due(self, now, status):
+        """Passe au Statut status les matchs commencés encore à venir (relus sous le verrou : un
+        match terminé entre-temps n'est pas touché) ; renvoie leur nombre."""
+        with self._writing():
+            due = self.due_kickoffs(now)
+            if due:
+                self._append([{'op': 'upsert', 'MatchID': match_id, 'fields': {'Statut': status}} for match_id in due])
+        self.compact_if_due()
+        return len(due)
+
+    def next_kickoff(self, now):
+        self.refresh()
+        return min((kickoff for kickoff in self.kickoff_of.values() if kickoff > now), default=None)
+
+    def prewarm(self):
+        """Encode d'avance la liste des matchs à venir et celle de chaque date, dans les deux formats."""
+        self.refresh()
+        for date_str in [None, *self.upcoming_by_date]:
+            for columnar in (False, True):
+                self.encoded_upcoming(date_str, columnar)
+
+    def upcoming(self, date_str=None):
+        self.refresh()
+        if date_str:
+            return self.upcoming_by_date.get(date_str, [])
+        return self.upcoming_sorted
+
+    def encoded_upcoming(self, date_str=None, columnar=False):
+        """upcoming() encodé en JSON, gardé jusqu'au prochain changement de ces matchs : {None: corps, encodage: corps compressé}."""
+        self.refresh()
+        key = (date_str, columnar)
+        variants = self.encoded.get(key)
+        cache_lookup('matches_json', variants is not None)
+        if variants is None:
+            rows = self.upcoming(date_str)
+            variants = self.encoded[key] = {None: encode_json(to_columns(rows, MATCHES_HEADER) if columnar else rows)}
+        return variants
+
+match_catalog = MatchCatalog(storage.matches_journal(), MATCHES_LOCK_FILE,
+                             snapshot=Snapshot(os.path.join(SNAPSHOTS_DIR, 'matches.snap'), MATCHES_HEADER))
+
+# --- Coups d'envoi ---
+# Une thread par worker, démarrée à sa première requête, dort jusqu'au prochain coup
+# d'envoi (au plus MATCH_SCHEDULER_MAX_SLEEP secondes, pour voir les nouveaux matchs).
+# Un seul worker est élu par un flock non bloquant sur matches.scheduler.lock, gardé
+# jusqu'à sa sortie (un autre prend alors le relais) : lui seul passe les matchs commencés
+# "en cours" par le journal des matchs, ce qui les retire des listes et ferme les paris
+# dans tous les workers. Chaque worker réencode ensuite ses listes (prewarm), pour que la
+# première requête après un coup d'envoi ne paie pas l'encodage. MATCH_SCHEDULER=0 la
+# désactive (les paris restent fermés au coup d'envoi par betting_open).
+class MatchScheduler:
+    FOLLOWER_RETRY_SECONDS = 1.0
+
+    def __init__(self, catalog, lock_path, max_sleep):
+        self.catalog = catalog
+        self.lock_path = lock_path
+        self.max_sleep = max_sleep
+        self.pid = None
+        self.lock_file = None
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.lock_file = None # verrou du process parent, le cas échéant : pas le nôtre
+        threading.Thread(target=self._run, name='match-scheduler', daemon=True).start()
+
+    def _is_leader(self):
+        if self.lock_file is not None or not fcntl:
+            return True
+        f = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self.lock_file = f
+        logging.info(f"Worker {os.getpid()} élu pour passer les matchs commencés en cours.")
+        return True
+
+    def tick(self, now):
+        """Passe en cours les matchs commencés (worker élu) et réencode les listes ; renvoie le délai avant le prochain tick."""
+        due = self.catalog.due_kickoffs(now)
+        leader = bool(due) and self._is_leader()
+        if leader:
+            started = self.catalog.start_due(now, MATCH_STATUS_LIVE)
+            logging.info(f"{started} matchs passés {MATCH_STATUS_LIVE} au coup d'envoi.")
+        self.catalog.prewarm()
+        if due and not leader:
+            return self.FOLLOWER_RETRY_SECONDS # le worker élu va les passer en cours : réencoder après
+        next_kickoff = self.catalog.next_kickoff(now)
+        if next_kickoff is None:
+            return self.max_sleep
+        return min(self.max_sleep, (next_kickoff - now).total_seconds())
+
+    def _run(self):
+        while True:
+            try:
+                delay = self.tick(datetime.now(timezone.utc))
+            except Exception as e:
+                logging.error(f"Erreur lors du traitement des coups d'envoi: {e}")
+                delay = self.max_sleep
+            time.sleep(max(delay, 0.05))
+
+match_scheduler = MatchScheduler(match_catalog, MATCH_SCHEDULER_LOCK_FILE, MATCH_SCHEDULER_MAX_SLEEP)
+
+@app.before_request
+def start_match_scheduler():
+    if MATCH_SCHEDULER_ENABLED:
+        match_scheduler.ensure_started()
+
+# --- Utilisateur typé ---
+# Les utilisateurs résidents sont des UserRecord : un objet à __slots__ par utilisateur,
+# dont les champs numériques sont convertis une seule fois (au chargement ou en rejouant
+# le journal), les drapeaux "*_claimed" des tâches réunis dans l'entier claimed_flags
+# (un bit par tâche) et unlocked_pronos gardé en tuple de MatchID partagés entre
+# utilisateurs (sys.intern), dans l'ordre de déblocage. Chaque colonne de users.csv a son
+# décodeur et son encodeur (USER_CODECS). Les routes le manipulent comme un dict
+# (user_p['xp'] += ..., user_p.get(...)) sur une copie, où unlocked_pronos devient un
+# OrderedSet (ensemble qui garde cet ordre) ; get_user et update_user_atomic renvoient
+# de telles copies, pas des dict. to_dict() le
+# prépare pour le JSON, sans les totaux internes du bilan (exposés par /api/bilan) ni
+# gains_verses (voir Règlement des paris), to_row() le ramène aux chaînes du stockage.
+def _user_decoder(convert, default):
+    def decode(value):
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            if value is not None and value != '':
+                logging.warning(f"Donnée utilisateur invalide ignorée : {value!r}")
+            return default
+    return decode
+
+class OrderedSet(dict):
+    """Ensemble qui garde l'ordre d'insertion (clés d'un dict)."""
+    __slots__ = ()
+
+    def __init__(self, items=()):
+        super().__init__(dict.fromkeys(items))
+
+    def add(self, item):
+        self[item] = None
+
+    def discard(self, item):
+        self.pop(item, None)
+
+    def __ior__(self, items):
+        for item in items:
+            self[item] = None
+        return self
+
+    def __repr__(self):
+        return f"OrderedSet({list(self)!r})"
+
+def _decode_unlocked_pronos(value):
+    if not value:
+        return ()
+    match_ids = OrderedSet(map(sys.intern, value.split(',') if isinstance(value, str) else value))
+    match_ids.discard('')
+    return tuple(match_ids)
+
+USER_CLAIMED_BITS = {cfg['claimed_field']: 1 << i for i, cfg in enumerate(TASKS_CONFIG.values())}
+USER_CODECS = {col: (lambda value: '' if value is None else str(value),) * 2 for col in USERS_HEADER}
+for _col in ['xp', 'pronocoins_balance', 'bet_count'] + BILAN_TOTAL_FIELDS:
+    USER_CODECS[_col] = (_user_decoder(int, 0), str)
+USER_CODECS['level'] = (_user_decoder(int, 1), str)
+# None : ligne antérieure à la colonne, jusqu'à backfill_gains_verses() au démarrage.
+USER_CODECS['gains_verses'] = (_user_decoder(int, None), lambda value: '' if value is None else str(value))
+USER_CODECS['last_ad_reward_timestamp'] = (_user_decoder(float, 0.0), lambda value: str(float(value)))
+USER_CODECS['unlocked_pronos'] = (_decode_unlocked_pronos, lambda value: ','.join(filter(None, value)))
+for _col in USER_CLAIMED_BITS:
+    USER_CODECS[_col] = (lambda value: str(value).lower() == 'true', lambda value: 'true' if value else 'false')
+USER_SLOT_COLUMNS = tuple(col for col in USERS_HEADER if col not in USER_CLAIMED_BITS)
+# Colonnes texte décodées sans appel de fonction : ce sont déjà des chaînes dans le stockage.
+_USER_TEXT_COLUMNS = [col for col in USER_SLOT_COLUMNS if USER_CODECS[col] == USER_CODECS['user_id']]
+_USER_SLOT_DECODERS = [(col, USER_CODECS[col][0]) for col in USER_SLOT_COLUMNS if col not in _USER_TEXT_COLUMNS]
+USER_PUBLIC_COLUMNS = [col for col in USERS_HEADER if col not in BILAN_TOTAL_FIELDS and col != 'gains_verses']
+
+class UserRecord:
+    __slots__ = USER_SLOT_COLUMNS + ('claimed_flags',)
+
+    @classmethod
+    def from_row(cls, row):
+        """Décode une ligne du stockage (chaînes ; les valeurs déjà typées sont acceptées)."""
+        record = cls.__new__(cls)
+        for col in _USER_TEXT_COLUMNS:
+            setattr(record, col, row.get(col) or '')
+        for col, decode in _USER_SLOT_DECODERS:
+            setattr(record, col, decode(row.get(col)))
+        claimed_flags = 0
+        for col, bit in USER_CLAIMED_BITS.items():
+            if str(row.get(col)).lower() == 'true':
+                claimed_flags |= bit
+        record.claimed_flags = claimed_flags
+        return record
+
+    def __getitem__(self, col):
+        bit = USER_CLAIMED_BITS.get(col)
+        if bit is not None:
+            return bool(self.claimed_flags & bit)
+        try:
+            return getattr(self, col)
+        except AttributeError:
+            raise KeyError(col) from None
+
+    def __setitem__(self, col, value):
+        bit = USER_CLAIMED_BITS.get(col)
+        if bit is not None:
+            self.claimed_flags = self.claimed_flags | bit if value else self.claimed_flags & ~bit
+        elif col in USER_CODECS:
+            setattr(self, col, value)
+        else:
+            raise KeyError(col)
+
+    def __contains__(self, col):
+        return col in USER_CODECS
+
+    def get(self, col, default=None):
+        return self[col] if col in USER_CODECS else default
+
+    def update(self, fields):
+        for col, value in fields.items():
+            self[col] = value
+
+    def copy(self):
+        """Copie modifiable (unlocked_pronos en OrderedSet), pour une mise à jour ou une réponse."""
+        record = UserRecord.__new__(UserRecord)
+        for slot in UserRecord.__slots__:
+            setattr(record, slot, getattr(self, slot))
+        record.unlocked_pronos = OrderedSet(self.unlocked_pronos)
+        return record
+
+    def apply_fields(self, fields):
+        """Applique des champs encodés (enregistrement "set" du journal) ; renvoie ceux qui ont changé."""
+        changed = {}
+        for col, value in fields.items():
+            codec = USER_CODECS.get(col)
+            if codec is None:
+                continue
+            decoded = codec[0](value)
+            if self[col] != decoded:
+                self[col] = decoded
+                changed[col] = value
+        return changed
+
+    def changed_fields(self, updated):
+        """Champs de `updated` qui diffèrent de self, encodés pour le journal (self et updated sont des copies)."""
+        changed = {col: USER_CODECS[col][1](getattr(updated, col)) for col in USER_SLOT_COLUMNS
+                   if getattr(self, col) != getattr(updated, col)}
+        flipped = self.claimed_flags ^ updated.claimed_flags
+        if flipped:
+            for col, bit in USER_CLAIMED_BITS.items():
+                if flipped & bit:
+                    changed[col] = USER_CODECS[col][1](updated.claimed_flags & bit)
+        return changed
+
+    def __getstate__(self):
+        # Tuple dans l'ordre des slots : instantanés plus petits et plus rapides à relire qu'un dict par utilisateur.
+        return tuple(getattr(self, slot) for slot in UserRecord.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(UserRecord.__slots__, state):
+            setattr(self, slot, value)
+
+    def to_row(self):
+        return {col: USER_CODECS[col][1](self[col]) for col in USERS_HEADER}
+
+    def to_dict(self):
+        user = {col: self[col] for col in USER_PUBLIC_COLUMNS}
+        user['unlocked_pronos'] = list(self.unlocked_pronos)
+        return user
+
+    @staticmethod
+    def apply_record(records, record):
+        """apply_user_record pour un dict {user_id: UserRecord}."""
+        user_id = record.get('user_id')
+        fields = record.get('fields', {})
+        if record.get('op') == 'create':
+            if user_id not in records:
+                records[user_id] = UserRecord.from_row(fields)
+                return USERS_HEADER
+        elif record.get('op') == 'set' and user_id in records:
+            return records[user_id].apply_fields(fields)
+        return {}
+
+# --- Verrous inter-process par utilisateur ---
+# Les workers gunicorn partagent le dossier users.locks/ : chaque user_id est haché
+# sur une bande (stripe) et chaque bande est un fichier verrouillé via flock.
+# Deux mutations ne se sérialisent donc que si leurs user_id tombent sur la même
+# bande ; seule la compaction du journal prend toutes les bandes.
+# flock (et non lockf) car ses verrous appartiennent au descripteur ouvert et non
+# au process : lockf verrait de faux interblocages entre threads de deux workers.
+class StripedFileLock:
+    def __init__(self, lock_dir, stripes):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self.thread_locks = [threading.Lock() for _ in range(stripes)]
+        self.fds = {}
+        self.fds_pid = None
+
+    def _fd(self, stripe):
+        if self.fds_pid != os.getpid(): # descripteurs propres à chaque worker après un fork
+            self.fds = {}
+            self.fds_pid = os.getpid()
+        if stripe not in self.fds:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            self.fds[stripe] = os.open(os.path.join(self.lock_dir, f"stripe_{stripe:03d}"), os.O_RDWR | os.O_CREAT, 0o644)
+        return self.fds[stripe]
+
+    def stripe_of(self, key):
+        return zlib.crc32(key.encode('utf-8')) % self.stripes
+
+    def _acquire(self, stripe):
+        self.thread_locks[stripe].acquire()
+        if fcntl:
+            try:
+                lock_fd(self._fd(stripe))
+            except OSError:
+                self.thread_locks[stripe].release()
+                raise
+
+    def _release(self, stripe):
+        try:
+            if fcntl:
+                fcntl.flock(self._fd(stripe), fcntl.LOCK_UN)
+        finally:
+            self.thread_locks[stripe].release()
+
+    @contextmanager
+    def hold(self, key):
+        stripe = self.stripe_of(key)
+        self._acquire(stripe)
+        try:
+            yield
+        finally:
+            self._release(stripe)
+
+    @contextmanager
+    def hold_many(self, keys):
+        acquired = []
+        try:
+            for stripe in sorted({self.stripe_of(key) for key in keys}): # toujours dans l'ordre croissant
+                self._acquire(stripe)
+                acquired.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(acquired):
+                self._release(stripe)
+
+    @contextmanager
+    def hold_all(self):
+        acquired = []
+        try:
+            for stripe in range(self.stripes):
+                self._acquire(stripe)
+                acquired.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(acquired):
+                self._release(stripe)
+
+# --- Écritures groupées (group commit) ---
+# Les mises à jour concurrentes d'un worker (greenlets gevent ou threads) sont regroupées :
+# la première d'un lot attend `window` secondes que d'autres s'y ajoutent, puis exécute
+# tout le lot par run(items) ; les suivantes attendent ce résultat. La fenêtre s'écoule
+# sans aucun verrou tenu : c'est run qui prend les verrous, le temps du seul lot. run
+# renvoie un (résultat, erreur) par élément : chaque appelant reçoit le sien, donc ses
+# propres erreurs métier ("Solde insuffisant"...), et tous reçoivent l'erreur qui
+# interrompt run elle-même (écriture échouée...).
+class GroupCommit:
+    def __init__(self, run, window):
+        self.run = run
+        self.window = window
+        self.lock = threading.Lock()
+        self.open_batch = None
+
+    def submit(self, item):
+        """Exécute item avec ceux des autres appelants de la fenêtre ; renvoie son résultat ou lève son erreur."""
+        if self.window <= 0:
+            outcome = self.run([item])[0]
+        else:
+            outcome = self._submit_batched(item)
+        result, error = outcome
+        if error is not None:
+            raise error
+        return result
+
+    def _submit_batched(self, item):
+        with self.lock:
+            batch = self.open_batch
+            is_leader = batch is None
+            if is_leader:
+                batch = self.open_batch = {'items': [], 'done': threading.Event(), 'outcomes': None, 'error': None}
+            index = len(batch['items'])
+            batch['items'].append(item)
+        if is_leader:
+            try:
+                time.sleep(self.window)
+                with self.lock:
+                    self.open_batch = None # les appelants suivants ouvrent le lot suivant
+                batch['outcomes'] = self.run(batch['items'])
+            except BaseException as e: # y compris l'arrêt du greenlet meneur : personne ne reste bloqué
+                batch['error'] = e
+                raise
+            finally:
+                with self.lock:
+                    if self.open_batch is batch:
+                        self.open_batch = None
+                batch['done'].set()
+        else:
+            batch['done'].wait()
+        if batch['error'] is not None:
+            if isinstance(batch['error'], Exception):
+                raise batch['error']
+            raise RuntimeError("Lot d'écritures interrompu") from batch['error']
+        return batch['outcomes'][index]
+
+# --- Store utilisateurs résident ---
+# Chaque worker garde les utilisateurs indexés par user_id en mémoire. Chaque
+# mutation est un enregistrement (op "create" ou "set" avec les seuls champs
+# modifiés, en valeurs absolues) ajouté au journal du moteur de stockage :
+# users.journal pour le CSV, la table users_journal pour SQLite. Avant de servir,
+# le worker relit les enregistrements ajoutés par les autres workers ; les rejouer
+# plusieurs fois (y compris les siens) donne toujours le même état. Au démarrage le
+# journal est rejoué, et une fois trop gros il est compacté par le moteur. Les mises à
+# jour unitaires (update) passent par un GroupCommit (USER_GROUP_COMMIT_MS : 2 ms sous
+# gevent, 0 sinon ou pour le désactiver) : un lot prend les bandes de ses utilisateurs et
+# s'écrit en un seul ajout.
+#
+# Les utilisateurs y sont des UserRecord ; get_row en renvoie une copie modifiable.
+# Le décodage de la base est évité par un instantané (voir Instantanés binaires).
+#
+# Des index secondaires (classement...) s'abonnent via add_listener : rebuild(rows)
+# après un chargement complet, user_changed(user_id, row, changed_fields) après
+# chaque enregistrement qui modifie réellement un utilisateur, local ou non.
+class UserStore:
+    def __init__(self, header, journal, lock_dir, lock_stripes, group_commit_window=0, snapshot=None):
+        self.header = header
+        self.journal = journal
+        self.snapshot = snapshot
+        self.snapshot_used = False
+        self.locks = StripedFileLock(lock_dir, lock_stripes)
+        self.group_commit = GroupCommit(self._run_updates, group_commit_window)
+        self.rows = {}
+        self.listeners = []
+        self.compaction_due = False
+        self.lock = threading.RLock()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _apply(self, record):
+        changed_fields = UserRecord.apply_record(self.rows, record)
+        if changed_fields:
+            for listener in self.listeners:
+                listener.user_changed(record['user_id'], self.rows[record['user_id']], changed_fields)
+
+    def _load(self, truncate_torn_tail=False):
+        started = time.perf_counter()
+        base_key = self.journal.base_key() if self.snapshot else None
+        rows = self.snapshot.read(base_key) if self.snapshot else None
+        base_rows, records = self.journal.load(truncate_torn_tail, base_key if rows is not None else None)
+        self.snapshot_used = base_rows is None
+        if base_rows is not None:
+            rows = {}
+            for row in base_rows:
+                if row['user_id'] not in rows:
+                    rows[row['user_id']] = UserRecord.from_row(row)
+        for record in records:
+            UserRecord.apply_record(rows, record)
+        self.rows = rows
+        for listener in self.listeners:
+            listener.rebuild(rows)
+        observe_storage('load_store', USERS_FILE, started, len(rows), full=True)
+        logging.info(f"Store utilisateurs chargé ({len(rows)} utilisateurs, {len(records)} enregistrements rejoués"
+                     f"{SNAPSHOT_LOG_SUFFIX if self.snapshot_used else ''}).")
+
+    def _save_snapshot(self):
+        # Sous toutes les bandes : la base ne peut pas changer. Enregistré après un rejeu, l'état
+        # inclut des enregistrements que le chargement suivant rejouera : sans effet, ils sont idempotents.
+        if self.snapshot:
+            self.snapshot.write(self.journal.base_key(), self.rows)
+
+    def recover(self):
+        with self.locks.hold_all(), self.lock:
+            self._load(truncate_torn_tail=True)
+            if not self.snapshot_used:
+                self._save_snapshot()
+
+    def sync(self):
+        with self.lock:
+            records = self.journal.poll()
+            cache_lookup('users', records is not None)
+            if records is None:
+                self._load()
+                return
+            for record in records:
+                self._apply(record)
+
+    def get_row(self, user_id):
+        with self.lock:
+            self.sync()
+            row = self.rows.get(user_id)
+            return row.copy() if row is not None else None
+
+    def all_rows(self):
+        with self.lock:
+            self.sync()
+            return list(self.rows.values())
+
+    def _write_records(self, records):
+        # Appelé avec les bandes des user_id concernés verrouillées.
+        started = time.perf_counter()
+        compaction_due = self.journal.append(records)
+        observe_storage('journal_append', USERS_FILE, started, len(records))
+        USER_COMMIT_BATCH_RECORDS.observe(len(records))
+        with self.lock:
+            for record in records:
+                self._apply(record)
+            self.compaction_due = self.compaction_due or compaction_due
+
+    def add_row(self, row):
+        with self.locks.hold(row['user_id']):
+            with self.lock:
+                self.sync()
+                if row['user_id'] in self.rows:
+                    return
+            fields = {col: str(row.get(col, '')) for col in self.header}
+            self._write_records([{'op': 'create', 'user_id': row['user_id'], 'fields': fields}])
+        self.compact_if_due()
+
+    def update_fields(self, changes):
+        """changes : {user_id: champs modifiés}, écrits en un seul ajout au journal (bandes tenues)."""
+        records = [{'op': 'set', 'user_id': user_id, 'fields': fields} for user_id, fields in changes.items() if fields]
+        if records:
+            self._write_records(records)
+
+    def update(self, user_id, update_fn):
+        """update_fn(copie) sous la bande de user_id, groupé avec les mises à jour concurrentes du worker."""
+        return self.group_commit.submit((user_id, update_fn))
+
+    def _run_updates(self, updates):
+        # Lot de (user_id, update_fn) : dans l'ordre d'arrivée, chacun part de l'état laissé par le
+        # précédent sur le même utilisateur ; une erreur n'annule que sa propre mise à jour.
+        outcomes = []
+        with self.locks.hold_many([user_id for user_id, _ in updates]), USER_LOCK_HOLD_SECONDS.labels('update_user_atomic').time():
+            originals, current = {}, {}
+            for user_id, update_fn in updates:
+                if user_id not in current:
+                    originals[user_id] = current[user_id] = self.get_row(user_id)
+                if current[user_id] is None:
+                    outcomes.append((None, None))
+                    continue
+                try:
+                    current[user_id] = update_fn(current[user_id].copy())
+                except Exception as e:
+                    outcomes.append((None, e))
+                    continue
+                outcomes.append((current[user_id], None))
+            self.update_fields({user_id: originals[user_id].changed_fields(row)
+                                for user_id, row in current.items() if row is not None})
+        return outcomes
+
+    def compact_if_due(self):
+        # Jamais appelé en tenant une bande : hold_all les prend toutes.
+        if not self.compaction_due:
+            return
+        with self.locks.hold_all(), self.lock:
+            self.compaction_due = False
+            if not self.journal.compaction_needed():
+                return # déjà compacté par un autre worker
+            self.sync()
+            self.journal.compact([row.to_row() for row in self.rows.values()], self.header)
+            self._save_snapshot()
+            logging.info(f"Journal utilisateurs compacté ({len(self.rows)} utilisateurs).")
+
+# --- Classement ---
+# Clés (-pronocoins_balance, -level, -xp, user_id) gardées triées : une mutation coûte
+# une recherche dichotomique plus un déplacement mémoire, le rang une recherche.
+class Leaderboard:
+    RANKING_FIELDS = {'pronocoins_balance', 'level', 'xp'}
+
+    def __init__(self):
+        self.keys = []
+        self.key_of = {}
+
+    @staticmethod
+    def _key(user_id, row):
+        try:
+            return (-int(row.get('pronocoins_balance', 0)), -int(row.get('level', 1)), -int(row.get('xp', 0)), user_id)
+        except ValueError:
+            logging.warning(f"Donnée utilisateur invalide pour le classement: {row}")
+            return None
+
+    def rebuild(self, rows):
+        self.key_of = {}
+        for user_id, row in rows.items():
+            key = self._key(user_id, row)
+            if key is not None:
+                self.key_of[user_id] = key
+        self.keys = sorted(self.key_of.values())
+
+    def user_changed(self, user_id, row, changed_fields):
+        if user_id in self.key_of and not self.RANKING_FIELDS.intersection(changed_fields):
+            return
+        old_key = self.key_of.pop(user_id, None)
+        if old_key is not None:
+            del self.keys[bisect.bisect_left(self.keys, old_key)]
+        key = self._key(user_id, row)
+        if key is not None:
+            self.key_of[user_id] = key
+            bisect.insort(self.keys, key)
+
+    def rank_of(self, user_id):
+        key = self.key_of.get(user_id)
+        return bisect.bisect_left(self.keys, key) + 1 if key is not None else None
+
+    def page(self, offset, limit):
+        return [key[3] for key in self.keys[offset:offset + limit]]
+
+    def __len__(self):
+        return len(self.keys)
+
+# --- Délais des récompenses ---
+# Date de la dernière récompense quotidienne et timestamp de la dernière récompense
+# publicitaire de chaque utilisateur, tenus à jour par le store utilisateurs comme le
+# classement, y compris pour les réclamations faites par les autres workers. Les routes
+# refusent une réclamation encore en délai sans verrou ni lecture du stockage. Ces
+# valeurs ne font qu'avancer : un worker en retard laisse simplement la requête passer
+# au contrôle complet de update_user_atomic.
+class RewardCooldowns:
+    FIELDS = {'last_daily_reward_date', 'last_ad_reward_timestamp'}
+
+    def __init__(self):
+        self.daily = {}
+        self.ad = {}
+
+    @staticmethod
+    def _store(values, user_id, value):
+        if value:
+            values[user_id] = value
+        else:
+            values.pop(user_id, None)
+
+    def rebuild(self, rows):
+        daily, ad = {}, {}
+        for user_id, row in rows.items():
+            self._store(daily, user_id, row['last_daily_reward_date'])
+            self._store(ad, user_id, row['last_ad_reward_timestamp'])
+        self.daily, self.ad = daily, ad
+
+    def user_changed(self, user_id, row, changed_fields):
+        if not self.FIELDS.isdisjoint(changed_fields):
+            self._store(self.daily, user_id, row['last_daily_reward_date'])
+            self._store(self.ad, user_id, row['last_ad_reward_timestamp'])
+
+    def daily_claimed(self, user_id, today_str):
+        return self.daily.get(user_id) == today_str
+
+    def ad_remaining(self, user_id, now):
+        """Secondes avant la prochaine récompense publicitaire (<= 0 : disponible, ou utilisateur inconnu)."""
+        return AD_REWARD_COOLDOWN_SECONDS - (now - self.ad.get(user_id, 0.0))
+
+def ad_cooldown_message(remaining_time):
+    return f"Veuillez attendre encore {int(remaining_time // 60)} min {int(remaining_time % 60)} sec avant la prochaine récompense publicitaire."
+
+leaderboard = Leaderboard()
+reward_cooldowns = RewardCooldowns()
+user_store = UserStore(USERS_HEADER, storage.users_journal(), USERS_LOCK_DIR, USER_LOCK_STRIPES, USER_GROUP_COMMIT_MS / 1000,
+                       snapshot=Snapshot(os.path.join(SNAPSHOTS_DIR, 'users.snap'), UserRecord.__slots__))
+user_store.add_listener(leaderboard)
+user_store.add_listener(reward_cooldowns)
+user_store.recover()
+
+# --- Suivis des pronostics ---
+# Même principe que le store utilisateurs : chaque worker garde {user_id: {MatchID:
+# date_suivi}} en mémoire, alimenté par les enregistrements "follow" / "unfollow" du
+# journal des suivis ; suivre ou ne plus suivre un match n'ajoute qu'une ligne au journal,
+# et suivis.csv n'est réécrit qu'à la compaction.
+class FollowStore:
+    def __init__(self, journal, lock_dir, lock_stripes, snapshot=None):
+        self.journal = journal
+        self.snapshot = snapshot
+        self.snapshot_used = False
+        self.locks = StripedFileLock(lock_dir, lock_stripes)
+        self.follows = {}
+        self.compaction_due = False
+        self.lock = threading.RLock()
+
+    def _load(self, truncate_torn_tail=False):
+        started = time.perf_counter()
+        base_key = self.journal.base_key() if self.snapshot else None
+        follows = self.snapshot.read(base_key) if self.snapshot else None
+        base_rows, records = self.journal.load(truncate_torn_tail, base_key if follows is not None else None)
+        self.snapshot_used = base_rows is None
+        if base_rows is not None:
+            follows = {}
+            for row in base_rows:
+                apply_follow_record(follows, {'op': 'follow', **row})
+        for record in records:
+            apply_follow_record(follows, record)
+        self.follows = follows
+        follow_count = sum(len(f) for f in follows.values())
+        observe_storage('load_store', SUIVIS_FILE, started, follow_count, full=True)
+        logging.info(f"Suivis chargés ({follow_count} suivis, {len(records)} enregistrements rejoués"
+                     f"{SNAPSHOT_LOG_SUFFIX if self.snapshot_used else ''}).")
+
+    def _save_snapshot(self):
+        if self.snapshot:
+            self.snapshot.write(self.journal.base_key(), self.follows)
+
+    def recover(self):
+        with self.locks.hold_all(), self.lock:
+            self._load(truncate_torn_tail=True)
+            if not self.snapshot_used:
+                self._save_snapshot()
+
+    def sync(self):
+        with self.lock:
+            records = self.journal.poll()
+            cache_lookup('suivis', records is not None)
+            if records is None:
+                self._load()
+                return
+            for record in records:
+                apply_follow_record(self.follows, record)
+
+    def followed_ids(self, user_id):
+        with self.lock:
+            self.sync()
+            return list(self.follows.get(user_id, {}))
+
+    def followers(self, match_ids):
+        """{MatchID: [user_id]} pour les matchs de match_ids suivis par au moins un utilisateur (parcourt tous les suivis)."""
+        match_ids = set(match_ids)
+        followers = defaultdict(list)
+        with self.lock:
+            self.sync()
+            for user_id, user_follows in self.follows.items():
+                for match_id in match_ids.intersection(user_follows):
+                    followers[match_id].append(user_id)
+        return dict(followers)
+
+    def toggle(self, user_id, match_id):
+        """Suit match_id s'il ne l'était pas, sinon arrête de le suivre ; renvoie (suivi, MatchID suivis)."""
+        with self.locks.hold(user_id):
+            with self.lock:
+                self.sync()
+                followed = match_id in self.follows.get(user_id, {})
+            record = {'op': 'unfollow' if followed else 'follow', 'user_id': user_id, 'MatchID': match_id,
+                      'date_suivi': '' if followed else datetime.now(timezone.utc).isoformat()}
+            compaction_due = self.journal.append([record])
+            with self.lock:
+                apply_follow_record(self.follows, record)
+                self.compaction_due = self.compaction_due or compaction_due
+                followed_ids = list(self.follows.get(user_id, {}))
+        self.compact_if_due()
+        return not followed, followed_ids
 
-app = Flask(__name__)
+    def compact_if_due(self):
+        if not self.compaction_due:
+            return
+        with self.locks.hold_all(), self.lock:
+            self.compaction_due = False
+            if not self.journal.compaction_needed():
+                return
+            self.sync()
+            rows = [{'user_id': user_id, 'MatchID': match_id, 'date_suivi': date_suivi}
+                    for user_id, user_follows in self.follows.items() for match_id, date_suivi in user_follows.items()]
+            self.journal.compact(rows, SUIVIS_HEADER)
+            self._save_snapshot()
+            logging.info(f"Journal des suivis compacté ({len(rows)} suivis).")
 
-# Utiliser BASE_DIR pour les autres chemins de fichiers
-USERS_FILE = os.path.join(BASE_DIR, 'users.csv')
-MATCHES_FILE = os.path.join(BASE_DIR, 'matches.csv')
-PARIS_FILE = os.path.join(BASE_DIR, 'paris.csv')
-SUIVIS_FILE = os.path.join(BASE_DIR, 'suivis.csv')
+follow_store = FollowStore(storage.follows_journal(), SUIVIS_LOCK_DIR, USER_LOCK_STRIPES,
+                           snapshot=Snapshot(os.path.join(SNAPSHOTS_DIR, 'suivis.snap'), SUIVIS_HEADER))
+follow_store.recover()
+match_catalog.recover()
+bet_store.load_indexes()
 
-# --- Définition des en-têtes pour les fichiers CSV ---
-USERS_HEADER = ['user_id', 'pseudo', 'join_date', 'xp', 'level', 'email', 'pronocoins_balance', 
-                'last_daily_reward_date', 'tutorial_completed_reward_claimed', 
-                'google_linked_reward_claimed', 'pseudo_created_reward_claimed', 
-                'unlocked_pronos', 'bet_count', 'three_bets_reward_claimed',
-                'tiktok_follow_reward_claimed', 'x_follow_reward_claimed', 
-                'instagram_follow_reward_claimed', 'telegram_channel_reward_claimed',
-                'telegram_chat_reward_claimed', 
-                'last_ad_reward_timestamp',
-                'telegram_first_name', 'telegram_last_name', 'telegram_username' 
-                ]
-MATCHES_HEADER = ['Date', 'Heure', 'Match', 'Pari', 'Cote', 'Risque', 'Note', 'Niveau', 'Statut', 'MatchID']
-PARIS_HEADER = ['bet_id', 'user_id', 'MatchID', 'MatchName', 'DatePari', 'Montant', 'StatutPari', 
-                'CotePari', 'BetType', 'CoteGagnante', 'Gain']
-SUIVIS_HEADER = ['user_id', 'MatchID', 'date_suivi']
+# --- Flux d'événements (SSE) ---
+# /api/stream pousse au navigateur les changements de solde, XP et niveau de
+# l'utilisateur et les changements de Statut des matchs. Le hub est abonné au store
+# utilisateurs et au catalogue des matchs : les mutations du worker sont publiées
+# immédiatement, celles des autres workers (ou d'un règlement en ligne de commande)
+# par une unique thread de surveillance par worker qui synchronise les deux stores
+# toutes les SSE_POLL_INTERVAL secondes tant qu'il y a des abonnés. Chaque connexion
+# n'est qu'une file d'événements bornée : avec des workers gevent (voir Procfile),
+# des milliers de connexions inactives ne coûtent ni thread ni lecture de fichier.
+class Subscription:
+    RESYNC = object()
 
-# --- Constantes de Gamification ---
-PRONOCOINS_INITIAL_BALANCE = 50
-PRONOCOINS_UNLOCK_COST = 10
-PRONOCOINS_BET_COST = 10 
-PRONOCOINS_DAILY_REWARD = 5
-PRONOCOINS_AD_REWARD = 1 
-XP_PER_BET = 1
-XP_PER_UNLOCK = 2
-XP_PER_DAILY_REWARD = 5 
-XP_PER_AD_WATCH = 1 
-REWARD_SOCIAL_PC = 3
-REWARD_SOCIAL_XP = 5
-AD_REWARD_COOLDOWN_SECONDS = 3600 
+    def __init__(self, user_id, max_events):
+        self.user_id = user_id
+        self.max_events = max_events
+        self.events = []
+        self.overflowed = False
+        self.cond = threading.Condition()
 
+    def push(self, item):
+        with self.cond:
+            if len(self.events) >= self.max_events:
+                # Client trop lent : il recevra "resync" et rechargera ses données.
+                self.overflowed = True
+                self.events = []
+            else:
+                self.events.append(item)
+            self.cond.notify()
 
-TASKS_CONFIG = {
-    'tutorial': {'name': 'Terminer le tutoriel', 'pc_reward': 1, 'xp_reward': 5, 'claimed_field': 'tutorial_completed_reward_claimed'},
-    'google': {'name': 'Lier son compte Google', 'pc_reward': 5, 'xp_reward': 10, 'claimed_field': 'google_linked_reward_claimed'},
-    'pseudo': {'name': 'Créer son pseudo', 'pc_reward': 2, 'xp_reward': 5, 'claimed_field': 'pseudo_created_reward_claimed'},
-    'three_bets': {'name': 'Faire 3 paris', 'pc_reward': 10, 'xp_reward': 15, 'claimed_field': 'three_bets_reward_claimed', 'condition_bet_count': 3},
-    'tiktok': {'name': 'Suivre sur TikTok', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'tiktok_follow_reward_claimed'},
-    'x': {'name': 'Suivre sur X (Twitter)', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'x_follow_reward_claimed'},
-    'instagram': {'name': 'Suivre sur Instagram', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'instagram_follow_reward_claimed'},
-    'tg_channel': {'name': 'Rejoindre le Canal Telegram', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'telegram_channel_reward_claimed'},
-    'tg_chat': {'name': 'Rejoindre le Chat Telegram', 'pc_reward': REWARD_SOCIAL_PC, 'xp_reward': REWARD_SOCIAL_XP, 'claimed_field': 'telegram_chat_reward_claimed'}
-}
-LEVELS_XP = [0, 100, 250, 500, 1000, 2000, 5000, 10000] 
+    def next(self, timeout):
+        """Prochain événement (event, data), RESYNC, ou None si rien n'est arrivé avant timeout."""
+        with self.cond:
+            if not self.events and not self.overflowed:
+                self.cond.wait(timeout)
+            if self.overflowed:
+                return self.RESYNC
+            return self.events.pop(0) if self.events else None
 
-# --- Cache pour matches.csv ---
-matches_cache = None
-matches_cache_timestamp = 0
-MATCHES_CACHE_DURATION = 300 
+class EventHub:
+    USER_FIELDS = ('pronocoins_balance', 'xp', 'level')
 
-# --- Fonctions Utilitaires pour les CSV ---
-def initialize_csv(file_path, header):
-    if not os.path.exists(file_path):
+    def __init__(self, max_queued_events, poll_interval):
+        self.max_queued_events = max_queued_events
+        self.poll_interval = poll_interval
+        self.subscriptions = defaultdict(set)
+        self.last_values = {}
+        self.watcher_pid = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def user_values(cls, row):
+        return {field: int(row.get(field) or 0) for field in cls.USER_FIELDS}
+
+    def subscribe(self, user_id, row):
+        subscription = Subscription(user_id, self.max_queued_events)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+            SSE_SUBSCRIPTIONS.inc()
+            if row is not None:
+                self.last_values.setdefault(user_id, self.user_values(row))
+        self._ensure_watcher()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is not None and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                SSE_SUBSCRIPTIONS.dec()
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+                    self.last_values.pop(subscription.user_id, None)
+
+    def publish(self, event, data, user_id=None):
+        """Publie aux abonnés de user_id, ou à tous les abonnés si user_id vaut None."""
+        with self.lock:
+            if user_id is None:
+                targets = [sub for subscriptions in self.subscriptions.values() for sub in subscriptions]
+            else:
+                targets = list(self.subscriptions.get(user_id, ()))
+        for subscription in targets:
+            subscription.push((event, data))
+
+    def _user_updated(self, user_id, row):
+        values = self.user_values(row)
+        with self.lock:
+            if user_id not in self.subscriptions or self.last_values.get(user_id) == values:
+                return
+            self.last_values[user_id] = values
+        self.publish('user', values, user_id)
+
+    # Abonné du UserStore
+    def rebuild(self, rows):
+        # Rechargement complet (journal compacté par un autre worker) : on compare aux dernières valeurs publiées.
+        for user_id in list(self.subscriptions):
+            if user_id in rows:
+                self._user_updated(user_id, rows[user_id])
+
+    def user_changed(self, user_id, row, changed_fields):
+        if user_id in self.subscriptions and not set(self.USER_FIELDS).isdisjoint(changed_fields):
+            self._user_updated(user_id, row)
+
+    # Abonné du MatchCatalog
+    def matches_changed(self, rows):
+        for row in rows:
+            self.publish('match', {'MatchID': row.get('MatchID'), 'Statut': row.get('Statut', '')})
+
+    def _ensure_watcher(self):
+        # Une thread par worker, démarrée au premier abonné (et de nouveau après un fork).
+        with self.lock:
+            if self.watcher_pid == os.getpid():
+                return
+            self.watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='sse-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.subscriptions:
+                continue
+            try:
+                user_store.sync()
+                match_catalog.refresh()
+            except Exception as e:
+                logging.error(f"Erreur lors de la surveillance des changements pour le flux SSE: {e}")
+
+event_hub = EventHub(SSE_MAX_QUEUED_EVENTS, SSE_POLL_INTERVAL)
+user_store.add_listener(event_hub)
+match_catalog.add_listener(event_hub)
+
+# --- Notifications Telegram (outbox) ---
+# Les routes ne parlent jamais à Telegram : elles ajoutent un événement {kind, user_id,
+# data, ts} à notifications.outbox (une ligne JSON, un os.write en O_APPEND), et le
+# process telegram_notifier.py le consomme, regroupe les messages par utilisateur et les
+# envoie en respectant les limites de débit de Telegram. Sans TELEGRAM_BOT_TOKEN, rien
+# n'est écrit. Le consommateur vide le fichier une fois tout lu et le fichier assez gros
+# (NOTIFICATIONS_OUTBOX_COMPACT_BYTES) ; les ajouts prennent un verrou partagé pour
+# qu'aucun ne tombe entre sa lecture et la troncature.
+class NotificationOutbox:
+    def __init__(self, path, compact_bytes):
+        self.path = path
+        self.compact_bytes = compact_bytes
+
+    @contextmanager
+    def _locked(self, exclusive):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
         try:
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(header)
-            logging.info(f"Fichier {file_path} créé avec les en-têtes.")
-        except IOError as e:
-            logging.error(f"Erreur lors de la création du fichier {file_path}: {e}")
-
-def read_csv_as_list_of_dicts(file_path, use_cache=False, cache_var_name=None, cache_ts_name=None, cache_duration=60):
-    global matches_cache, matches_cache_timestamp 
-
-    if use_cache:
-        current_time = time.time()
-        cache_to_use = None
-        ts_to_use = 0
-        if cache_var_name == "matches_cache":
-            cache_to_use = matches_cache
-            ts_to_use = matches_cache_timestamp
-        
-        if cache_to_use is not None and (current_time - ts_to_use) < cache_duration:
-            logging.debug(f"Utilisation du cache pour {file_path}")
-            return list(cache_to_use) 
+            lock_fd(fd, exclusive)
+            yield fd
+        finally:
+            os.close(fd)
 
-    data = []
-    try:
-        with open(file_path, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                data.append(row)
-        if use_cache and cache_var_name == "matches_cache":
-            matches_cache = list(data) 
-            matches_cache_timestamp = time.time()
-            logging.info(f"Cache pour {file_path} mis à jour.")
-    except FileNotFoundError:
-        logging.warning(f"Le fichier {file_path} n'a pas été trouvé.")
-        if file_path == MATCHES_FILE: initialize_csv(file_path, MATCHES_HEADER)
-        elif file_path == USERS_FILE: initialize_csv(file_path, USERS_HEADER)
-        elif file_path == PARIS_FILE: initialize_csv(file_path, PARIS_HEADER)
-        elif file_path == SUIVIS_FILE: initialize_csv(file_path, SUIVIS_HEADER)
-    except Exception as e:
-        logging.error(f"Erreur lors de la lecture de {file_path}: {e}")
-    return data
+    def append(self, events):
+        data = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events).encode('utf-8')
+        with self._locked(exclusive=False) as fd:
+            os.write(fd, data)
 
-def write_csv_from_list_of_dicts(file_path, data, header):
-    try:
-        with open(file_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
-            writer.writeheader()
-            writer.writerows(data)
-        if file_path == MATCHES_FILE:
-            global matches_cache
-            matches_cache = None 
-            logging.info(f"Cache pour {MATCHES_FILE} invalidé après écriture.")
-    except Exception as e:
-        logging.error(f"Erreur lors de l'écriture dans {file_path}: {e}")
+    def read(self, offset):
+        """(événements complets ajoutés après offset, nouvel offset) ; repart de 0 si le fichier a été vidé."""
+        try:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < offset:
+                    offset = 0
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], 0
+        complete_len = chunk.rfind(b'\n') + 1
+        events = []
+        for line in chunk[:complete_len].splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError as e:
+                logging.warning(f"Notification illisible ignorée dans {self.path}: {e}")
+        return events, offset + complete_len
 
-def append_to_csv(file_path, data_row_dict, header):
-    try:
-        file_exists_non_empty = os.path.exists(file_path) and os.path.getsize(file_path) > 0
-        with open(file_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
-            if not file_exists_non_empty:
-                writer.writeheader()
-            writer.writerow(data_row_dict)
-    except Exception as e:
-        logging.error(f"Erreur lors de l'ajout à {file_path}: {e}")
+    def truncate_if_consumed(self, offset):
+        """Vide le fichier si tout a été lu jusqu'à offset et qu'il a atteint compact_bytes ; renvoie le nouvel offset."""
+        if offset < self.compact_bytes:
+            return offset
+        with self._locked(exclusive=True) as fd:
+            if os.fstat(fd).st_size != offset:
+                return offset # ajout arrivé entretemps : ce sera pour la prochaine fois
+            os.ftruncate(fd, 0)
+        return 0
 
-initialize_csv(USERS_FILE, USERS_HEADER)
-initialize_csv(MATCHES_FILE, MATCHES_HEADER)
-initialize_csv(PARIS_FILE, PARIS_HEADER)
-initialize_csv(SUIVIS_FILE, SUIVIS_HEADER)
+notification_outbox = NotificationOutbox(NOTIFICATIONS_OUTBOX_FILE, NOTIFICATIONS_OUTBOX_COMPACT_BYTES)
 
-def _convert_user_types(user_dict):
-    if not user_dict: return None
-    user_dict['xp'] = int(user_dict.get('xp', 0))
-    user_dict['level'] = int(user_dict.get('level', 1))
-    user_dict['pronocoins_balance'] = int(user_dict.get('pronocoins_balance', 0))
-    user_dict['bet_count'] = int(user_dict.get('bet_count', 0))
-    user_dict['last_ad_reward_timestamp'] = float(user_dict.get('last_ad_reward_timestamp', 0.0)) 
-    for task_id in TASKS_CONFIG: 
-        claimed_field = TASKS_CONFIG[task_id]['claimed_field']
-        user_dict[claimed_field] = user_dict.get(claimed_field, 'false').lower() == 'true'
-    user_dict['unlocked_pronos'] = user_dict.get('unlocked_pronos', '').split(',') if user_dict.get('unlocked_pronos') else []
-    return user_dict
+def queue_notification(kind, user_id, **data):
+    """Confie une notification à telegram_notifier.py ; une erreur est journalisée, jamais propagée à la requête."""
+    if not TELEGRAM_BOT_TOKEN:
+        return
+    try:
+        notification_outbox.append([{'kind': kind, 'user_id': user_id, 'data': data,
+                                     'ts': datetime.now(timezone.utc).isoformat()}])
+    except OSError as e:
+        logging.error(f"Erreur lors de l'ajout de la notification {kind} pour {user_id}: {e}")
 
 def get_user(user_id):
-    users = read_csv_as_list_of_dicts(USERS_FILE)
-    user = next((u for u in users if u['user_id'] == user_id), None)
-    return _convert_user_types(user)
+    """Copie UserRecord de l'utilisateur (interface de dict, voir Utilisateur typé), ou None."""
+    return user_store.get_row(user_id)
 
 def update_user_atomic(user_id, update_fn):
-    users = read_csv_as_list_of_dicts(USERS_FILE)
-    user_found_and_updated = False
-    updated_users_list = []
-    user_to_return = None
-
-    for u_dict_str in users: 
-        if u_dict_str['user_id'] == user_id:
-            u_typed = _convert_user_types(u_dict_str.copy()) 
-            if u_typed is None: 
-                updated_users_list.append(u_dict_str)
-                continue
+    """Applique update_fn(copie UserRecord) sous le verrou de user_id ; renvoie la copie modifiée, ou None si inconnu."""
+    u_modified = user_store.update(user_id, update_fn)
+    user_store.compact_if_due()
+    return u_modified
 
-            u_modified_typed = update_fn(u_typed) 
-            user_to_return = u_modified_typed.copy()
-
-            u_final_str_dict = {}
-            for header_col in USERS_HEADER:
-                if header_col == 'unlocked_pronos':
-                    u_final_str_dict[header_col] = ','.join(filter(None, u_modified_typed.get(header_col, [])))
-                elif any(cfg['claimed_field'] == header_col for cfg in TASKS_CONFIG.values()): 
-                    u_final_str_dict[header_col] = str(u_modified_typed.get(header_col, False)).lower()
-                elif header_col == 'last_ad_reward_timestamp':
-                    u_final_str_dict[header_col] = str(u_modified_typed.get(header_col, 0.0))
-                elif header_col in ['telegram_first_name', 'telegram_last_name', 'telegram_username', 'email', 'pseudo', 'last_daily_reward_date', 'join_date']:
-                    u_final_str_dict[header_col] = u_modified_typed.get(header_col, '')
-                elif header_col in u_modified_typed: 
-                     u_final_str_dict[header_col] = str(u_modified_typed[header_col])
-                else:
-                    u_final_str_dict[header_col] = u_dict_str.get(header_col, '') 
+def update_users_atomic(update_fns):
+    """Version groupée de update_user_atomic : {user_id: update_fn} appliqués et journalisés en une écriture.
 
-            updated_users_list.append(u_final_str_dict)
-            user_found_and_updated = True
-        else:
-            updated_users_list.append(u_dict_str)
-    
-    if user_found_and_updated:
-        write_csv_from_list_of_dicts(USERS_FILE, updated_users_list, USERS_HEADER)
-        return user_to_return 
-    return None
+    Écrit directement, sans fenêtre de group commit (le lot est déjà là). Les utilisateurs
+    inconnus sont ignorés ; renvoie {user_id: utilisateur mis à jour}.
+    """
+    updated_users = {}
+    with user_store.locks.hold_many(update_fns), USER_LOCK_HOLD_SECONDS.labels('update_users_atomic').time():
+        changes = {}
+        for user_id, update_fn in update_fns.items():
+            u_original = user_store.get_row(user_id)
+            if u_original is None:
+                logging.warning(f"Mise à jour groupée : utilisateur {user_id} introuvable.")
+                continue
+            u_modified = updated_users[user_id] = update_fn(u_original.copy())
+            changes[user_id] = u_original.changed_fields(u_modified)
+        user_store.update_fields(changes)
+    user_store.compact_if_due()
+    return updated_users
 
 
 def check_and_apply_level_up(user_data_dict):
@@ -251,27 +2881,589 @@ def check_and_apply_level_up(user_data_dict):
     return user_data_dict, leveled_up_this_check
 
 
+# --- Bilan des paris réglés ---
+# Le bilan de chaque utilisateur est matérialisé : ses totaux (bilan_paris_regles,
+# bilan_paris_gagnes, bilan_gains_nets, bilan_mises_reglees) dans sa ligne users.csv,
+# modifiés dans la même écriture groupée que le crédit des gains, et ses résultats par
+# jour dans bilans.csv (user_id, date, gagnés, perdus, pnl), hors de la ligne utilisateur
+# pour qu'elle ne grossisse pas avec l'historique. Chaque règlement y ajoute une ligne par
+# utilisateur et par jour touché ; les lignes d'un même jour s'additionnent, et
+# `flask rebuild-bilans` réécrit le fichier avec une seule ligne par jour. Le tout ne
+# change qu'au règlement (ou au rapprochement), sous settlement_lock().
+BILAN_DAY_FIELDS = ['gagnes', 'perdus', 'pnl']
+
+def new_bilan():
+    return {'regles': 0, 'gagnes': 0, 'net': 0, 'mises': 0, 'jours': defaultdict(lambda: [0, 0, 0])}
+
+def add_settled_bet(bilan, bet):
+    won = bet_status(bet['StatutPari']) == 'gagne'
+    try:
+        montant = int(bet.get('Montant', 0))
+        pnl = int(bet.get('Gain', 0)) if won else -montant
+    except ValueError:
+        logging.warning(f"Donnée de pari invalide pour le bilan: {bet}")
+        return
+    date_pari_str = bet.get('DatePari', '').split('T')[0]
+    bilan['regles'] += 1
+    bilan['mises'] += montant
+    bilan['net'] += pnl
+    if won:
+        bilan['gagnes'] += 1
+    if date_pari_str:
+        jour = bilan['jours'][date_pari_str]
+        jour[0 if won else 1] += 1
+        jour[2] += pnl
+
+def apply_bilan(user_p, bilan, replace=False):
+    """Ajoute (ou substitue, avec replace=True) les totaux de `bilan` à ceux de user_p ; les jours vont dans bilans.csv."""
+    if replace:
+        for bilan_field in BILAN_TOTAL_FIELDS:
+            user_p[bilan_field] = 0
+    user_p['bilan_paris_regles'] += bilan['regles']
+    user_p['bilan_paris_gagnes'] += bilan['gagnes']
+    user_p['bilan_gains_nets'] += bilan['net']
+    user_p['bilan_mises_reglees'] += bilan['mises']
+    return user_p
+
+def bilan_day_rows(user_id, jours):
+    """Lignes de bilans.csv pour jours ({date: [gagnés, perdus, pnl]})."""
+    return [{'user_id': user_id, 'date': date_str, 'gagnes': gagnes, 'perdus': perdus, 'pnl': pnl}
+            for date_str, (gagnes, perdus, pnl) in sorted(jours.items())]
+
+def bilan_days(user_id):
+    """{date: [gagnés, perdus, pnl]} de user_id, somme de ses lignes de bilans.csv."""
+    jours = {}
+    for row in select_page(BILANS_FILE, 'date', user_id=user_id):
+        try:
+            values = [int(row[col]) for col in BILAN_DAY_FIELDS]
+        except (KeyError, ValueError):
+            logging.warning(f"Ligne de bilan invalide ignorée : {row}")
+            continue
+        jour = jours.setdefault(row['date'], [0, 0, 0])
+        for i, value in enumerate(values):
+            jour[i] += value
+    return jours
+
+def replace_bilan_days(days_by_user):
+    """Remplace les lignes de bilans.csv des utilisateurs de days_by_user ({user_id: jours}) ; sous settlement_lock()."""
+    if not days_by_user:
+        return
+    delete_rows(BILANS_FILE, user_id=list(days_by_user))
+    append_rows(BILANS_FILE, [row for user_id, jours in days_by_user.items() for row in bilan_day_rows(user_id, jours)],
+                BILANS_HEADER)
+
+@contextmanager
+def settlement_lock():
+    # Sérialise les règlements et les recalculs de bilan, y compris entre process.
+    with open(SETTLEMENT_LOCK_FILE, 'a') as f:
+        lock_fd(f.fileno())
+        yield
+
+def rebuild_bilans():
+    """Recalcule tous les bilans matérialisés en une passe sur les paris réglés."""
+    with settlement_lock():
+        return _rebuild_bilans()
+
+def _rebuild_bilans():
+    bilans = defaultdict(new_bilan)
+    for bet in bet_store.settled_bets():
+        add_settled_bet(bilans[bet['user_id']], bet)
+
+    def reset(bilan):
+        def reset_logic(user_p):
+            return apply_bilan(user_p, bilan, replace=True)
+        return reset_logic
+
+    updated = update_users_atomic({row['user_id']: reset(bilans.get(row['user_id'], new_bilan()))
+                                   for row in user_store.all_rows()})
+    write_csv_from_list_of_dicts(BILANS_FILE, [row for user_id, bilan in bilans.items() if user_id in updated
+                                               for row in bilan_day_rows(user_id, bilan['jours'])], BILANS_HEADER)
+    logging.info(f"Bilans recalculés pour {len(updated)} utilisateurs.")
+    return len(updated)
+
+def backfill_bilans():
+    """Calcule les bilans au premier démarrage sans bilans.csv (ni table bilans) ; renvoie None s'ils existaient.
+
+    Un déploiement antérieur aux bilans matérialisés a déjà des paris réglés : sans ce
+    rattrapage, graphiques et totaux resteraient vides jusqu'à `flask rebuild-bilans`.
+    Le fichier est créé sous settlement_lock(), de sorte qu'un seul worker fait le calcul
+    et qu'aucun règlement n'y ajoute de lignes avant lui.
+    """
+    with settlement_lock():
+        if not initialize_csv(BILANS_FILE, BILANS_HEADER):
+            return None
+        logging.info("Bilans absents : calcul initial depuis les paris réglés.")
+        return _rebuild_bilans()
+
+backfill_bilans()
+
+
+# --- Règlement des paris ---
+def settle_matches(results):
+    """Règle tous les paris en cours des matchs de `results` ({MatchID: 'gagne' | 'perdu'}).
+
+    paris.csv est parcouru une seule fois. Un pari gagné rapporte Montant * CotePari PC (arrondi à l'inférieur),
+    mise comprise puisqu'elle a été débitée au moment du pari ; Gain en garde le gain net. Les
+    gagnants sont crédités, et les bilans de tous les parieurs mis à jour, par une seule mise à
+    jour groupée ; les matchs passent ensuite à 'terminé'. Chaque crédit s'ajoute aussi à
+    gains_verses, dans le même enregistrement que le solde : c'est ce total, et non le bilan
+    (un cache que rebuild_bilans peut recalculer), que le rapprochement compare aux paris gagnés.
+    """
+    with settlement_lock():
+        return _settle_matches(results)
+
+def _settle_matches(results):
+    results = {match_id: str(outcome).strip().lower() for match_id, outcome in results.items()}
+    invalid = {match_id: outcome for match_id, outcome in results.items() if outcome not in BET_OUTCOMES}
+    if invalid:
+        raise ValueError(f"Résultats invalides (attendu {'/'.join(BET_OUTCOMES)}) : {invalid}")
+    payouts = defaultdict(int)
+    bilans = defaultdict(new_bilan)
+
+    def settle_bet(bet):
+        outcome = results[bet['MatchID']]
+        bet['StatutPari'] = outcome
+        bet['CoteGagnante'] = ''
+        bet['Gain'] = 0
+        if outcome == 'gagne':
+            montant = int(bet.get('Montant') or 0)
+            try:
+                cote = float(bet.get('CotePari', ''))
+            except ValueError:
+                logging.warning(f"Cote invalide pour le pari {bet.get('bet_id')}, mise remboursée : {bet.get('CotePari')}")
+                cote = 1.0
+            payout = int(montant * cote)
+            bet['CoteGagnante'] = bet.get('CotePari', '')
+            bet['Gain'] = payout - montant
+            payouts[bet['user_id']] += payout
+        add_settled_bet(bilans[bet['user_id']], bet)
+        return bet
+
+    # paris.csv d'abord : après un arrêt entre les deux écritures, les paris ne sont plus
+    # en cours et ne peuvent pas être crédités deux fois par un nouveau règlement.
+    settled_bets = update_rows(PARIS_FILE, PARIS_HEADER, settle_bet, MatchID=list(results), StatutPari='en_cours')
+
+    def credit(amount, bilan):
+        def credit_logic(user_p):
+            user_p['pronocoins_balance'] += amount
+            user_p['gains_verses'] = paid_gains(user_p) + amount
+            return apply_bilan(user_p, bilan)
+        return credit_logic
+
+    update_users_atomic({user_id: credit(payouts.get(user_id, 0), bilan) for user_id, bilan in bilans.items()})
+    append_rows(BILANS_FILE, [row for user_id, bilan in bilans.items() for row in bilan_day_rows(user_id, bilan['jours'])],
+                BILANS_HEADER)
+
+    match_catalog.update_fields({match_id: {'Statut': MATCH_STATUS_FINISHED} for match_id in results})
+    bet_store.flush_settled()
+
+    won_bets = sum(1 for bet in settled_bets if bet['StatutPari'] == 'gagne')
+    logging.info(f"{len(settled_bets)} paris réglés sur {len(results)} matchs, {sum(payouts.values())} PC versés à {len(payouts)} gagnants.")
+    return {
+        "settled_bets": len(settled_bets),
+        "won_bets": won_bets,
+        "lost_bets": len(settled_bets) - won_bets,
+        "credited_users": len(payouts),
+        "pronocoins_paid": sum(payouts.values())
+    }
+
+def paid_gains(user_p):
+    """Total versé à user_p par les règlements (gains_verses), mise comprise.
+
+    Pour une ligne antérieure à la colonne, seul le bilan matérialisé le connaît, tenu dans
+    la même écriture que les crédits (ou recalculé par backfill_bilans s'il manquait) :
+    bilan_gains_nets + bilan_mises_reglees sert alors de point de départ.
+    """
+    if user_p['gains_verses'] is None:
+        return user_p['bilan_gains_nets'] + user_p['bilan_mises_reglees']
+    return user_p['gains_verses']
+
+def backfill_gains_verses():
+    """Initialise gains_verses des utilisateurs antérieurs à la colonne ; renvoie leur nombre."""
+    with settlement_lock():
+        legacy = [row['user_id'] for row in user_store.all_rows() if row['gains_verses'] is None]
+        if not legacy:
+            return 0
+
+        def seed(user_p):
+            if user_p['gains_verses'] is None: # revérifié sous le verrou : un autre worker a pu le faire
+                user_p['gains_verses'] = paid_gains(user_p)
+            return user_p
+
+        update_users_atomic({user_id: seed for user_id in legacy})
+    logging.info(f"gains_verses initialisé pour {len(legacy)} utilisateurs.")
+    return len(legacy)
+
+backfill_gains_verses()
+
+
+# --- Rapprochement du grand livre ---
+# Un pari est écrit dans paris.csv avant le débit de son parieur, et un règlement met à
+# jour les paris avant de créditer les gagnants : un arrêt entre les deux laisse un pari
+# non débité ou un gain non versé. `flask reconcile-ledger` compare chaque utilisateur à
+# ses paris (toutes partitions et archives) : nombre de paris et bet_count, MatchID pariés
+# absents de unlocked_pronos, bilan matérialisé et bilan recalculé, gains des paris gagnés
+# et gains_verses. Ce dernier n'est modifié qu'avec le solde (règlement, correction) :
+# recalculer les bilans ne change donc pas les gains jugés non versés. Pour tenir en
+# mémoire à 10M de paris, ceux-ci sont triés par user_id en paquets de
+# LEDGER_SORT_CHUNK_ROWS écrits sur disque (les archives le sont déjà), puis fusionnés
+# et parcourus une seule fois avec les utilisateurs triés : la mémoire ne dépend que de
+# la taille d'un paquet et des paris d'un utilisateur.
+# Le parcours ne prend aucun verrou utilisateur : les workers continuent de servir, et un
+# écart qu'il voit peut n'être qu'un pari en cours d'écriture. Avec --repair, chaque
+# utilisateur en écart est donc revérifié dans update_users_atomic, contre ses paris et
+# son bilan relus sous son verrou, et corrigé d'après ce seul état ; la correction passe
+# par le journal utilisateurs comme toute mutation. --corrected-users écrit à la place
+# un users.csv corrigé d'après le parcours, sans toucher aux données.
+LEDGER_SORT_CHUNK_ROWS = int(os.getenv("LEDGER_SORT_CHUNK_ROWS", 200_000))
+LEDGER_BET_COLUMNS = ['user_id', 'bet_id', 'MatchID', 'DatePari', 'Montant', 'StatutPari', 'Gain']
+LEDGER_REPORT_HEADER = ['user_id', 'paris', 'bet_count', 'pronos_non_debloques', 'gains_non_verses',
+                        'ajustement_solde', 'ecart_bilan']
+LEDGER_REPAIR_BATCH_USERS = 100 # relus sous leurs verrous : lots courts
+
+def _write_sorted_run(rows, tmp_dir):
+    rows.sort(key=itemgetter(0))
+    fd, path = tempfile.mkstemp(prefix='paris_', suffix='.csv', dir=tmp_dir)
+    with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+def _read_sorted_run(path):
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for values in csv.reader(f):
+            yield dict(zip(LEDGER_BET_COLUMNS, values))
+
+def bets_by_user(tmp_dir, chunk_rows=LEDGER_SORT_CHUNK_ROWS):
+    """(user_id, paris sans doublon de bet_id) par user_id croissant ; les paquets triés sont écrits dans tmp_dir."""
+    live, archives = bet_store.streams()
+    runs, chunk = [], []
+    for row in itertools.chain.from_iterable(live):
+        chunk.append([row.get(col, '') for col in LEDGER_BET_COLUMNS])
+        if len(chunk) >= chunk_rows:
+            runs.append(_write_sorted_run(chunk, tmp_dir))
+            chunk = []
+    if chunk:
+        runs.append(_write_sorted_run(chunk, tmp_dir))
+    merged = heapq.merge(*(_read_sorted_run(path) for path in runs), *archives, key=itemgetter('user_id'))
+    for user_id, rows in itertools.groupby(merged, key=itemgetter('user_id')):
+        seen, bets = set(), []
+        for row in rows:
+            if row['bet_id'] not in seen: # pari présent dans deux partitions (déplacement interrompu)
+                seen.add(row['bet_id'])
+                bets.append(row)
+        yield user_id, bets
+
+def reconcile_user(user_p, bets, jours):
+    """Écarts de user_p (UserRecord) avec ses paris et ses jours de bilan : (ligne de rapport, correction) ou (None, None).
+
+    La correction est (fonction de mise à jour de l'utilisateur, jours attendus à écrire dans bilans.csv ou None).
+    """
+    bilan = new_bilan()
+    unlocked = set(user_p['unlocked_pronos'])
+    not_unlocked = OrderedSet() # dans l'ordre des paris
+    for bet in bets:
+        if bet_status(bet['StatutPari']) in BET_OUTCOMES:
+            add_settled_bet(bilan, bet)
+        if bet['MatchID'] not in unlocked:
+            not_unlocked.add(bet['MatchID'])
+    expected = apply_bilan(UserRecord.from_row({'user_id': user_p['user_id']}), bilan, replace=True)
+    expected_days = {date_str: list(jour) for date_str, jour in bilan['jours'].items()}
+    days_drift = jours != expected_days
+    bilan_drift = days_drift or any(user_p[col] != expected[col] for col in BILAN_TOTAL_FIELDS)
+    # Versé attendu : mise et gain de chaque pari gagné (bilan net + mises réglées).
+    unpaid = bilan['net'] + bilan['mises'] - paid_gains(user_p)
+    # Paris écrits sans débit (ou débits sans pari) : au prix d'un pari, seul montant possible.
+    unbilled_bets = len(bets) - user_p['bet_count']
+    adjustment = unpaid - unbilled_bets * PRONOCOINS_BET_COST
+    if not (bilan_drift or unpaid or unbilled_bets or not_unlocked):
+        return None, None
+    report = {'user_id': user_p['user_id'], 'paris': len(bets), 'bet_count': user_p['bet_count'],
+              'pronos_non_debloques': ','.join(sorted(not_unlocked)), 'gains_non_verses': unpaid,
+              'ajustement_solde': adjustment, 'ecart_bilan': 'oui' if bilan_drift else 'non'}
+
+    def repair(u):
+        # Solde : d'après les paris et gains_verses seuls.
+        u['bet_count'] += unbilled_bets
+        u['pronocoins_balance'] += adjustment
+        u['gains_verses'] = paid_gains(u) + unpaid
+        u['unlocked_pronos'] |= not_unlocked
+        # Bilan : cache recalculé depuis les paris, sans effet sur le solde.
+        return apply_bilan(u, bilan, replace=True) if bilan_drift else u
+    return report, (repair, expected_days if days_drift else None)
+
+def reconcile_ledger(report_file=None, repair=False, tmp_dir=None, chunk_rows=LEDGER_SORT_CHUNK_ROWS, corrected_file=None):
+    """Rapproche utilisateurs et paris en une passe ; écrit les écarts dans report_file et les corrige si repair.
+
+    corrected_file reçoit tous les utilisateurs, corrections du parcours appliquées, au format de users.csv.
+    """
+    started = time.perf_counter()
+    summary = {'users': 0, 'bets': 0, 'users_with_drift': 0, 'orphan_bets': 0, 'unpaid_gains': 0,
+               'balance_adjustment': 0, 'repaired_users': 0}
+    pending = [] # en écart au parcours, revérifiés par flush_repairs
+
+    with settlement_lock(), tempfile.TemporaryDirectory(prefix='pronozone_ledger_', dir=tmp_dir) as work_dir, \
+            (open(report_file, 'w', newline='', encoding='utf-8') if report_file else io.StringIO()) as report_f, \
+            (open(corrected_file, 'w', newline='', encoding='utf-8') if corrected_file else io.StringIO()) as corrected_f:
+        writer = csv.DictWriter(report_f, fieldnames=LEDGER_REPORT_HEADER)
+        writer.writeheader()
+        corrected_writer = csv.DictWriter(corrected_f, fieldnames=USERS_HEADER) if corrected_file else None
+        if corrected_writer:
+            corrected_writer.writeheader()
+        user_store.sync()
+        user_ids = iter(sorted(user_store.rows))
+        next_user = next(user_ids, None)
+
+        def record(report):
+            summary['users_with_drift'] += 1
+            summary['unpaid_gains'] += report['gains_non_verses']
+            summary['balance_adjustment'] += report['ajustement_solde']
+            writer.writerow(report)
+
+        def flush_repairs():
+            if not pending:
+                return
+            reports, day_repairs = {}, {}
+
+            def recheck(user_id):
+                def fix(u):
+                    report, repair_fix = reconcile_user(u, bet_store.page(user_id), bilan_days(user_id))
+                    if report is None:
+                        return u # écart résorbé depuis le parcours (pari ou réclamation en cours)
+                    reports[user_id] = report
+                    repair_fn, expected_days = repair_fix
+                    if expected_days is not None:
+                        day_repairs[user_id] = expected_days
+                    return repair_fn(u)
+                return fix
+
+            update_users_atomic({user_id: recheck(user_id) for user_id in pending})
+            replace_bilan_days(day_repairs) # bilans.csv ne change que sous settlement_lock(), tenu ici
+            for user_id in pending:
+                if user_id in reports:
+                    record(reports[user_id])
+                    summary['repaired_users'] += 1
+            pending.clear()
+
+        def check(user_id, bets):
+            user_p = user_store.rows.get(user_id) # lu sans copie : reconcile_user ne le modifie pas
+            if user_p is None:
+                return
+            summary['users'] += 1
+            report, fix = reconcile_user(user_p, bets, bilan_days(user_id))
+            if corrected_writer:
+                corrected_writer.writerow((fix[0](user_p.copy()) if fix else user_p).to_row())
+            if report is None:
+                return
+            if not repair:
+                record(report)
+                return
+            pending.append(user_id) # rapporté après revérification, tel que corrigé
+            if len(pending) >= LEDGER_REPAIR_BATCH_USERS:
+                flush_repairs()
+
+        for bets_user_id, bets in bets_by_user(work_dir, chunk_rows):
+            summary['bets'] += len(bets)
+            while next_user is not None and next_user < bets_user_id:
+                check(next_user, []) # utilisateur sans aucun pari
+                next_user = next(user_ids, None)
+            if next_user == bets_user_id:
+                check(next_user, bets)
+                next_user = next(user_ids, None)
+            else:
+                summary['orphan_bets'] += len(bets)
+        while next_user is not None:
+            check(next_user, [])
+            next_user = next(user_ids, None)
+        flush_repairs()
+    summary['seconds'] = round(time.perf_counter() - started, 1)
+    logging.info(f"Rapprochement : {summary['users_with_drift']} utilisateurs en écart sur {summary['users']}, "
+                 f"{summary['bets']} paris, {summary['repaired_users']} corrigés.")
+    return summary
+
+
+# --- Assets statiques ---
+# build_assets.py produit dans assets_dist/ des images réduites (PNG, WebP, AVIF) et des
+# copies précompressées (.gz, .br), toutes nommées d'après un hash de leur contenu.
+# asset_url() les référence depuis les templates (repli sur /static/ sans build) ; la
+# route /assets/ choisit la variante selon Accept / Accept-Encoding et les sert avec un
+# cache immuable. index.html est rendu une fois puis gardé compressé en mémoire.
+ASSETS_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+IMAGE_VARIANTS = [('image/avif', '.avif'), ('image/webp', '.webp')]
+
+def _load_assets_manifest():
+    try:
+        with open(os.path.join(ASSETS_DIR, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logging.warning("assets_dist/manifest.json absent (lancer build_assets.py) : images servies en taille originale.")
+    except ValueError as e:
+        logging.error(f"Manifest des assets illisible: {e}")
+    return {}
+
+assets_manifest = _load_assets_manifest()
+
+@app.template_global()
+def asset_url(filename):
+    hashed_name = assets_manifest.get(filename)
+    if hashed_name:
+        return url_for('asset_route', filename=hashed_name)
+    return url_for('static', filename=filename)
+
+def _accepts_encoding(encoding):
+    return request.accept_encodings[encoding] > 0
+
+@app.route('/assets/<path:filename>')
+def asset_route(filename):
+    served_name, content_encoding = filename, None
+    accept = request.headers.get('Accept', '')
+    stem, ext = os.path.splitext(filename)
+    if ext == '.png':
+        # Seuls les navigateurs qui annoncent le format explicitement le reçoivent (*/* ne suffit pas).
+        for mimetype, variant_ext in IMAGE_VARIANTS:
+            if mimetype in accept and os.path.exists(os.path.join(ASSETS_DIR, stem + variant_ext)):
+                served_name = stem + variant_ext
+                break
+    else:
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if _accepts_encoding(encoding) and os.path.exists(os.path.join(ASSETS_DIR, filename + suffix)):
+                served_name, content_encoding = filename + suffix, encoding
+                break
+    response = send_from_directory(ASSETS_DIR, served_name, max_age=31536000,
+                                   mimetype=mimetypes.guess_type(served_name if not content_encoding else filename)[0])
+    response.headers['Cache-Control'] = ASSETS_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept' if ext == '.png' else 'Accept-Encoding'
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    return response
+
+class RenderedPage:
+    """Page rendue une fois, avec ses versions gzip et brotli et son ETag."""
+
+    def __init__(self, html):
+        self.body = html.encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:16]
+        self.encoded = {'gzip': gzip.compress(self.body, compresslevel=9)}
+        if brotli:
+            self.encoded['br'] = brotli.compress(self.body, quality=11)
+
+    def response(self):
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            encoding = next((enc for enc in ('br', 'gzip') if enc in self.encoded and _accepts_encoding(enc)), None)
+            response = Response(self.encoded[encoding] if encoding else self.body, mimetype='text/html')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag)
+        response.headers['Cache-Control'] = 'no-cache' # revalidé à chaque ouverture, mais 304 tant qu'il n'a pas changé
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+# Une page par base d'API : MINI_APP_URL, ou à défaut la racine de la requête, qui suit
+# l'en-tête Host du client. Seules les RENDERED_PAGES_MAX plus récemment servies sont
+# gardées, sinon des Host arbitraires feraient grossir le cache sans limite.
+RENDERED_PAGES_MAX = 8
+rendered_pages = OrderedDict()
+rendered_pages_lock = threading.Lock()
+
+def rendered_page(api_url_base):
+    with rendered_pages_lock:
+        page = rendered_pages.get(api_url_base)
+        if page is not None:
+            rendered_pages.move_to_end(api_url_base)
+        return page
+
+def store_rendered_page(api_url_base, page):
+    with rendered_pages_lock:
+        rendered_pages[api_url_base] = page
+        rendered_pages.move_to_end(api_url_base)
+        while len(rendered_pages) > RENDERED_PAGES_MAX:
+            rendered_pages.popitem(last=False)
+    return page
+
+# --- Réponses JSON ---
+# Les routes de listes (matchs, paris) encodent avec orjson quand il est installé,
+# compressent (brotli ou gzip selon Accept-Encoding) au-delà de JSON_COMPRESS_MIN_BYTES
+# et, avec ?format=columns, renvoient {columns, rows} : les noms de colonnes une seule
+# fois puis une liste de valeurs par ligne.
+def encode_json(data):
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def to_columns(rows, columns):
+    return {"columns": columns, "rows": [[row.get(col) for col in columns] for row in rows]}
+
+def wants_columns():
+    return request.args.get('format') == 'columns'
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def json_bytes_response(body, status=200, variants=None):
+    """Réponse JSON depuis un corps déjà encodé ; variants garde les versions compressées d'un corps en cache."""
+    encoding = None
+    if len(body) >= JSON_COMPRESS_MIN_BYTES:
+        encoding = next((enc for enc in ('br', 'gzip') if (enc != 'br' or brotli) and _accepts_encoding(enc)), None)
+    if encoding:
+        compressed = variants.get(encoding) if variants is not None else None
+        if compressed is None:
+            compressed = _compress(body, encoding)
+            if variants is not None:
+                variants[encoding] = compressed
+        body = compressed
+    response = Response(body, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+# --- Mesure des requêtes ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # Libellé de route par règle (/assets/<path:filename>), pas par URL, pour borner le nombre de séries.
+    route = request.url_rule.rule if request.url_rule else 'inconnue'
+    if 'request_started' in g:
+        HTTP_REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - g.request_started)
+    HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    return response
+
+@app.route('/metrics')
+def metrics_route():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Non autorisé"}), 401
+    return Response(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
+
 # --- Routes de l'Application ---
 @app.route('/')
 def index_route(): 
     api_url_base = os.getenv("MINI_APP_URL", request.url_root.rstrip('/'))
-    if "MINI_APP_URL" not in os.environ:
-        logging.warning(f"MINI_APP_URL non trouvée dans .env, utilisation de request.url_root: {api_url_base}")
-    return render_template('index.html', api_base_url=api_url_base)
+    page = rendered_page(api_url_base)
+    cache_lookup('index_html', page is not None and not app.debug)
+    if page is None or app.debug:
+        if "MINI_APP_URL" not in os.environ:
+            logging.warning(f"MINI_APP_URL non trouvée dans .env, utilisation de request.url_root: {api_url_base}")
+        page = store_rendered_page(api_url_base, RenderedPage(render_template('index.html', api_base_url=api_url_base)))
+    return page.response()
 
 # --- API Routes ---
-@app.route('/api/user_profile', methods=['GET'])
-def get_user_profile_route():
-    user_id = request.args.get('user_id')
-    if not user_id:
-        return jsonify({"error": "user_id manquant"}), 400
+def _get_or_create_user_profile(user_id, args):
+    """Profil de user_id, infos Telegram (tg_*) de `args` mises à jour ; créé s'il n'existe pas.
 
+    Renvoie (profil, code HTTP) ; profil vaut None si la mise à jour a échoué.
+    """
     user_profile = get_user(user_id)
 
     if user_profile:
-        tg_first_name_arg = request.args.get('tg_first_name')
-        tg_last_name_arg = request.args.get('tg_last_name')
-        tg_username_arg = request.args.get('tg_username')
+        tg_first_name_arg = args.get('tg_first_name')
+        tg_last_name_arg = args.get('tg_last_name')
+        tg_username_arg = args.get('tg_username')
         
         updates_needed = {}
         if tg_first_name_arg and user_profile.get('telegram_first_name') != tg_first_name_arg:
@@ -288,15 +3480,13 @@ def get_user_profile_route():
             updated_profile = update_user_atomic(user_id, update_tg_info)
             if updated_profile:
                 logging.info(f"Informations Telegram mises à jour pour {user_id}")
-                return jsonify(updated_profile) 
-            else: 
-                return jsonify({"error": "Erreur lors de la mise à jour des infos Telegram"}), 500
+            return updated_profile, (200 if updated_profile else 500)
         
-        return jsonify(user_profile)
+        return user_profile, 200
     else:
-        tg_first_name = request.args.get('tg_first_name', '')
-        tg_last_name = request.args.get('tg_last_name', '')
-        tg_username = request.args.get('tg_username', '')
+        tg_first_name = args.get('tg_first_name', '')
+        tg_last_name = args.get('tg_last_name', '')
+        tg_username = args.get('tg_username', '')
 
         default_pseudo = f"User_{user_id[:6]}"
         if tg_username:
@@ -308,7 +3498,7 @@ def get_user_profile_route():
             'user_id': user_id, 'pseudo': default_pseudo, 
             'join_date': date.today().isoformat(), 'xp': 0, 'level': 1, 'email': '', 
             'pronocoins_balance': PRONOCOINS_INITIAL_BALANCE, 'last_daily_reward_date': '',
-            'unlocked_pronos': '', 'bet_count': 0,
+            'unlocked_pronos': '', 'bet_count': 0, 'gains_verses': 0,
             'last_ad_reward_timestamp': '0.0',
             'telegram_first_name': tg_first_name, 
             'telegram_last_name': tg_last_name,
@@ -320,26 +3510,33 @@ def get_user_profile_route():
         if default_pseudo != f"User_{user_id[:6]}":
              new_user_data_dict[TASKS_CONFIG['pseudo']['claimed_field']] = 'true' 
             
-        append_to_csv(USERS_FILE, new_user_data_dict, USERS_HEADER)
+        user_store.add_row(new_user_data_dict)
         logging.info(f"Nouvel utilisateur créé via API : {user_id} avec pseudo {default_pseudo}")
-        return jsonify(_convert_user_types(new_user_data_dict)), 201
+        return UserRecord.from_row(new_user_data_dict), 201
+
+@app.route('/api/user_profile', methods=['GET'])
+def get_user_profile_route():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "user_id manquant"}), 400
+
+    user_profile, status = _get_or_create_user_profile(user_id, request.args)
+    if user_profile is None:
+        return jsonify({"error": "Erreur lors de la mise à jour des infos Telegram"}), status
+    return jsonify(user_profile.to_dict()), status
 
 @app.route('/api/matchs_csv', methods=['GET'])
 def get_matchs_csv_route():
-    pronostics = read_csv_as_list_of_dicts(MATCHES_FILE, use_cache=True, cache_var_name="matches_cache", cache_ts_name="matches_cache_timestamp", cache_duration=MATCHES_CACHE_DURATION)
     date_filter = request.args.get('date') 
 
     if date_filter:
         try:
             datetime.strptime(date_filter, "%Y-%m-%d") 
-            pronostics_a_venir = [p for p in pronostics if p.get('Statut', '').lower() == 'à venir' and p.get('Date') == date_filter]
         except ValueError:
             return jsonify({"error": "Format de date invalide. Utilisez AAAA-MM-JJ."}), 400
-    else:
-        pronostics_a_venir = [p for p in pronostics if p.get('Statut', '').lower() == 'à venir']
     
-    pronostics_a_venir.sort(key=lambda x: (x.get('Date', 'zzzz'), x.get('Heure', '99:99'))) 
-    return jsonify(pronostics_a_venir)
+    variants = match_catalog.encoded_upcoming(date_filter, wants_columns())
+    return json_bytes_response(variants[None], variants=variants)
 
 @app.route('/api/parier', methods=['POST'])
 def post_parier_route():
@@ -358,10 +3555,11 @@ def post_parier_route():
         if user_p['pronocoins_balance'] < montant_pari:
             raise ValueError("Solde insuffisant") 
 
-        pronostics = read_csv_as_list_of_dicts(MATCHES_FILE, use_cache=True, cache_var_name="matches_cache", cache_ts_name="matches_cache_timestamp", cache_duration=MATCHES_CACHE_DURATION)
-        match_info = next((p for p in pronostics if p['MatchID'] == match_id and p.get('Statut', '').lower() == 'à venir'), None)
+        match_info = match_catalog.get_upcoming(match_id)
         if not match_info:
             raise ValueError("Match non trouvé ou non disponible")
+        if not match_catalog.betting_open(match_id, datetime.now(timezone.utc)):
+            raise ValueError("Paris fermés : le match a commencé")
         
         if match_id not in user_p.get('unlocked_pronos', []):
             raise ValueError("Pronostic non débloqué")
@@ -383,13 +3581,18 @@ def post_parier_route():
             'CotePari': match_info.get('Cote', 'N/A'), 'BetType': match_info.get('Pari', 'N/A'),
             'CoteGagnante': '', 'Gain': 0
         }
-        append_to_csv(PARIS_FILE, nouveau_pari, PARIS_HEADER)
+        bet_store.add(nouveau_pari)
+        placed_bets.append(nouveau_pari)
         return user_p
 
+    placed_bets = []
     try:
         updated_user = update_user_atomic(user_id, update_bet_logic)
         if updated_user:
+            BETS_PLACED.inc()
             logging.info(f"Pari de {montant_pari} PC placé par {user_id} sur {match_id}.")
+            for bet in placed_bets:
+                queue_notification('bet_placed', user_id, **{col: bet[col] for col in ('MatchID', 'MatchName', 'Montant', 'CotePari', 'BetType')})
             return jsonify({
                 "message": "Pari placé avec succès!",
                 "new_balance": updated_user['pronocoins_balance'],
@@ -415,8 +3618,11 @@ def unlock_prono_route():
     if not all([user_id, match_id]):
         return jsonify({"error": "user_id ou match_id manquant"}), 400
 
+    newly_unlocked = False
+
     def update_unlock_logic(user_p):
-        if match_id in user_p.get('unlocked_pronos', []):
+        nonlocal newly_unlocked
+        if match_id in user_p['unlocked_pronos']:
             return user_p 
 
         if user_p['pronocoins_balance'] < PRONOCOINS_UNLOCK_COST:
@@ -424,21 +3630,23 @@ def unlock_prono_route():
 
         user_p['pronocoins_balance'] -= PRONOCOINS_UNLOCK_COST
         user_p['xp'] += XP_PER_UNLOCK
-        if match_id not in user_p['unlocked_pronos']: 
-             user_p['unlocked_pronos'].append(match_id)
+        user_p['unlocked_pronos'].add(match_id)
         user_p, _ = check_and_apply_level_up(user_p)
+        newly_unlocked = True
         return user_p
 
     try:
         updated_user = update_user_atomic(user_id, update_unlock_logic)
         if updated_user:
+            if newly_unlocked:
+                PRONOS_UNLOCKED.inc()
             logging.info(f"Pronostic {match_id} débloqué par {user_id}.")
             return jsonify({
                 "message": "Pronostic débloqué avec succès!",
                 "new_balance": updated_user['pronocoins_balance'],
                 "new_xp": updated_user['xp'],
                 "new_level": updated_user['level'],
-                "unlocked_pronos": updated_user['unlocked_pronos']
+                "unlocked_pronos": list(updated_user['unlocked_pronos'])
             }), 200
         else:
             return jsonify({"error": "Utilisateur non trouvé"}), 404
@@ -453,6 +3661,9 @@ def claim_daily_reward_route():
     data = request.json
     user_id = data.get('user_id')
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
+    if reward_cooldowns.daily_claimed(user_id, date.today().isoformat()):
+        REWARDS_REFUSED_EARLY.labels('daily').inc()
+        return jsonify({"error": "Récompense quotidienne déjà réclamée"}), 403
 
     def update_daily_reward_logic(user_p):
         today_str = date.today().isoformat()
@@ -468,6 +3679,7 @@ def claim_daily_reward_route():
     try:
         updated_user = update_user_atomic(user_id, update_daily_reward_logic)
         if updated_user:
+            REWARDS_GRANTED.labels('daily').inc()
             logging.info(f"Récompense quotidienne réclamée par {user_id}.")
             return jsonify({
                 "message": f"Récompense de {PRONOCOINS_DAILY_REWARD} PC et {XP_PER_DAILY_REWARD} XP réclamée!",
@@ -489,14 +3701,17 @@ def claim_ad_reward_route():
     data = request.json
     user_id = data.get('user_id')
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
+    remaining_time = reward_cooldowns.ad_remaining(user_id, time.time())
+    if remaining_time > 0:
+        REWARDS_REFUSED_EARLY.labels('ad').inc()
+        return jsonify({"error": ad_cooldown_message(remaining_time)}), 403
 
     def update_ad_reward_logic(user_p):
         current_timestamp = time.time()
         last_ad_timestamp = user_p.get('last_ad_reward_timestamp', 0.0)
 
         if (current_timestamp - last_ad_timestamp) < AD_REWARD_COOLDOWN_SECONDS:
-            remaining_time = AD_REWARD_COOLDOWN_SECONDS - (current_timestamp - last_ad_timestamp)
-            raise ValueError(f"Veuillez attendre encore {int(remaining_time // 60)} min {int(remaining_time % 60)} sec avant la prochaine récompense publicitaire.")
+            raise ValueError(ad_cooldown_message(AD_REWARD_COOLDOWN_SECONDS - (current_timestamp - last_ad_timestamp)))
 
         user_p['pronocoins_balance'] += PRONOCOINS_AD_REWARD
         user_p['xp'] += XP_PER_AD_WATCH
@@ -507,6 +3722,7 @@ def claim_ad_reward_route():
     try:
         updated_user = update_user_atomic(user_id, update_ad_reward_logic)
         if updated_user:
+            REWARDS_GRANTED.labels('ad').inc()
             logging.info(f"Récompense publicitaire réclamée par {user_id}.")
             return jsonify({
                 "message": f"Vous avez gagné {PRONOCOINS_AD_REWARD} PC et {XP_PER_AD_WATCH} XP pour avoir regardé la publicité !",
@@ -535,9 +3751,10 @@ def update_pseudo_route():
         return jsonify({"error": "Le pseudo doit contenir entre 3 et 20 caractères."}), 400
     
     message_response = "Pseudo mis à jour avec succès!"
+    reward_granted = False
 
     def update_pseudo_logic(user_p):
-        nonlocal message_response 
+        nonlocal message_response, reward_granted
         user_p['pseudo'] = new_pseudo
         
         task_info = TASKS_CONFIG['pseudo']
@@ -548,11 +3765,14 @@ def update_pseudo_route():
             user_p['xp'] += task_info['xp_reward']
             user_p, _ = check_and_apply_level_up(user_p)
             message_response = f"Pseudo mis à jour! Récompense '{task_info['pc_reward']} PC, {task_info['xp_reward']} XP' obtenue!"
+            reward_granted = True
         return user_p
 
     try:
         updated_user = update_user_atomic(user_id, update_pseudo_logic)
         if updated_user:
+            if reward_granted:
+                REWARDS_GRANTED.labels('pseudo').inc()
             logging.info(f"Pseudo mis à jour pour {user_id} en '{new_pseudo}'.")
             return jsonify({
                 "message": message_response,
@@ -580,8 +3800,10 @@ def link_google_account_route():
     simulated_email = f"{pseudo_for_email}@pronobot.dev"
 
 
+    reward_granted = False
+
     def link_google_logic(user_p):
-        nonlocal message_response, simulated_email
+        nonlocal message_response, simulated_email, reward_granted
         if user_p.get('email'): 
             message_response = f"Compte déjà lié à {user_p['email']}."
             return user_p
@@ -595,11 +3817,14 @@ def link_google_account_route():
             user_p['xp'] += task_info['xp_reward']
             user_p, _ = check_and_apply_level_up(user_p)
             message_response = f"Compte Google lié à {simulated_email}! Récompense '{task_info['pc_reward']} PC, {task_info['xp_reward']} XP' obtenue!"
+            reward_granted = True
         return user_p
 
     try:
         updated_user = update_user_atomic(user_id, link_google_logic)
         if updated_user:
+            if reward_granted:
+                REWARDS_GRANTED.labels('google').inc()
             logging.info(f"Liaison Google (simulée) pour {user_id} avec email {updated_user['email']}.")
             return jsonify({
                 "message": message_response,
@@ -622,6 +3847,9 @@ def get_tasks_status_route():
     user_profile = get_user(user_id)
     if not user_profile: return jsonify({"error": "Utilisateur non trouvé"}), 404
 
+    return jsonify(_tasks_status(user_profile)), 200
+
+def _tasks_status(user_profile):
     tasks_status_response = []
     for task_id, config in TASKS_CONFIG.items():
         is_claimed = user_profile.get(config['claimed_field'], False)
@@ -645,7 +3873,7 @@ def get_tasks_status_route():
             "target_progress": config.get('condition_bet_count') if task_id == 'three_bets' else None,
             "link": config.get('link') 
         })
-    return jsonify(tasks_status_response), 200
+    return tasks_status_response
 
 @app.route('/api/claim_task_reward', methods=['POST'])
 def claim_task_reward_route():
@@ -685,6 +3913,7 @@ def claim_task_reward_route():
     try:
         updated_user = update_user_atomic(user_id, claim_task_logic)
         if updated_user:
+            REWARDS_GRANTED.labels(task_id_to_claim).inc()
             logging.info(f"Récompense pour tâche '{task_id_to_claim}' réclamée par {user_id}.")
             return jsonify({
                 "message": f"Récompense pour '{TASKS_CONFIG[task_id_to_claim]['name']}' réclamée! (+{task_config['pc_reward']} PC, +{task_config['xp_reward']} XP)",
@@ -710,23 +3939,8 @@ def toggle_suivi_prono_route():
     match_id = data.get('match_id')
     if not user_id or not match_id: return jsonify({"error": "user_id ou match_id manquant"}), 400
 
-    suivis = read_csv_as_list_of_dicts(SUIVIS_FILE)
-    is_currently_followed = any(s['user_id'] == user_id and s['MatchID'] == match_id for s in suivis)
-    
-    new_suivis_data = []
-    action_message = ""
-
-    if is_currently_followed:
-        new_suivis_data = [s for s in suivis if not (s['user_id'] == user_id and s['MatchID'] == match_id)]
-        action_message = "Pronostic retiré des suivis."
-    else:
-        new_suivis_data = list(suivis) 
-        new_suivis_data.append({'user_id': user_id, 'MatchID': match_id, 'date_suivi': datetime.now(timezone.utc).isoformat()})
-        action_message = "Pronostic ajouté aux suivis."
-        
-    write_csv_from_list_of_dicts(SUIVIS_FILE, new_suivis_data, SUIVIS_HEADER)
-    
-    user_suivis_ids = [s['MatchID'] for s in new_suivis_data if s['user_id'] == user_id]
+    is_now_followed, user_suivis_ids = follow_store.toggle(user_id, match_id)
+    action_message = "Pronostic ajouté aux suivis." if is_now_followed else "Pronostic retiré des suivis."
     
     return jsonify({"message": action_message, "pronos_suivis_ids": user_suivis_ids}), 200
 
@@ -736,112 +3950,93 @@ def get_pronos_suivis_route():
     user_id = request.args.get('user_id')
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
 
-    suivis = read_csv_as_list_of_dicts(SUIVIS_FILE)
-    user_suivis_ids = [s['MatchID'] for s in suivis if s['user_id'] == user_id]
-    
-    all_pronos = read_csv_as_list_of_dicts(MATCHES_FILE, use_cache=True, cache_var_name="matches_cache", cache_ts_name="matches_cache_timestamp", cache_duration=MATCHES_CACHE_DURATION)
-    pronos_suivis_details = [p for p in all_pronos if p['MatchID'] in user_suivis_ids and p.get('Statut','').lower() == 'à venir']
-    pronos_suivis_details.sort(key=lambda x: (x.get('Date', 'zzzz'), x.get('Heure', '99:99')))
+    return jsonify(_pronos_suivis_details(user_id)), 200
 
-    return jsonify(pronos_suivis_details), 200
+def _pronos_suivis_details(user_id):
+    user_suivis_ids = set(follow_store.followed_ids(user_id))
+    return [p for p in match_catalog.upcoming() if p['MatchID'] in user_suivis_ids]
+
+def _paris_page_response(user_id, **criteria):
+    """Paris de user_id du plus récent au plus ancien, filtrés par date (date, ou from/to en AAAA-MM-JJ).
+
+    Avec limit ou before, renvoie une page {paris, next_before} : next_before est le curseur
+    ("DatePari|bet_id" du dernier pari de la page) à repasser en before pour la page suivante ;
+    le bet_id départage les paris de même DatePari. Un before réduit à une date reste accepté.
+    Sans ces paramètres, renvoie la liste complète comme avant. format=columns renvoie
+    les paris au format {columns, rows}.
+    """
+    date_filter = request.args.get('date')
+    date_from = request.args.get('from', date_filter)
+    date_to = request.args.get('to', date_filter)
+    before = request.args.get('before')
+    paginated = 'limit' in request.args or before is not None
+    try:
+        limit = min(max(int(request.args.get('limit', PARIS_PAGE_SIZE)), 1), PARIS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit doit être un entier"}), 400
+    upper = None
+    if before:
+        before_date, _, before_bet_id = before.partition('|')
+        upper = (before_date, before_bet_id) if before_bet_id else (before_date,)
+    try:
+        if date_from:
+            datetime.strptime(date_from, "%Y-%m-%d")
+        if date_to:
+            day_after = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            upper = min(upper, (day_after,)) if upper else (day_after,)
+    except ValueError:
+        return jsonify({"error": "Format de date invalide. Utilisez AAAA-MM-JJ."}), 400
+
+    paris = bet_store.page(user_id, lower=date_from, upper=upper, limit=limit + 1 if paginated else None, **criteria)
+    encode_rows = (lambda rows: to_columns(rows, PARIS_HEADER)) if wants_columns() else (lambda rows: rows)
+    if not paginated:
+        return json_bytes_response(encode_json(encode_rows(paris)))
+    next_before = '|'.join(_bet_key(paris[limit - 1])) if len(paris) > limit else None
+    return json_bytes_response(encode_json({"paris": encode_rows(paris[:limit]), "next_before": next_before}))
 
 @app.route('/api/paris_en_cours', methods=['GET']) 
 def get_paris_en_cours_route():
     user_id = request.args.get('user_id')
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
     
-    paris = read_csv_as_list_of_dicts(PARIS_FILE)
-    paris_en_cours = [p for p in paris if p['user_id'] == user_id and p.get('StatutPari','').lower() == 'en_cours']
-    paris_en_cours.sort(key=lambda x: x.get('DatePari', ''), reverse=True) 
-    return jsonify(paris_en_cours), 200
+    return _paris_page_response(user_id, StatutPari='en_cours')
 
 @app.route('/api/historique_paris', methods=['GET']) 
 def get_historique_paris_route():
     user_id = request.args.get('user_id')
-    date_filter = request.args.get('date') 
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
 
-    paris = read_csv_as_list_of_dicts(PARIS_FILE)
-    user_all_paris = [p for p in paris if p['user_id'] == user_id] 
-    
-    if date_filter:
-        try:
-            datetime.strptime(date_filter, "%Y-%m-%d")
-            user_all_paris = [p for p in user_all_paris if p.get('DatePari','').startswith(date_filter)]
-        except ValueError:
-            return jsonify({"error": "Format de date invalide. Utilisez AAAA-MM-JJ."}), 400
-
-    user_all_paris.sort(key=lambda x: x.get('DatePari', ''), reverse=True)
-    return jsonify(user_all_paris), 200
+    return _paris_page_response(user_id)
 
 @app.route('/api/bilan', methods=['GET'])
 def get_bilan_route():
     user_id = request.args.get('user_id')
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
 
-    paris = read_csv_as_list_of_dicts(PARIS_FILE)
-    user_paris_termines = [p for p in paris if p['user_id'] == user_id and p.get('StatutPari','').lower() in ['gagne', 'perdu']] 
+    return jsonify(_bilan(get_user(user_id) or UserRecord.from_row({'user_id': user_id}))), 200
 
-    total_bets = len(user_paris_termines)
-    won_bets = len([p for p in user_paris_termines if p.get('StatutPari','').lower() == 'gagne'])
-    lost_bets = total_bets - won_bets
-    
-    net_gains = 0
-    total_staked_on_settled = 0
-    for p in user_paris_termines:
-        try:
-            montant = int(p.get('Montant', 0))
-            total_staked_on_settled += montant
-            if p.get('StatutPari','').lower() == 'gagne':
-                gain_pari_net = int(p.get('Gain', 0)) 
-                net_gains += gain_pari_net
-            elif p.get('StatutPari','').lower() == 'perdu':
-                net_gains -= montant 
-        except ValueError:
-            logging.warning(f"Donnée de pari invalide pour le bilan de l'utilisateur {user_id}: {p}")
+def _bilan(user_p):
+    total_bets = user_p['bilan_paris_regles']
+    won_bets = user_p['bilan_paris_gagnes']
+    net_gains = user_p['bilan_gains_nets']
+    total_staked_on_settled = user_p['bilan_mises_reglees']
 
     roi = (net_gains / total_staked_on_settled * 100) if total_staked_on_settled > 0 else 0
 
-    return jsonify({
+    return {
         "totalBets": total_bets,
         "wonBets": won_bets,
-        "lostBets": lost_bets,
+        "lostBets": total_bets - won_bets,
         "netGains": round(net_gains, 2),
         "roi": round(roi, 2)
-    }), 200
+    }
 
 @app.route('/api/bilan_chart_data', methods=['GET'])
 def get_bilan_chart_data_route():
     user_id = request.args.get('user_id')
     if not user_id: return jsonify({"error": "user_id manquant"}), 400
 
-    paris = read_csv_as_list_of_dicts(PARIS_FILE)
-    user_paris_regles = [p for p in paris if p['user_id'] == user_id and p.get('StatutPari','').lower() in ['gagne', 'perdu']]
-    
-    user_paris_regles.sort(key=lambda x: x.get('DatePari', ''))
-
-    daily_stats = defaultdict(lambda: {"gagnes": 0, "perdus": 0, "pnl_jour": 0, "paris_regles": 0})
-    
-    for p in user_paris_regles:
-        try:
-            date_pari_str = p.get('DatePari', '').split('T')[0] 
-            if not date_pari_str: continue
-
-            montant = int(p.get('Montant', 0))
-            daily_stats[date_pari_str]["paris_regles"] += 1
-
-            if p.get('StatutPari','').lower() == 'gagne':
-                daily_stats[date_pari_str]["gagnes"] += 1
-                gain_net_pari = int(p.get('Gain', 0)) 
-                daily_stats[date_pari_str]["pnl_jour"] += gain_net_pari
-            elif p.get('StatutPari','').lower() == 'perdu':
-                daily_stats[date_pari_str]["perdus"] += 1
-                daily_stats[date_pari_str]["pnl_jour"] -= montant
-        except ValueError:
-            logging.warning(f"Donnée de pari invalide pour le graphique bilan de {user_id}: {p}")
-            continue
-
-    sorted_dates = sorted(daily_stats.keys())
+    daily_stats = bilan_days(user_id)
     
     labels = []
     data_gagnes = []
@@ -850,13 +4045,13 @@ def get_bilan_chart_data_route():
     data_pnl_cumule = []
     pnl_cumulatif_actuel = 0
 
-    for dt_str in sorted_dates:
+    for dt_str in sorted(daily_stats):
+        gagnes, perdus, pnl_jour = daily_stats[dt_str]
         labels.append(datetime.strptime(dt_str, "%Y-%m-%d").strftime("%d/%m")) 
-        stats_jour = daily_stats[dt_str]
-        data_gagnes.append(stats_jour["gagnes"])
-        data_perdus.append(stats_jour["perdus"])
-        data_paris_regles.append(stats_jour["paris_regles"])
-        pnl_cumulatif_actuel += stats_jour["pnl_jour"]
+        data_gagnes.append(gagnes)
+        data_perdus.append(perdus)
+        data_paris_regles.append(gagnes + perdus)
+        pnl_cumulatif_actuel += pnl_jour
         data_pnl_cumule.append(pnl_cumulatif_actuel)
 
     return jsonify({
@@ -870,24 +4065,145 @@ def get_bilan_chart_data_route():
 
 @app.route('/api/leaderboard', methods=['GET'])
 def get_leaderboard_route():
-    users = read_csv_as_list_of_dicts(USERS_FILE)
-    leaderboard_data = []
-    for u in users:
+    try:
+        limit = min(max(int(request.args.get('limit', LEADERBOARD_PAGE_SIZE)), 1), LEADERBOARD_MAX_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit et offset doivent être des entiers"}), 400
+    user_id = request.args.get('user_id')
+
+    def leaderboard_entry(uid, rank):
+        u = user_store.rows[uid]
+        return {
+            'rank': rank,
+            'user_id': uid,
+            'pseudo': u.get('pseudo', 'N/A'),
+            'level': int(u.get('level', 1)),
+            'xp': int(u.get('xp', 0)),
+            'pronocoins_balance': int(u.get('pronocoins_balance', 0)),
+            'join_date': u.get('join_date', '') 
+        }
+
+    with user_store.lock:
+        user_store.sync()
+        leaderboard_data = [leaderboard_entry(uid, offset + i + 1) for i, uid in enumerate(leaderboard.page(offset, limit))]
+        if not user_id:
+            return jsonify(leaderboard_data)
+
+        # Avec user_id : page demandée + rang de l'utilisateur appelant.
+        user_rank = leaderboard.rank_of(user_id)
+        return jsonify({
+            "leaderboard": leaderboard_data,
+            "user_rank": leaderboard_entry(user_id, user_rank) if user_rank else None,
+            "total_users": len(leaderboard)
+        })
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_route():
+    """Flux Server-Sent Events : événements "user" (solde, XP, niveau), "match" (Statut) et "resync"."""
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "user_id manquant"}), 400
+
+    row = user_store.get_row(user_id)
+    subscription = event_hub.subscribe(user_id, row)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate():
         try:
-            leaderboard_data.append({
-                'user_id': u['user_id'],
-                'pseudo': u.get('pseudo', 'N/A'),
-                'level': int(u.get('level', 1)),
-                'xp': int(u.get('xp', 0)),
-                'pronocoins_balance': int(u.get('pronocoins_balance', 0)),
-                'join_date': u.get('join_date', '') 
-            })
-        except ValueError:
-            logging.warning(f"Donnée utilisateur invalide pour le classement: {u}")
-    
-    leaderboard_data.sort(key=lambda x: (x['pronocoins_balance'], x['level'], x['xp']), reverse=True)
-    
-    return jsonify(leaderboard_data[:20]) 
+            yield "retry: 5000\n\n"
+            if row is not None:
+                yield sse('user', EventHub.user_values(row))
+            while True:
+                item = subscription.next(SSE_HEARTBEAT_SECONDS)
+                if item is None:
+                    yield ": ping\n\n" # garde la connexion ouverte à travers les proxys
+                elif item is Subscription.RESYNC:
+                    yield sse('resync', {})
+                    return
+                else:
+                    yield sse(*item)
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap_route():
+    """Tout ce que la Mini App charge au démarrage, en une seule réponse.
+
+    Réunit /api/user_profile (mêmes paramètres tg_*, création comprise), /api/tasks_status,
+    /api/pronos_suivis, /api/matchs_csv, /api/bilan et /api/paris_en_cours ; la ligne
+    utilisateur n'est lue qu'une fois pour le profil, les tâches et le bilan.
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "user_id manquant"}), 400
+
+    user_profile, status = _get_or_create_user_profile(user_id, request.args)
+    if user_profile is None:
+        return jsonify({"error": "Erreur lors de la mise à jour des infos Telegram"}), status
+
+    return jsonify({
+        "user_profile": user_profile.to_dict(),
+        "tasks_status": _tasks_status(user_profile),
+        "pronos_suivis": _pronos_suivis_details(user_id),
+        "matchs": match_catalog.upcoming(),
+        "bilan": _bilan(user_profile),
+        "paris_en_cours": bet_store.page(user_id, StatutPari='en_cours')
+    }), status
+
+
+# --- Commandes CLI (flask --app app <commande>) ---
+@app.cli.command('settle')
+@click.argument('results_file', type=click.Path(exists=True, dir_okay=False))
+def settle_command(results_file):
+    """Règle les paris à partir d'un CSV MatchID,Resultat (gagne/perdu)."""
+    with open(results_file, 'r', newline='', encoding='utf-8') as f:
+        results = {row['MatchID']: row['Resultat'] for row in csv.DictReader(f) if row.get('MatchID')}
+    try:
+        summary = settle_matches(results)
+    except ValueError as ve:
+        raise click.ClickException(str(ve))
+    click.echo(json.dumps(summary, ensure_ascii=False))
+
+@app.cli.command('ingest-matches')
+@click.argument('feed_file', type=click.Path(exists=True, dir_okay=False))
+def ingest_matches_command(feed_file):
+    """Intègre un lot du flux de matchs (CSV aux colonnes de matches.csv) : nouveaux matchs, cotes et statuts."""
+    with open(feed_file, 'r', newline='', encoding='utf-8') as f:
+        change_set = match_catalog.ingest(csv.DictReader(f))
+    click.echo(json.dumps(change_set, ensure_ascii=False))
+
+@app.cli.command('archive-paris')
+@click.option('--keep-months', type=int, default=PARIS_KEEP_MONTHS, show_default=True,
+              help="mois récents laissés dans les partitions vivantes")
+def archive_paris_command(keep_months):
+    """Déplace les paris réglés dans leurs partitions mensuelles et compresse les mois anciens."""
+    with settlement_lock():
+        archived = bet_store.archive(keep_months)
+    click.echo(json.dumps(archived))
+
+@app.cli.command('reconcile-ledger')
+@click.option('--report', 'report_file', type=click.Path(dir_okay=False), help="CSV des utilisateurs en écart")
+@click.option('--repair', is_flag=True, help="corrige bet_count, solde, unlocked_pronos et bilan des utilisateurs en écart")
+@click.option('--corrected-users', 'corrected_file', type=click.Path(dir_okay=False),
+              help="écrit un users.csv corrigé dans ce fichier, sans modifier les données")
+@click.option('--tmp-dir', type=click.Path(file_okay=False), help="dossier des paquets triés (défaut : dossier temporaire du système)")
+@click.option('--chunk-rows', type=int, default=LEDGER_SORT_CHUNK_ROWS, show_default=True, help="paris par paquet trié en mémoire")
+def reconcile_ledger_command(report_file, repair, tmp_dir, chunk_rows, corrected_file):
+    """Compare chaque utilisateur à ses paris (bet_count, pronos débloqués, gains versés) ; workers en marche."""
+    click.echo(json.dumps(reconcile_ledger(report_file, repair, tmp_dir, chunk_rows, corrected_file)))
+
+@app.cli.command('rebuild-bilans')
+def rebuild_bilans_command():
+    """Recalcule les bilans matérialisés de tous les utilisateurs depuis les paris réglés."""
+    click.echo(f"{rebuild_bilans()} bilans recalculés.")
 
 
 if __name__ == '__main__':
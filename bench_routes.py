@@ -0,0 +1,212 @@
+"""Benchmark de toutes les routes de app.py sur un jeu de données généré par generate_dataset.py.
+
+Le jeu de données est copié dans un dossier temporaire (les routes POST le modifient), puis
+chaque scénario envoie --requests requêtes par le client de test Flask, après --warmup
+requêtes d'échauffement non mesurées, sur --threads threads. Pour chaque route : latences
+p50/p95/p99, débit, codes HTTP obtenus et RSS maximal du process après la route. Le temps de
+démarrage (import de app, donc chargement des stores et, en SQLite, import des CSV) est
+mesuré à part. /api/stream (connexion longue) et /assets/ (dépend du build) ne sont pas mesurés.
+
+Chaque requête d'un scénario vise un utilisateur différent tiré du jeu de données, pour que
+les routes à usage unique (récompense quotidienne, tâches...) suivent leur chemin nominal ;
+les logs INFO de l'application sont coupés pendant les mesures (--verbose pour les garder).
+--json enregistre les résultats, --baseline les compare à un enregistrement précédent.
+
+Usage : python bench_routes.py [--data bench_data] [--requests 500] [--warmup 20] [--threads 1]
+        [--routes nom1,nom2] [--json FICHIER] [--baseline FICHIER] [--verbose]
+(PRONOZONE_STORAGE=sqlite pour mesurer le moteur SQLite)
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BASE_DIR, 'bench_data')
+DATA_FILES = ['users.csv', 'matches.csv', 'paris.csv', 'suivis.csv', 'bilans.csv']
+# En-têtes d'un navigateur récent : les réponses sont compressées comme en production.
+CLIENT_HEADERS = {'Accept': 'application/json, text/html, */*', 'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def _user(ctx, i):
+    return ctx['users'][i % len(ctx['users'])]
+
+
+def _match(ctx, i):
+    # Même match pour la même requête i dans unlock_prono et parier : le pari porte sur un prono débloqué.
+    return ctx['matches'][(i * 7) % len(ctx['matches'])] if ctx['matches'] else 'AUCUN'
+
+
+def _get(path):
+    return lambda client, ctx, i: client.get(path.format(user_id=_user(ctx, i), date=ctx['first_date'], i=i),
+                                             headers=CLIENT_HEADERS)
+
+
+def _post(path, body):
+    return lambda client, ctx, i: client.post(path, json=body(ctx, i), headers=CLIENT_HEADERS)
+
+
+# (nom, requête) dans l'ordre d'exécution ; unlock_prono précède parier.
+SCENARIOS = [
+    ('index', _get('/')),
+    ('user_profile', _get('/api/user_profile?user_id={user_id}')),
+    ('user_profile_creation', _get('/api/user_profile?user_id=bench_{i}&tg_username=bench{i}')),
+    ('bootstrap', _get('/api/bootstrap?user_id={user_id}')),
+    ('matchs_csv', _get('/api/matchs_csv')),
+    ('matchs_csv_colonnes', _get('/api/matchs_csv?format=columns')),
+    ('matchs_csv_date', _get('/api/matchs_csv?date={date}')),
+    ('tasks_status', _get('/api/tasks_status?user_id={user_id}')),
+    ('pronos_suivis', _get('/api/pronos_suivis?user_id={user_id}')),
+    ('paris_en_cours', _get('/api/paris_en_cours?user_id={user_id}')),
+    ('historique_paris', _get('/api/historique_paris?user_id={user_id}')),
+    ('historique_paris_page', _get('/api/historique_paris?user_id={user_id}&limit=20')),
+    ('bilan', _get('/api/bilan?user_id={user_id}')),
+    ('bilan_chart_data', _get('/api/bilan_chart_data?user_id={user_id}')),
+    ('leaderboard', _get('/api/leaderboard')),
+    ('leaderboard_utilisateur', _get('/api/leaderboard?user_id={user_id}&limit=1')),
+    ('unlock_prono', _post('/api/unlock_prono', lambda ctx, i: {'user_id': _user(ctx, i), 'match_id': _match(ctx, i)})),
+    ('parier', _post('/api/parier', lambda ctx, i: {'user_id': _user(ctx, i), 'match_id': _match(ctx, i)})),
+    ('toggle_suivi_prono', _post('/api/toggle_suivi_prono', lambda ctx, i: {'user_id': _user(ctx, i), 'match_id': _match(ctx, i)})),
+    ('claim_daily_reward', _post('/api/claim_daily_reward', lambda ctx, i: {'user_id': _user(ctx, i)})),
+    ('claim_ad_reward', _post('/api/claim_ad_reward', lambda ctx, i: {'user_id': _user(ctx, i)})),
+    ('claim_task_reward', _post('/api/claim_task_reward', lambda ctx, i: {'user_id': _user(ctx, i), 'task_id': 'tiktok'})),
+    ('update_pseudo', _post('/api/update_pseudo', lambda ctx, i: {'user_id': _user(ctx, i), 'pseudo': f"bench{i}"})),
+    ('link_google_account', _post('/api/link_google_account', lambda ctx, i: {'user_id': _user(ctx, i)})),
+]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024) # octets sous macOS, Ko ailleurs
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def run_scenario(app, ctx, request_fn, requests, warmup, threads):
+    local = threading.local()
+
+    def timed(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = request_fn(client, ctx, i)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        response.close()
+        return elapsed, response.status_code
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(timed, range(requests, requests + warmup)))
+        started = time.perf_counter()
+        results = list(pool.map(timed, range(requests)))
+        wall = time.perf_counter() - started
+    latencies = sorted(elapsed for elapsed, _ in results)
+    return {
+        'requests': requests,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'req_per_s': requests / wall if wall else float('inf'),
+        'statuses': dict(sorted(Counter(str(status) for _, status in results).items())),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=DEFAULT_DATA_DIR, help="dossier produit par generate_dataset.py")
+    parser.add_argument('--requests', type=int, default=500, help="requêtes mesurées par route")
+    parser.add_argument('--warmup', type=int, default=20, help="requêtes d'échauffement par route")
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--routes', help="scénarios à lancer, séparés par des virgules (défaut : tous)")
+    parser.add_argument('--json', help="fichier où enregistrer les résultats")
+    parser.add_argument('--baseline', help="résultats --json d'un run précédent, pour comparer les p50")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="garder les logs INFO de l'application")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.routes:
+        wanted = args.routes.split(',')
+        unknown = set(wanted) - {name for name, _ in SCENARIOS}
+        if unknown:
+            sys.exit(f"Scénarios inconnus : {', '.join(sorted(unknown))} (disponibles : {', '.join(name for name, _ in SCENARIOS)})")
+        scenarios = [(name, fn) for name, fn in SCENARIOS if name in wanted]
+    missing = [name for name in DATA_FILES if not os.path.exists(os.path.join(args.data, name))]
+    if missing:
+        sys.exit(f"{', '.join(missing)} absent(s) de {args.data} : lancer d'abord generate_dataset.py.")
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['routes']
+
+    data_dir = tempfile.mkdtemp(prefix='pronozone_bench_')
+    for name in DATA_FILES:
+        shutil.copy(os.path.join(args.data, name), data_dir)
+    os.environ['PRONOZONE_DATA_DIR'] = data_dir
+    sys.path.insert(0, BASE_DIR)
+    try:
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        import app
+        if not os.path.exists(os.path.join(app.app.root_path, app.app.template_folder, 'index.html')):
+            app.app.template_folder = BASE_DIR # index.html à la racine du dépôt, hors déploiement
+        app.user_store.all_rows()
+        app.match_catalog.refresh()
+        startup_s = time.perf_counter() - started
+        if not args.verbose:
+            logging.disable(logging.INFO)
+
+        rng = random.Random(args.seed)
+        user_ids = [row['user_id'] for row in app.user_store.all_rows()]
+        upcoming = app.match_catalog.upcoming()
+        ctx = {
+            'users': rng.sample(user_ids, min(len(user_ids), args.requests + args.warmup)),
+            'matches': [row['MatchID'] for row in upcoming],
+            'first_date': upcoming[0]['Date'] if upcoming else '2000-01-01',
+        }
+        print(f"Moteur {app.storage.name}, {len(user_ids)} utilisateurs, {len(upcoming)} matchs à venir ; "
+              f"démarrage {startup_s:.2f} s, RSS {rss_before:.0f} -> {peak_rss_mb():.0f} Mo.")
+        print(f"{'route':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'RSS Mo':>8}"
+              f"{'  vs base' if baseline else ''}  statuts")
+
+        results = {}
+        for name, request_fn in scenarios:
+            result = results[name] = run_scenario(app.app, ctx, request_fn, args.requests, args.warmup, args.threads)
+            versus = ''
+            if baseline:
+                base = baseline.get(name)
+                versus = f"{result['p50_ms'] / base['p50_ms']:>8.2f}x" if base and base['p50_ms'] else f"{'-':>9}"
+            statuses = ' '.join(f"{status}x{count}" for status, count in result['statuses'].items())
+            print(f"{name:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                  f"{result['req_per_s']:>9.0f}{result['peak_rss_mb']:>8.0f}{versus}  {statuses}")
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'storage': app.storage.name, 'users': len(user_ids), 'upcoming_matches': len(upcoming),
+                    'data_bytes': {name: os.path.getsize(os.path.join(args.data, name)) for name in DATA_FILES},
+                    'requests': args.requests, 'warmup': args.warmup, 'threads': args.threads,
+                    'python': platform.python_version(), 'startup_s': startup_s, 'routes': results,
+                }, f, indent=2)
+            print(f"Résultats enregistrés dans {args.json}.")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Génère les assets optimisés servis par l'application sous /assets/ (à lancer avant chaque déploiement).
+
+- Images PNG : réduites à leur taille d'affichage maximale (x3 pour les écrans haute
+  densité), réenregistrées en PNG optimisé, plus des variantes WebP et AVIF (AVIF si
+  Pillow le prend en charge). La route /assets/ choisit la variante selon l'en-tête Accept.
+- Fichiers texte (style.css) : copie plus versions précompressées .gz et .br (.br si
+  le module brotli est installé).
+
+Chaque fichier produit porte un hash de son contenu dans son nom, ce qui permet de le
+servir avec un cache immuable ; manifest.json associe chaque nom source à son nom hashé.
+Les fichiers d'un build précédent qui ne sont plus référencés sont supprimés.
+
+Dépendances de build : Pillow (obligatoire), brotli (optionnel).
+Usage : python build_assets.py [--source DOSSIER] [--out DOSSIER]
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT_DIR = os.path.join(BASE_DIR, 'assets_dist')
+MANIFEST_NAME = 'manifest.json'
+
+# Plus grand côté en pixels une fois réduit (taille CSS d'affichage x3).
+IMAGE_MAX_SIZES = {
+    'icon_accueil.png': 96,
+    'icon_pronos_perso.png': 96,
+    'icon_activite.png': 96,
+    'icon_profil_global.png': 96,
+    'icon_leaderboard.png': 96,
+    'icon_matchs_direct.png': 96,
+    'icon_statut_paris.png': 96,
+    'logo.png': 240,
+    'pronocoin_icon.png': 72,
+    'background_pronozone.png': 1920,
+}
+TEXT_ASSETS = ['style.css']
+WEBP_QUALITY = 82
+AVIF_QUALITY = 60
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _write(out_dir, name, data):
+    with open(os.path.join(out_dir, name), 'wb') as f:
+        f.write(data)
+    return name
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def build_image(Image, features, source_path, name, max_size, out_dir):
+    with Image.open(source_path) as image:
+        image.load()
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        png = _encode(image, 'PNG', optimize=True)
+        hashed = _hashed_name(name, png)
+        produced = [_write(out_dir, hashed, png)]
+        stem = os.path.splitext(hashed)[0]
+        produced.append(_write(out_dir, stem + '.webp', _encode(image, 'WEBP', quality=WEBP_QUALITY, method=6)))
+        if features.check('avif'):
+            produced.append(_write(out_dir, stem + '.avif', _encode(image, 'AVIF', quality=AVIF_QUALITY)))
+    return hashed, produced
+
+
+def build_text(source_path, name, out_dir):
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    hashed = _hashed_name(name, data)
+    produced = [_write(out_dir, hashed, data),
+                _write(out_dir, hashed + '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli:
+        produced.append(_write(out_dir, hashed + '.br', brotli.compress(data, quality=11)))
+    return hashed, produced
+
+
+def main():
+    default_source = os.path.join(BASE_DIR, 'static')
+    if not os.path.isdir(default_source):
+        default_source = BASE_DIR
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=default_source, help="dossier des images et de style.css")
+    parser.add_argument('--out', default=DEFAULT_OUT_DIR)
+    args = parser.parse_args()
+
+    try:
+        from PIL import Image, features
+    except ImportError:
+        sys.exit("Pillow est requis pour le build des assets : pip install Pillow")
+    os.makedirs(args.out, exist_ok=True)
+
+    manifest, produced, source_bytes, built_bytes = {}, {MANIFEST_NAME}, 0, 0
+    for name, max_size in IMAGE_MAX_SIZES.items():
+        source_path = os.path.join(args.source, name)
+        if not os.path.exists(source_path):
+            print(f"  {name} absent de {args.source}, ignoré.")
+            continue
+        manifest[name], files = build_image(Image, features, source_path, name, max_size, args.out)
+        produced.update(files)
+        source_bytes += os.path.getsize(source_path)
+        built_bytes += min(os.path.getsize(os.path.join(args.out, f)) for f in files)
+    for name in TEXT_ASSETS:
+        source_path = os.path.join(args.source, name)
+        if not os.path.exists(source_path):
+            print(f"  {name} absent de {args.source}, ignoré.")
+            continue
+        manifest[name], files = build_text(source_path, name, args.out)
+        produced.update(files)
+
+    with open(os.path.join(args.out, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    for stale in set(os.listdir(args.out)) - produced:
+        os.remove(os.path.join(args.out, stale))
+
+    print(f"{len(manifest)} assets générés dans {args.out} "
+          f"(images : {source_bytes // 1024} Ko source -> {built_bytes // 1024} Ko pour la plus petite variante"
+          f"{'' if features.check('avif') else ', AVIF non disponible'}{'' if brotli else ', brotli non installé'}).")
+
+
+if __name__ == '__main__':
+    main()
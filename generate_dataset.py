@@ -0,0 +1,238 @@
+"""Génère un jeu de données synthétique (users.csv, matches.csv, paris.csv, suivis.csv, bilans.csv) pour les benchmarks.
+
+Les fichiers suivent exactement les en-têtes de app.py et restent cohérents entre eux :
+- matches.csv couvre --days jours passés (matchs 'terminé', avec un résultat tiré selon la
+  cote) et --upcoming-days jours à venir ('à venir') ;
+- paris.csv : les paris sur des matchs terminés sont réglés (gagne/perdu, Gain calculé comme
+  au règlement), ceux sur des matchs à venir sont 'en_cours'. Le nombre de paris par
+  utilisateur suit une loi de Pareto : quelques gros parieurs, beaucoup de petits ;
+- users.csv : unlocked_pronos contient les matchs pariés, bet_count/xp/level sont cohérents
+  et le bilan matérialisé correspond aux paris réglés (comme après `flask rebuild-bilans`),
+  ses jours étant dans bilans.csv ; gains_verses compte les gains des paris gagnés comme versés ;
+- suivis.csv : des suivis uniques, surtout sur les matchs récents et à venir.
+
+Tout est écrit en flux, utilisateur par utilisateur (paris.csv est donc groupé par
+utilisateur plutôt que chronologique) : seuls les matchs sont gardés en mémoire, ce qui
+permet de générer des millions de paris. Même --seed, mêmes fichiers (à la date du jour près).
+
+Usage : python generate_dataset.py [--scale small|medium|large] [--users N] [--matches N]
+        [--bets N] [--follows N] [--out DOSSIER] [--seed 42] [--force]
+"""
+import argparse
+import bisect
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT_DIR = os.path.join(BASE_DIR, 'bench_data')
+
+# Volumes par défaut de chaque échelle (utilisateurs, matchs, paris, suivis).
+SCALES = {
+    'small': (10_000, 2_000, 200_000, 50_000),
+    'medium': (100_000, 10_000, 2_000_000, 500_000),
+    'large': (1_000_000, 50_000, 10_000_000, 5_000_000),
+}
+TEAMS = ['Galatasaray', 'Fenerbahce', 'Besiktas', 'Trabzonspor', 'Antalyaspor', 'Kasimpasa', 'Göztepe',
+         'Istanbul Basaksehir', 'Bohemians Dublin', 'Derry City', 'Shamrock Rovers', 'Shelbourne',
+         'Paris SG', 'Marseille', 'Lyon', 'Lille', 'Monaco', 'Rennes', 'Nice', 'Lens', 'Real Madrid',
+         'Barcelone', 'Atletico Madrid', 'Séville', 'Bayern Munich', 'Dortmund', 'Leipzig', 'Inter Milan',
+         'AC Milan', 'Juventus', 'Naples', 'AS Rome', 'Benfica', 'Porto', 'Sporting CP', 'Ajax', 'PSV']
+BET_TYPES = ['{home} gagne', '{away} gagne', '{away} ou nul', '{home} ou nul', 'Plus de 2.5 buts',
+             'Moins de 2.5 buts', 'Les deux équipes marquent']
+KICKOFF_TIMES = ['13:00', '15:00', '17:00', '18:30', '19:00', '20:00', '20:45', '21:00']
+RISK_LEVELS = [(1.70, '🟢', 1, 'Faible'), (1.90, '🟡', 2, 'Moyen'), (float('inf'), '🟠', 3, 'Élevé')]
+DATA_FILES = ['users.csv', 'matches.csv', 'paris.csv', 'suivis.csv', 'bilans.csv', 'users.journal', 'suivis.journal',
+              'matches.journal', 'matches.lock', 'matches.scheduler.lock', 'settlement.lock', 'pronozone.db', 'pronozone.db-wal', 'pronozone.db-shm',
+              'notifications.outbox', 'notifications.state', 'notifications.lock']
+DATA_DIRS = ['users.locks', 'suivis.locks', 'paris.d', 'snapshots.d']
+PROGRESS_EVERY = 100_000
+
+
+def _load_app():
+    # Import dans un dossier jetable : seuls les en-têtes et les fonctions de bilan servent ici.
+    os.environ['PRONOZONE_DATA_DIR'] = tempfile.mkdtemp(prefix='pronozone_gen_')
+    os.environ['PRONOZONE_STORAGE'] = 'csv'
+    sys.path.insert(0, BASE_DIR)
+    import app
+    shutil.rmtree(os.environ['PRONOZONE_DATA_DIR'], ignore_errors=True)
+    return app
+
+
+def _prepare_out_dir(out_dir, force):
+    if os.path.exists(os.path.join(out_dir, 'users.csv')) and not force:
+        sys.exit(f"{out_dir} contient déjà un jeu de données (--force pour l'écraser).")
+    os.makedirs(out_dir, exist_ok=True)
+    for name in DATA_FILES:
+        if os.path.exists(os.path.join(out_dir, name)):
+            os.remove(os.path.join(out_dir, name))
+    for name in DATA_DIRS:
+        shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+
+
+def _team_code(team):
+    return ''.join(c for c in team if c.isalnum())[:3].upper()
+
+
+def generate_matches(rng, count, days, upcoming_days, today):
+    """Matchs répartis sur [today - days, today + upcoming_days] ; renvoie les lignes et le résultat des matchs terminés."""
+    span = days + upcoming_days + 1
+    matches, outcomes, used_ids = [], {}, set()
+    for i in range(count):
+        match_date = today + timedelta(days=i * span // count - days)
+        home, away = rng.sample(TEAMS, 2)
+        cote = round(rng.uniform(1.30, 3.50), 2)
+        _, risque, note, niveau = next(level for level in RISK_LEVELS if cote < level[0])
+        match_id = base_id = f"{_team_code(home)}{_team_code(away)}{match_date.strftime('%Y%m%d')}"
+        suffix = 1
+        while match_id in used_ids:
+            suffix += 1
+            match_id = f"{base_id}{suffix}"
+        used_ids.add(match_id)
+        finished = match_date < today
+        matches.append({
+            'Date': match_date.isoformat(), 'Heure': rng.choice(KICKOFF_TIMES), 'Match': f"{home} vs {away}",
+            'Pari': rng.choice(BET_TYPES).format(home=home, away=away), 'Cote': f"{cote:.2f}", 'Risque': risque,
+            'Note': note, 'Niveau': niveau, 'Statut': 'terminé' if finished else 'à venir', 'MatchID': match_id})
+        if finished:
+            outcomes[match_id] = 'gagne' if rng.random() < 0.95 / cote else 'perdu'
+    return matches, outcomes
+
+
+def _per_user_counts(rng, users, total, alpha):
+    weights = [rng.paretovariate(alpha) for _ in range(users)]
+    scale = total / sum(weights)
+    counts = []
+    for weight in weights:
+        expected = weight * scale
+        counts.append(int(expected) + (rng.random() < expected - int(expected)))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--users', type=int, help="nombre d'utilisateurs (défaut : selon --scale)")
+    parser.add_argument('--matches', type=int, help="nombre de matchs (défaut : selon --scale)")
+    parser.add_argument('--bets', type=int, help="nombre total de paris, environ (défaut : selon --scale)")
+    parser.add_argument('--follows', type=int, help="nombre total de suivis, environ (défaut : selon --scale)")
+    parser.add_argument('--days', type=int, default=180, help="jours d'historique")
+    parser.add_argument('--upcoming-days', type=int, default=7, help="jours de matchs à venir")
+    parser.add_argument('--out', default=DEFAULT_OUT_DIR)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help="écraser le jeu de données existant de --out")
+    args = parser.parse_args()
+
+    default_users, default_matches, default_bets, default_follows = SCALES[args.scale]
+    n_users = args.users if args.users is not None else default_users
+    n_matches = args.matches if args.matches is not None else default_matches
+    n_bets = args.bets if args.bets is not None else default_bets
+    n_follows = args.follows if args.follows is not None else default_follows
+    if n_users < 1 or n_matches < 1:
+        sys.exit("Il faut au moins un utilisateur et un match.")
+
+    app = _load_app()
+    _prepare_out_dir(args.out, args.force)
+    rng = random.Random(args.seed)
+    today = date.today()
+    started = time.perf_counter()
+
+    matches, outcomes = generate_matches(rng, n_matches, args.days, args.upcoming_days, today)
+    with open(os.path.join(args.out, 'matches.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=app.MATCHES_HEADER)
+        writer.writeheader()
+        writer.writerows(matches)
+    past = [m for m in matches if m['MatchID'] in outcomes]
+    upcoming = [m for m in matches if m['MatchID'] not in outcomes]
+    # Les paris et les suivis portent surtout sur les matchs récents : 5 % des paris sur les
+    # matchs à venir, les suivis sur les 14 derniers jours et sur les matchs à venir.
+    recent = [m for m in past if m['Date'] >= (today - timedelta(days=14)).isoformat()] + upcoming
+    bet_counts = _per_user_counts(rng, n_users, n_bets, 1.2)
+    follow_counts = _per_user_counts(rng, n_users, n_follows, 2.0)
+
+    files = {name: open(os.path.join(args.out, name), 'w', newline='', encoding='utf-8')
+             for name in ('users.csv', 'paris.csv', 'suivis.csv', 'bilans.csv')}
+    try:
+        users_writer = csv.writer(files['users.csv'])
+        paris_writer = csv.writer(files['paris.csv'])
+        suivis_writer = csv.writer(files['suivis.csv'])
+        bilans_writer = csv.writer(files['bilans.csv'])
+        users_writer.writerow(app.USERS_HEADER)
+        paris_writer.writerow(app.PARIS_HEADER)
+        suivis_writer.writerow(app.SUIVIS_HEADER)
+        bilans_writer.writerow(app.BILANS_HEADER)
+        total_bets = total_follows = 0
+
+        for i in range(n_users):
+            user_id = str(1_000_000_000 + i)
+            bilan = app.new_bilan()
+            bet_match_ids = []
+            first_bet_date = None
+            for _ in range(bet_counts[i]):
+                match = rng.choice(upcoming) if upcoming and (not past or rng.random() < 0.05) else rng.choice(past)
+                kickoff = datetime.fromisoformat(f"{match['Date']}T{match['Heure']}").replace(tzinfo=timezone.utc)
+                placed = kickoff - timedelta(seconds=rng.randrange(60, 3 * 86400))
+                outcome = outcomes.get(match['MatchID'])
+                gain = int(app.PRONOCOINS_BET_COST * float(match['Cote'])) - app.PRONOCOINS_BET_COST if outcome == 'gagne' else 0
+                bet = {'bet_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)), 'user_id': user_id,
+                       'MatchID': match['MatchID'], 'MatchName': match['Match'], 'DatePari': placed.isoformat(),
+                       'Montant': app.PRONOCOINS_BET_COST, 'StatutPari': outcome or 'en_cours',
+                       'CotePari': match['Cote'], 'BetType': match['Pari'],
+                       'CoteGagnante': match['Cote'] if outcome == 'gagne' else '', 'Gain': gain}
+                paris_writer.writerow([bet[col] for col in app.PARIS_HEADER])
+                if outcome:
+                    app.add_settled_bet(bilan, bet)
+                if match['MatchID'] not in bet_match_ids:
+                    bet_match_ids.append(match['MatchID'])
+                first_bet_date = min(first_bet_date or placed.date(), placed.date())
+            total_bets += bet_counts[i]
+
+            followed = rng.sample(recent, min(follow_counts[i], len(recent))) if recent else []
+            for match in followed:
+                suivi_date = datetime.fromisoformat(f"{match['Date']}T00:00:00+00:00") - timedelta(seconds=rng.randrange(0, 86400))
+                suivis_writer.writerow([user_id, match['MatchID'], suivi_date.isoformat()])
+            total_follows += len(followed)
+
+            xp = bet_counts[i] * app.XP_PER_BET + len(bet_match_ids) * app.XP_PER_UNLOCK + rng.randrange(0, 50)
+            claimed = {config['claimed_field']: rng.random() < 0.3 for config in app.TASKS_CONFIG.values()}
+            claimed['three_bets_reward_claimed'] = claimed['three_bets_reward_claimed'] and bet_counts[i] >= 3
+            join_date = first_bet_date or today - timedelta(days=rng.randrange(0, args.days + 1))
+            has_username = rng.random() < 0.7
+            user_p = {
+                'user_id': user_id, 'pseudo': f"joueur{i}" if has_username else f"User_{user_id[:6]}",
+                'join_date': join_date.isoformat(), 'xp': xp, 'level': bisect.bisect_right(app.LEVELS_XP, xp),
+                'email': f"joueur{i}@pronobot.dev" if claimed['google_linked_reward_claimed'] else '',
+                'pronocoins_balance': rng.randrange(0, 2000),
+                'last_daily_reward_date': (today - timedelta(days=rng.randrange(1, 30))).isoformat() if rng.random() < 0.5 else '',
+                'unlocked_pronos': ','.join(bet_match_ids), 'bet_count': bet_counts[i],
+                'last_ad_reward_timestamp': f"{time.time() - rng.randrange(3600, 30 * 86400):.1f}" if rng.random() < 0.3 else '0.0',
+                'telegram_first_name': f"Prénom{i}", 'telegram_last_name': '',
+                'telegram_username': f"joueur{i}" if has_username else '',
+                'bilan_paris_regles': 0, 'bilan_paris_gagnes': 0, 'bilan_gains_nets': 0, 'bilan_mises_reglees': 0,
+                **{field: 'true' if value else 'false' for field, value in claimed.items()}}
+            app.apply_bilan(user_p, bilan)
+            user_p['gains_verses'] = bilan['net'] + bilan['mises'] # gains des paris gagnés, tous versés
+            users_writer.writerow([user_p[col] for col in app.USERS_HEADER])
+            for row in app.bilan_day_rows(user_id, bilan['jours']):
+                bilans_writer.writerow([row[col] for col in app.BILANS_HEADER])
+
+            if (i + 1) % PROGRESS_EVERY == 0:
+                print(f"  {i + 1}/{n_users} utilisateurs, {total_bets} paris, {total_follows} suivis...")
+    finally:
+        for f in files.values():
+            f.close()
+
+    sizes = sum(os.path.getsize(os.path.join(args.out, name)) for name in ('users.csv', 'matches.csv', 'paris.csv', 'suivis.csv', 'bilans.csv'))
+    print(f"Jeu de données généré dans {args.out} en {time.perf_counter() - started:.1f} s : {n_users} utilisateurs, "
+          f"{n_matches} matchs ({len(upcoming)} à venir), {total_bets} paris, {total_follows} suivis "
+          f"({sizes / 1024 / 1024:.1f} Mo).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Configuration gunicorn (chargée automatiquement depuis le dossier courant, cf. Procfile).
+
+Active le mode multiprocess de prometheus_client : chaque worker écrit ses métriques dans
+PROMETHEUS_MULTIPROC_DIR et /metrics les agrège. Le dossier est vidé au chargement de cette
+configuration, avant que le master n'importe app et n'y crée ses propres fichiers, et les
+jauges d'un worker arrêté sont retirées à sa sortie.
+
+L'application est préchargée (preload_app) : le master importe app, donc charge les stores
+résidents depuis leurs instantanés (snapshots.d/), et les workers en partagent les pages
+en copy-on-write après le fork. gc.freeze() avant chaque fork sort ces objets des
+collectes du ramasse-miettes, qui sinon réécrirait leurs pages dans chaque worker.
+Les workers gevent patchent la bibliothèque standard après le fork, trop tard pour les
+verrous créés à l'import : on patche donc dès le chargement de cette configuration.
+"""
+import gc
+import os
+import shutil
+
+try:
+    from gevent import monkey
+    monkey.patch_all()
+except ImportError: # workers synchrones
+    pass
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(os.getenv("PRONOZONE_DATA_DIR", BASE_DIR), 'metrics.d'))
+# Métriques d'une exécution précédente : vidées une seule fois par master. Un rechargement
+# (HUP) relit cette configuration alors que app, préchargé, écrit déjà dans le dossier.
+if os.environ.get("PRONOZONE_METRICS_DIR_CLEARED") != METRICS_DIR:
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.environ["PRONOZONE_METRICS_DIR_CLEARED"] = METRICS_DIR
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+preload_app = True
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,102 @@
+"""Test de charge des mutations utilisateurs concurrentes entre plusieurs process.
+
+Lance plusieurs process (comme des workers gunicorn), chacun avec plusieurs threads,
+qui créditent des PronoCoins via update_user_atomic sur un petit nombre
+d'utilisateurs partagés. Le journal est compacté très souvent pour que les
+compactions se produisent pendant les écritures. À la fin, chaque utilisateur
+doit avoir exactement le solde et le bet_count attendus : aucune pièce perdue.
+
+Usage : python stress_user_locks.py [--workers 4] [--threads 4] [--ops 250] [--users 8]
+(PRONOZONE_STORAGE=sqlite pour tester le moteur SQLite)
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _worker(data_dir, worker_idx, threads, ops, user_ids, errors):
+    os.environ["PRONOZONE_DATA_DIR"] = data_dir
+    sys.path.insert(0, BASE_DIR)
+    import app
+
+    def credit(user_p):
+        user_p['pronocoins_balance'] += 1
+        user_p['bet_count'] += 1
+        return user_p
+
+    def run(thread_idx):
+        for i in range(ops):
+            user_id = user_ids[(worker_idx + thread_idx + i) % len(user_ids)]
+            if app.update_user_atomic(user_id, credit) is None:
+                errors.put(f"{user_id} introuvable (worker {worker_idx})")
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=250, help="mutations par thread")
+    parser.add_argument('--users', type=int, default=8)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='pronozone_stress_')
+    os.environ["PRONOZONE_DATA_DIR"] = data_dir
+    os.environ.setdefault("USERS_JOURNAL_COMPACT_BYTES", "4096")
+    sys.path.insert(0, BASE_DIR)
+    import app
+
+    user_ids = [f"stress_{i}" for i in range(args.users)]
+    app.write_csv_from_list_of_dicts(app.USERS_FILE, [
+        {'user_id': user_id, 'xp': 0, 'level': 1, 'pronocoins_balance': 0, 'bet_count': 0, 'last_ad_reward_timestamp': '0.0'}
+        for user_id in user_ids], app.USERS_HEADER)
+
+    ctx = multiprocessing.get_context('spawn')
+    errors = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(data_dir, w, args.threads, args.ops, user_ids, errors))
+             for w in range(args.workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    expected = {user_id: 0 for user_id in user_ids}
+    for w in range(args.workers):
+        for t in range(args.threads):
+            for i in range(args.ops):
+                expected[user_ids[(w + t + i) % len(user_ids)]] += 1
+
+    # Relecture à froid (users.csv + journal), comme un worker qui redémarre.
+    store = app.UserStore(app.USERS_HEADER, app.storage.users_journal(), app.USERS_LOCK_DIR, app.USER_LOCK_STRIPES)
+    store.recover()
+    failures = []
+    while not errors.empty():
+        failures.append(errors.get())
+    for user_id, count in expected.items():
+        row = store.get_row(user_id)
+        if int(row['pronocoins_balance']) != count or int(row['bet_count']) != count:
+            failures.append(f"{user_id}: attendu {count}, solde {row['pronocoins_balance']}, bet_count {row['bet_count']}")
+
+    total = sum(expected.values())
+    if failures or any(p.exitcode != 0 for p in procs):
+        print(f"ÉCHEC ({total} mutations, données dans {data_dir}):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    shutil.rmtree(data_dir, ignore_errors=True)
+    print(f"OK : {total} mutations sur {args.users} utilisateurs par {args.workers} process x {args.threads} threads, aucune pièce perdue.")
+
+
+if __name__ == '__main__':
+    main()
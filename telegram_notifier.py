@@ -0,0 +1,386 @@
+"""Process d'envoi des notifications Telegram, séparé des workers web.
+
+Deux sources de messages :
+  - notifications.outbox, où les routes ajoutent leurs événements (pari placé...) sans
+    jamais attendre Telegram (voir queue_notification dans app.py) ;
+  - le catalogue des matchs : un match suivi (suivis) qui commence dans moins de
+    --lead-minutes minutes est annoncé à chacun de ses suiveurs, une seule fois.
+Les messages d'un utilisateur sont regroupés pendant --batch-seconds secondes en un seul
+envoi. Chaque envoi prend un jeton du seau global (--global-rate messages/s, limite de
+Telegram pour un bot) et du seau de son chat (--chat-rate messages/s) ; une réponse 429
+(RetryAfter) suspend tous les envois le temps demandé, une erreur réseau est retentée
+avec un délai exponentiel, un chat bloqué ou inconnu est abandonné.
+L'avancement (offset de l'outbox, matchs déjà annoncés) est enregistré dans
+notifications.state une fois la file vide : après un arrêt brutal, les derniers
+messages peuvent être renvoyés, jamais perdus. Un seul process à la fois (notifications.lock).
+Les heures des matchs (Date, Heure) sont lues dans le fuseau du serveur.
+
+Usage : python telegram_notifier.py [--api-url URL] [--batch-seconds 2] [--lead-minutes 15]
+        python telegram_notifier.py fake-api [--port 8081] [--flood-every N]
+(TELEGRAM_BOT_TOKEN requis ; fake-api lance un faux Bot API local qui affiche les messages
+reçus, à utiliser avec --api-url http://127.0.0.1:8081)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+try:
+    import fcntl
+except ImportError: # Windows : pas de garde contre un second process
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_MAX_MESSAGE_CHARS = 4096
+SEND_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+OUTBOX_POLL_SECONDS = 0.5
+MATCH_SCAN_SECONDS = 30
+SHUTDOWN_DRAIN_SECONDS = 30
+
+
+def format_event(event):
+    """Texte d'un événement de l'outbox, ou None pour un type inconnu."""
+    data = event.get('data', {})
+    if event.get('kind') == 'bet_placed':
+        return (f"Pari enregistré : {data.get('MatchName', '?')} ({data.get('BetType', '?')}, "
+                f"cote {data.get('CotePari', '?')}), mise de {data.get('Montant', '?')} PC.")
+    return None
+
+
+def format_match_start(match, kickoff):
+    return f"{match.get('Match', '?')} commence à {kickoff:%H:%M} : {match.get('Pari', '?')} (cote {match.get('Cote', '?')})."
+
+
+def split_message(lines):
+    """Regroupe les lignes en messages d'au plus TELEGRAM_MAX_MESSAGE_CHARS caractères."""
+    messages, current = [], ''
+    for line in lines:
+        line = line[:TELEGRAM_MAX_MESSAGE_CHARS]
+        if current and len(current) + 1 + len(line) > TELEGRAM_MAX_MESSAGE_CHARS:
+            messages.append(current)
+            current = ''
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+class TokenBucket:
+    """`rate` jetons par seconde, au plus `capacity` d'avance ; pause() bloque tout le seau un temps donné."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class Dispatcher:
+    """File des messages par utilisateur : une tâche d'envoi par utilisateur ayant des messages en attente."""
+
+    def __init__(self, bot, global_rate, chat_rate, batch_seconds, concurrency):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.batch_seconds = batch_seconds
+        self.in_flight = asyncio.Semaphore(concurrency)
+        self.pending = {}
+        self.senders = {}
+        self.stats = {'sent': 0, 'dropped': 0, 'retried': 0}
+
+    def add(self, user_id, text):
+        try:
+            chat_id = int(user_id) # user_id est l'identifiant Telegram : le chat privé avec le bot
+        except (TypeError, ValueError):
+            logging.debug(f"Notification ignorée : {user_id!r} n'est pas un identifiant Telegram.")
+            return
+        self.pending.setdefault(chat_id, []).append(text)
+        if chat_id not in self.senders:
+            self.senders[chat_id] = asyncio.create_task(self._deliver(chat_id))
+
+    def idle(self):
+        return not self.pending and not self.senders
+
+    def prune_chat_buckets(self):
+        # Un seau plein n'a plus d'effet : inutile de le garder pour un chat inactif.
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items()
+                        if chat_id not in self.senders and bucket.full()]:
+            del self.chat_buckets[chat_id]
+
+    async def drain(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.senders and time.monotonic() < deadline:
+            await asyncio.wait(list(self.senders.values()), timeout=deadline - time.monotonic())
+
+    async def _deliver(self, chat_id):
+        try:
+            await asyncio.sleep(self.batch_seconds) # regroupe les messages qui suivent le premier
+            while chat_id in self.pending:
+                for text in split_message(self.pending.pop(chat_id)):
+                    bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, 1))
+                    await bucket.acquire()
+                    await self.global_bucket.acquire()
+                    await self._send(chat_id, text)
+        except Exception as e:
+            logging.error(f"Erreur lors de l'envoi des notifications au chat {chat_id}: {e}")
+        finally:
+            del self.senders[chat_id]
+
+    async def _send(self, chat_id, text):
+        from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+        for attempt in range(SEND_MAX_ATTEMPTS):
+            try:
+                async with self.in_flight:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+                self.stats['sent'] += 1
+                return
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+                logging.warning(f"Limite de débit Telegram atteinte : envois suspendus {delay:.0f} s.")
+                self.global_bucket.pause(delay) # le 429 vaut pour tout le bot
+                await asyncio.sleep(delay)
+            except (Forbidden, BadRequest) as e: # bot bloqué, chat inconnu : inutile de réessayer
+                logging.info(f"Notification abandonnée pour le chat {chat_id}: {e}")
+                self.stats['dropped'] += 1
+                return
+            except NetworkError as e: # y compris TimedOut
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logging.warning(f"Erreur réseau vers Telegram pour le chat {chat_id} ({e}), nouvel essai dans {delay:.1f} s.")
+                await asyncio.sleep(delay)
+            self.stats['retried'] += 1
+        logging.error(f"Notification abandonnée pour le chat {chat_id} après {SEND_MAX_ATTEMPTS} essais.")
+        self.stats['dropped'] += 1
+
+
+class Notifier:
+    def __init__(self, app_module, dispatcher, lead_minutes, state_path):
+        self.app = app_module
+        self.dispatcher = dispatcher
+        self.lead = timedelta(minutes=lead_minutes)
+        self.state_path = state_path
+        self.offset = 0
+        self.announced = {} # MatchID -> coup d'envoi (isoformat UTC), gardé un jour après
+        self.stopping = asyncio.Event()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.offset = int(state.get('offset', 0))
+            self.announced = dict(state.get('announced', {}))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            logging.warning(f"{self.state_path} illisible, notifications reprises au début de l'outbox : {e}")
+
+    def save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'offset': self.offset, 'announced': self.announced}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _checkpoint(self):
+        # L'offset n'avance sur disque qu'une fois tous les messages lus envoyés (ou abandonnés).
+        if self.dispatcher.idle():
+            self.offset = self.app.notification_outbox.truncate_if_consumed(self.offset)
+            self.save_state()
+
+    def read_outbox(self):
+        events, self.offset = self.app.notification_outbox.read(self.offset)
+        for event in events:
+            text = format_event(event)
+            if text is None:
+                logging.warning(f"Notification de type inconnu ignorée : {event.get('kind')}")
+                continue
+            self.dispatcher.add(event.get('user_id'), text)
+        return len(events)
+
+    def scan_matches(self, now):
+        starting = {}
+        for match in self.app.match_catalog.upcoming():
+            match_id = match.get('MatchID')
+            if not match_id or match_id in self.announced:
+                continue
+            kickoff = self.app.match_kickoff(match)
+            if kickoff is not None and now < kickoff <= now + self.lead:
+                starting[match_id] = (match, kickoff)
+        if starting:
+            for match_id, user_ids in self.app.follow_store.followers(starting).items():
+                match, kickoff = starting[match_id]
+                for user_id in user_ids:
+                    self.dispatcher.add(user_id, format_match_start(match, kickoff))
+            for match_id, (_, kickoff) in starting.items():
+                self.announced[match_id] = kickoff.astimezone(timezone.utc).isoformat()
+            logging.info(f"{len(starting)} matchs suivis sur le point de commencer annoncés.")
+        cutoff = (now - timedelta(days=1)).astimezone(timezone.utc).isoformat()
+        self.announced = {match_id: kickoff for match_id, kickoff in self.announced.items() if kickoff >= cutoff}
+        return len(starting)
+
+    async def _outbox_loop(self):
+        while not self.stopping.is_set():
+            self.read_outbox()
+            self._checkpoint()
+            await self._sleep(OUTBOX_POLL_SECONDS)
+
+    async def _match_loop(self):
+        while not self.stopping.is_set():
+            self.scan_matches(datetime.now(timezone.utc))
+            self.dispatcher.prune_chat_buckets()
+            stats = self.dispatcher.stats
+            logging.info(f"Notifications : {stats['sent']} envoyées, {stats['retried']} nouveaux essais, "
+                         f"{stats['dropped']} abandonnées, {len(self.dispatcher.pending)} chats en attente.")
+            await self._sleep(MATCH_SCAN_SECONDS)
+
+    async def _sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        self.load_state()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+        logging.info(f"Envoi des notifications démarré (outbox à l'offset {self.offset}).")
+        await asyncio.gather(self._outbox_loop(), self._match_loop())
+        await self.dispatcher.drain(SHUTDOWN_DRAIN_SECONDS)
+        self._checkpoint()
+        logging.info("Envoi des notifications arrêté.")
+
+
+def acquire_single_instance(lock_path):
+    f = open(lock_path, 'a')
+    if fcntl:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            sys.exit(f"Un autre process d'envoi des notifications tient déjà {lock_path}.")
+    return f # à garder ouvert pendant toute l'exécution
+
+
+async def run_notifier(args):
+    from telegram import Bot
+    from telegram.request import HTTPXRequest
+
+    sys.path.insert(0, BASE_DIR)
+    import app
+
+    if not app.TELEGRAM_BOT_TOKEN:
+        sys.exit("TELEGRAM_BOT_TOKEN n'est pas défini.")
+    lock = acquire_single_instance(os.path.join(app.DATA_DIR, 'notifications.lock'))
+    request = HTTPXRequest(connection_pool_size=args.concurrency)
+    async with Bot(app.TELEGRAM_BOT_TOKEN, base_url=f"{args.api_url.rstrip('/')}/bot", request=request) as bot:
+        dispatcher = Dispatcher(bot, args.global_rate, args.chat_rate, args.batch_seconds, args.concurrency)
+        await Notifier(app, dispatcher, args.lead_minutes, os.path.join(app.DATA_DIR, 'notifications.state')).run()
+    lock.close()
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """Faux Bot API : getMe et sendMessage, avec un 429 toutes les `flood_every` requêtes si demandé."""
+    flood_every = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(raw or '{}')
+        else:
+            params = {key: values[0] for key, values in parse_qs(raw).items()}
+        method = self.path.rsplit('/', 1)[-1]
+        with self.lock:
+            FakeBotAPIHandler.requests += 1
+            flood = self.flood_every and FakeBotAPIHandler.requests % self.flood_every == 0
+        if method == 'getMe':
+            self._reply(200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'PronoZone', 'username': 'pronozone_bot'}})
+        elif method == 'sendMessage':
+            if flood:
+                self._reply(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                  'parameters': {'retry_after': 1}})
+                return
+            print(f"{datetime.now():%H:%M:%S.%f} chat {params.get('chat_id')} : {params.get('text')!r}", flush=True)
+            self._reply(200, {'ok': True, 'result': {'message_id': FakeBotAPIHandler.requests, 'date': int(time.time()),
+                                                     'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                                                     'text': params.get('text', '')}})
+        else:
+            self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', nargs='?', choices=['run', 'fake-api'], default='run')
+    parser.add_argument('--api-url', default=TELEGRAM_API_URL, help="URL du Bot API (TELEGRAM_API_URL)")
+    parser.add_argument('--global-rate', type=float, default=float(os.getenv("TELEGRAM_GLOBAL_RATE", 25)),
+                        help="messages par seconde pour tout le bot")
+    parser.add_argument('--chat-rate', type=float, default=float(os.getenv("TELEGRAM_CHAT_RATE", 1)),
+                        help="messages par seconde vers un même chat")
+    parser.add_argument('--batch-seconds', type=float, default=float(os.getenv("NOTIFICATIONS_BATCH_SECONDS", 2)))
+    parser.add_argument('--lead-minutes', type=float, default=float(os.getenv("NOTIFICATIONS_LEAD_MINUTES", 15)),
+                        help="délai avant le coup d'envoi pour annoncer un match suivi")
+    parser.add_argument('--concurrency', type=int, default=16, help="requêtes simultanées vers le Bot API")
+    parser.add_argument('--port', type=int, default=8081, help="port du faux Bot API (fake-api)")
+    parser.add_argument('--flood-every', type=int, default=0, help="fake-api : un 429 toutes les N requêtes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger('httpx').setLevel(logging.WARNING) # une ligne par requête au Bot API sinon
+    if args.mode == 'fake-api':
+        FakeBotAPIHandler.flood_every = args.flood_every
+        print(f"Faux Bot API sur http://127.0.0.1:{args.port}", flush=True)
+        ThreadingHTTPServer(('127.0.0.1', args.port), FakeBotAPIHandler).serve_forever()
+    else:
+        asyncio.run(run_notifier(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Configuration commune des tests : app est importé une seule fois, sur un dossier de données temporaire.
+
+PRONOZONE_DATA_DIR doit être fixé avant l'import (les stores résidents se chargent à
+l'import). Les tests partagent donc ce dossier : chacun crée ses propres utilisateurs,
+matchs et paris, avec des identifiants uniques.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix='pronozone_tests_')
+os.environ["PRONOZONE_DATA_DIR"] = DATA_DIR
+os.environ["MATCH_SCHEDULER"] = "0" # les tests appellent tick() eux-mêmes
+os.environ.pop("TELEGRAM_BOT_TOKEN", None)
+sys.path.insert(0, BASE_DIR)
+
+import app as pronozone # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if exitstatus == 0: # gardé en cas d'échec, pour examen
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client():
+    return pronozone.app.test_client()
+
+
+@pytest.fixture
+def new_user(client):
+    """Crée un utilisateur par /api/user_profile ; renvoie son user_id."""
+    def create(prefix='test'):
+        user_id = f"{prefix}_{uuid.uuid4().hex[:12]}"
+        response = client.get('/api/user_profile', query_string={'user_id': user_id})
+        assert response.status_code in (200, 201)
+        return user_id
+    return create
+
+
+def make_bet(user_id, date_pari, statut='en_cours', montant=10, match_id=None, gain=0):
+    return {'bet_id': str(uuid.uuid4()), 'user_id': user_id, 'MatchID': match_id or f"M_{uuid.uuid4().hex[:8]}",
+            'MatchName': 'A - B', 'DatePari': date_pari, 'Montant': montant, 'StatutPari': statut,
+            'CotePari': '2.0', 'BetType': '1', 'CoteGagnante': '', 'Gain': gain}
+
+
+def make_match(match_id, kickoff, **fields):
+    """Ligne du flux de matchs ; kickoff est une heure de MATCH_TIMEZONE."""
+    return {'MatchID': match_id, 'Match': 'A - B', 'Date': kickoff.strftime('%Y-%m-%d'), 'Heure': kickoff.strftime('%H:%M'),
+            'Pari': '1', 'Cote': '1.80', 'Statut': pronozone.MATCH_STATUS_UPCOMING, **fields}
@@ -0,0 +1,68 @@
+"""Bilans matérialisés : totaux, données du graphique, recalcul et rattrapage au démarrage."""
+import os
+
+import app as pronozone
+from conftest import make_bet
+
+
+def _settle(user_id, day, outcome, montant=10):
+    bet = make_bet(user_id, f"{day}T15:00:00+00:00", montant=montant)
+    pronozone.bet_store.add(bet)
+    pronozone.settle_matches({bet['MatchID']: outcome})
+
+
+def _settled_user(new_user):
+    """Deux paris gagnés le 10/05 (+10 chacun), un perdu le 10/05 (-10) et un perdu le 12/05 (-30)."""
+    user_id = new_user('bilan')
+    _settle(user_id, '2026-05-10', 'gagne')
+    _settle(user_id, '2026-05-10', 'gagne')
+    _settle(user_id, '2026-05-10', 'perdu')
+    _settle(user_id, '2026-05-12', 'perdu', montant=30)
+    return user_id
+
+
+def _check(client, user_id):
+    bilan = client.get('/api/bilan', query_string={'user_id': user_id}).get_json()
+    assert bilan == {'totalBets': 4, 'wonBets': 2, 'lostBets': 2, 'netGains': -20, 'roi': -33.33}
+    chart = client.get('/api/bilan_chart_data', query_string={'user_id': user_id}).get_json()
+    assert chart == {'labels': ['10/05', '12/05'], 'gagnes': [2, 0], 'perdus': [1, 1],
+                     'paris_regles': [3, 1], 'pnl_cumule': [10, -20]}
+
+
+def test_bilan_and_chart_totals(client, new_user):
+    user_id = _settled_user(new_user)
+    _check(client, user_id)
+    assert len(pronozone.select_page(pronozone.BILANS_FILE, 'date', user_id=user_id)) == 4 # une ligne par règlement
+
+    pronozone.rebuild_bilans()
+    _check(client, user_id)
+    assert len(pronozone.select_page(pronozone.BILANS_FILE, 'date', user_id=user_id)) == 2 # une ligne par jour
+
+
+def test_bilan_of_unknown_user_is_empty(client):
+    bilan = client.get('/api/bilan', query_string={'user_id': 'inconnu_bilan'}).get_json()
+    assert bilan == {'totalBets': 0, 'wonBets': 0, 'lostBets': 0, 'netGains': 0, 'roi': 0}
+    chart = client.get('/api/bilan_chart_data', query_string={'user_id': 'inconnu_bilan'}).get_json()
+    assert chart['labels'] == [] and chart['pnl_cumule'] == []
+    assert client.get('/api/bilan_chart_data').status_code == 400
+
+
+def test_missing_bilans_are_backfilled(client, new_user):
+    user_id = _settled_user(new_user)
+    assert pronozone.backfill_bilans() is None # bilans présents : rien à faire
+
+    # Déploiement antérieur aux bilans matérialisés : ni bilans.csv, ni table bilans, ni totaux.
+    if pronozone.storage.name == 'sqlite':
+        with pronozone.storage.transaction() as conn:
+            conn.execute('DROP TABLE bilans')
+    else:
+        os.remove(pronozone.BILANS_FILE)
+
+    def forget_bilan(user_p):
+        for bilan_field in pronozone.BILAN_TOTAL_FIELDS:
+            user_p[bilan_field] = 0
+        return user_p
+    pronozone.update_user_atomic(user_id, forget_bilan)
+
+    assert pronozone.backfill_bilans() >= 1
+    _check(client, user_id)
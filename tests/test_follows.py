@@ -0,0 +1,61 @@
+"""Suivis des pronostics : bascule, détail des matchs suivis, journal partagé entre workers."""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as pronozone
+from conftest import make_match
+
+
+def _upcoming_match():
+    match_id = f"SUIVI_{uuid.uuid4().hex[:8]}"
+    kickoff = datetime.now(pronozone.MATCH_TZ) + timedelta(days=3)
+    pronozone.match_catalog.ingest([make_match(match_id, kickoff)])
+    return match_id
+
+
+def _toggle(client, user_id, match_id):
+    response = client.post('/api/toggle_suivi_prono', json={'user_id': user_id, 'match_id': match_id})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _other_worker():
+    store = pronozone.FollowStore(pronozone.storage.follows_journal(), pronozone.SUIVIS_LOCK_DIR, pronozone.USER_LOCK_STRIPES)
+    store.recover()
+    return store
+
+
+def test_toggle_follows_then_unfollows(client):
+    user_id, match_id = f"suivi_{uuid.uuid4().hex[:12]}", _upcoming_match()
+
+    body = _toggle(client, user_id, match_id)
+    assert body['message'] == "Pronostic ajouté aux suivis." and body['pronos_suivis_ids'] == [match_id]
+    details = client.get('/api/pronos_suivis', query_string={'user_id': user_id}).get_json()
+    assert [p['MatchID'] for p in details] == [match_id]
+
+    body = _toggle(client, user_id, match_id)
+    assert body['message'] == "Pronostic retiré des suivis." and body['pronos_suivis_ids'] == []
+    assert client.get('/api/pronos_suivis', query_string={'user_id': user_id}).get_json() == []
+    assert client.post('/api/toggle_suivi_prono', json={'user_id': user_id}).status_code == 400
+
+
+def test_toggles_reach_other_workers_and_survive_compaction(client, monkeypatch):
+    user_id, kept, dropped = f"suivi_{uuid.uuid4().hex[:12]}", _upcoming_match(), _upcoming_match()
+    other = _other_worker()
+    _toggle(client, user_id, kept)
+    _toggle(client, user_id, dropped)
+    assert sorted(other.followed_ids(user_id)) == sorted([kept, dropped])
+
+    # Bascule faite par l'autre worker, qui compacte aussitôt le journal dans suivis.csv (ou la table).
+    threshold = 'compact_rows' if pronozone.storage.name == 'sqlite' else 'compact_bytes'
+    monkeypatch.setattr(other.journal, threshold, 0)
+    assert other.toggle(user_id, dropped) == (False, [kept])
+    assert pronozone.follow_store.followed_ids(user_id) == [kept]
+    assert _other_worker().followed_ids(user_id) == [kept] # rechargé depuis la base compactée
+
+
+def test_sqlite_journal_requires_apply():
+    with pytest.raises(TypeError):
+        pronozone.SQLiteJournal(None, 0)
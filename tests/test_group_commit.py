@@ -0,0 +1,88 @@
+"""Écritures groupées (GroupCommit) des mises à jour utilisateurs."""
+import os
+import threading
+import time
+
+import pytest
+
+import app as pronozone
+
+
+def test_group_commit_runs_items_and_returns_own_result(monkeypatch):
+    group_commit = pronozone.GroupCommit(lambda items: [(item * 2, None) for item in items], 0)
+    monkeypatch.setattr(pronozone.time, 'sleep', lambda seconds: pytest.fail("attente sans fenêtre"))
+    assert group_commit.submit(21) == 42
+
+
+def test_group_commit_window_closed_without_gevent():
+    # Worker synchrone (tests, gunicorn sans gevent) : une mise à jour seule n'attend pas.
+    if 'USER_GROUP_COMMIT_MS' in os.environ:
+        pytest.skip("USER_GROUP_COMMIT_MS fixé dans l'environnement")
+    assert not pronozone.COOPERATIVE_LOCKS
+    assert pronozone.user_store.group_commit.window == 0
+
+
+def test_group_commit_raises_item_error_to_its_caller_only():
+    def run(items):
+        return [(None, ValueError(f"refus {item}")) if item < 0 else (item, None) for item in items]
+    group_commit = pronozone.GroupCommit(run, 0.05)
+    results = {}
+
+    def submit(item):
+        try:
+            results[item] = group_commit.submit(item)
+        except ValueError as e:
+            results[item] = str(e)
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in (1, -2, 3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {1: 1, -2: "refus -2", 3: 3}
+
+
+def test_group_commit_batches_window_and_propagates_run_error():
+    batches = []
+
+    def run(items):
+        batches.append(list(items))
+        raise OSError("disque plein")
+    group_commit = pronozone.GroupCommit(run, 0.1)
+    errors = []
+
+    def submit(item):
+        try:
+            group_commit.submit(item)
+        except OSError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in range(4)]
+    for t in threads:
+        t.start()
+        time.sleep(0.005)
+    for t in threads:
+        t.join()
+    assert len(batches) == 1 and sorted(batches[0]) == [0, 1, 2, 3]
+    assert errors == ["disque plein"] * 4
+    assert group_commit.open_batch is None # le lot suivant repart de zéro
+    with pytest.raises(OSError):
+        group_commit.submit(5)
+
+
+def test_update_user_atomic_isolates_business_errors(new_user):
+    user_id = new_user()
+    balance = pronozone.get_user(user_id)['pronocoins_balance']
+
+    def debit(amount):
+        def update(user_p):
+            if user_p['pronocoins_balance'] < amount:
+                raise ValueError("Solde insuffisant")
+            user_p['pronocoins_balance'] -= amount
+            return user_p
+        return update
+
+    with pytest.raises(ValueError):
+        pronozone.update_user_atomic(user_id, debit(balance + 1))
+    assert pronozone.update_user_atomic(user_id, debit(1))['pronocoins_balance'] == balance - 1
+    assert pronozone.get_user(user_id)['pronocoins_balance'] == balance - 1
@@ -0,0 +1,61 @@
+"""Classement : ordre, pagination et rang de l'utilisateur, tenus à jour à chaque écriture."""
+import itertools
+
+import app as pronozone
+
+# Soldes croissants d'un appel à l'autre : les derniers créés sont en tête du classement partagé.
+_TOP_BALANCES = itertools.count(10**9, 10)
+
+
+def _set(user_id, **fields):
+    def update_logic(user_p):
+        user_p.update(fields)
+        return user_p
+    assert pronozone.update_user_atomic(user_id, update_logic) is not None
+
+
+def _leaders(new_user):
+    """Trois utilisateurs en tête : classés par solde, puis niveau, puis XP."""
+    balance = next(_TOP_BALANCES)
+    first, second, third = new_user('top'), new_user('top'), new_user('top')
+    _set(first, pronocoins_balance=balance + 1, level=1, xp=0)
+    _set(second, pronocoins_balance=balance, level=3, xp=50)
+    _set(third, pronocoins_balance=balance, level=3, xp=10)
+    return [first, second, third], balance
+
+
+def test_leaderboard_orders_and_pages(client, new_user):
+    leaders, _ = _leaders(new_user)
+
+    page = client.get('/api/leaderboard', query_string={'limit': 2}).get_json()
+    assert [entry['user_id'] for entry in page] == leaders[:2]
+    assert [entry['rank'] for entry in page] == [1, 2]
+    page = client.get('/api/leaderboard', query_string={'limit': 2, 'offset': 2}).get_json()
+    assert page[0]['user_id'] == leaders[2] and page[0]['rank'] == 3
+
+    full = client.get('/api/leaderboard', query_string={'limit': pronozone.LEADERBOARD_MAX_PAGE_SIZE}).get_json()
+    keys = [(-e['pronocoins_balance'], -e['level'], -e['xp'], e['user_id']) for e in full]
+    assert keys == sorted(keys)
+
+
+def test_leaderboard_user_rank_follows_updates(client, new_user):
+    leaders, balance = _leaders(new_user)
+    body = client.get('/api/leaderboard', query_string={'limit': 1, 'user_id': leaders[2]}).get_json()
+    assert body['user_rank']['rank'] == 3
+    assert body['total_users'] == len(pronozone.user_store.rows)
+    assert [entry['user_id'] for entry in body['leaderboard']] == leaders[:1]
+
+    _set(leaders[2], pronocoins_balance=balance + 2)
+    body = client.get('/api/leaderboard', query_string={'limit': 1, 'user_id': leaders[2]}).get_json()
+    assert body['user_rank']['rank'] == 1
+    assert body['leaderboard'][0]['user_id'] == leaders[2]
+    assert pronozone.leaderboard.rank_of(leaders[0]) == 2
+
+    body = client.get('/api/leaderboard', query_string={'user_id': 'inconnu_classement'}).get_json()
+    assert body['user_rank'] is None
+
+
+def test_leaderboard_rejects_invalid_paging(client):
+    assert client.get('/api/leaderboard', query_string={'offset': 'x'}).status_code == 400
+    page = client.get('/api/leaderboard', query_string={'limit': 10**6}).get_json()
+    assert len(page) <= pronozone.LEADERBOARD_MAX_PAGE_SIZE
@@ -0,0 +1,140 @@
+"""Rapprochement du grand livre : détection, users.csv corrigé, correction revérifiée sous verrou."""
+import csv
+
+import app as pronozone
+from conftest import make_bet
+
+
+def _report(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['user_id']: row for row in csv.DictReader(f)}
+
+
+def _unbilled_user(new_user, bets=3):
+    """Utilisateur dont les paris ont été écrits sans débit (arrêt entre les deux écritures)."""
+    user_id = new_user('ledger')
+    match_ids = []
+    for day in range(bets):
+        bet = make_bet(user_id, f"2026-06-0{day + 1}T09:00:00+00:00")
+        pronozone.bet_store.add(bet)
+        match_ids.append(bet['MatchID'])
+    return user_id, match_ids
+
+
+def test_reconcile_reports_drift_and_writes_corrected_users(new_user, tmp_path):
+    user_id, match_ids = _unbilled_user(new_user)
+    before = pronozone.get_user(user_id)
+    summary = pronozone.reconcile_ledger(report_file=tmp_path / 'report.csv', corrected_file=tmp_path / 'users.csv')
+
+    report = _report(tmp_path / 'report.csv')[user_id]
+    assert report['paris'] == '3' and report['bet_count'] == '0'
+    assert set(report['pronos_non_debloques'].split(',')) == set(match_ids)
+    assert int(report['ajustement_solde']) == -3 * pronozone.PRONOCOINS_BET_COST
+    assert summary['repaired_users'] == 0
+    assert pronozone.get_user(user_id)['bet_count'] == before['bet_count'] # données intactes
+
+    corrected = _report(tmp_path / 'users.csv')
+    assert len(corrected) == summary['users']
+    assert corrected[user_id]['bet_count'] == '3'
+    assert int(corrected[user_id]['pronocoins_balance']) == before['pronocoins_balance'] - 3 * pronozone.PRONOCOINS_BET_COST
+
+
+def test_reconcile_repair_then_clean(new_user, tmp_path):
+    user_id, match_ids = _unbilled_user(new_user)
+    balance = pronozone.get_user(user_id)['pronocoins_balance']
+    pronozone.reconcile_ledger(report_file=tmp_path / 'repair.csv', repair=True)
+
+    assert user_id in _report(tmp_path / 'repair.csv')
+    user = pronozone.get_user(user_id)
+    assert user['bet_count'] == 3
+    assert user['pronocoins_balance'] == balance - 3 * pronozone.PRONOCOINS_BET_COST
+    assert set(match_ids) <= set(user['unlocked_pronos'])
+
+    pronozone.reconcile_ledger(report_file=tmp_path / 'again.csv')
+    assert user_id not in _report(tmp_path / 'again.csv')
+
+
+def test_reconcile_repair_rechecks_under_lock(new_user, tmp_path, monkeypatch):
+    # L'écart vu au parcours est résorbé avant la correction (débit arrivé entretemps) : rien n'est compté deux fois.
+    user_id, _ = _unbilled_user(new_user)
+    balance = pronozone.get_user(user_id)['pronocoins_balance']
+    update_users_atomic = pronozone.update_users_atomic
+
+    def settle_then_update(update_fns):
+        def debit(user_p):
+            user_p['bet_count'] += 3
+            user_p['pronocoins_balance'] -= 3 * pronozone.PRONOCOINS_BET_COST
+            user_p['unlocked_pronos'] |= [bet['MatchID'] for bet in pronozone.bet_store.page(user_id)]
+            return user_p
+        update_users_atomic({user_id: debit})
+        return update_users_atomic(update_fns)
+    monkeypatch.setattr(pronozone, 'update_users_atomic', settle_then_update)
+    pronozone.reconcile_ledger(report_file=tmp_path / 'race.csv', repair=True)
+
+    assert user_id not in _report(tmp_path / 'race.csv')
+    user = pronozone.get_user(user_id)
+    assert user['bet_count'] == 3
+    assert user['pronocoins_balance'] == balance - 3 * pronozone.PRONOCOINS_BET_COST
+
+
+def _billed_bet(user_id, **fields):
+    """Pari écrit avec son débit, comme par /api/place_bet ; renvoie le pari et le solde après débit."""
+    bet = make_bet(user_id, "2026-06-01T09:00:00+00:00", **fields)
+    pronozone.bet_store.add(bet)
+
+    def debit(user_p):
+        user_p['bet_count'] += 1
+        user_p['pronocoins_balance'] -= pronozone.PRONOCOINS_BET_COST
+        user_p['unlocked_pronos'] |= [bet['MatchID']]
+        return user_p
+    return bet, pronozone.update_user_atomic(user_id, debit)['pronocoins_balance']
+
+
+def _unpaid_winner(new_user):
+    """Pari gagné débité mais jamais crédité (règlement interrompu) : 20 PC dus, mise comprise."""
+    user_id = new_user('ledger')
+    _, balance = _billed_bet(user_id, statut='gagne', gain=10)
+    return user_id, balance
+
+
+def test_settlement_counts_paid_gains(new_user, tmp_path):
+    user_id = new_user('ledger')
+    bet, _ = _billed_bet(user_id)
+    pronozone.settle_matches({bet['MatchID']: 'gagne'})
+    assert pronozone.get_user(user_id)['gains_verses'] == 20
+
+    pronozone.reconcile_ledger(report_file=tmp_path / 'paid.csv')
+    assert user_id not in _report(tmp_path / 'paid.csv')
+
+
+def test_unpaid_gains_do_not_depend_on_rebuilt_bilans(new_user, tmp_path):
+    user_id, balance = _unpaid_winner(new_user)
+    pronozone.reconcile_ledger(report_file=tmp_path / 'direct.csv', repair=True)
+    assert int(_report(tmp_path / 'direct.csv')[user_id]['ajustement_solde']) == 20
+    assert pronozone.get_user(user_id)['pronocoins_balance'] == balance + 20
+
+    # Bilans recalculés d'abord : le pari compte au bilan, mais reste dû.
+    user_id, balance = _unpaid_winner(new_user)
+    pronozone.rebuild_bilans()
+    user = pronozone.get_user(user_id)
+    assert user['bilan_paris_gagnes'] == 1 and user['gains_verses'] == 0
+    pronozone.reconcile_ledger(report_file=tmp_path / 'rebuilt.csv', repair=True)
+    assert int(_report(tmp_path / 'rebuilt.csv')[user_id]['ajustement_solde']) == 20
+    assert pronozone.get_user(user_id)['pronocoins_balance'] == balance + 20
+
+    pronozone.reconcile_ledger(report_file=tmp_path / 'again.csv')
+    assert user_id not in _report(tmp_path / 'again.csv')
+
+
+def test_legacy_users_get_paid_gains_from_their_bilan(new_user):
+    user_id = new_user('ledger')
+
+    def legacy(user_p):
+        user_p['bilan_gains_nets'], user_p['bilan_mises_reglees'], user_p['gains_verses'] = 15, 40, None
+        return user_p
+    pronozone.update_user_atomic(user_id, legacy)
+    assert pronozone.paid_gains(pronozone.get_user(user_id)) == 55 # ligne importée après le démarrage
+
+    assert pronozone.backfill_gains_verses() >= 1
+    assert pronozone.get_user(user_id)['gains_verses'] == 55
+    assert pronozone.backfill_gains_verses() == 0
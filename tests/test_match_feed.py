@@ -0,0 +1,46 @@
+"""Flux de matchs : comparaison au catalogue et ingestion du seul diff."""
+import uuid
+from datetime import datetime, timedelta
+
+import app as pronozone
+from conftest import make_match
+
+
+def test_diff_match_feed_classifies_rows():
+    kickoff = datetime(2026, 5, 1, 20, 0)
+    known = {
+        'K1': make_match('K1', kickoff),
+        'K2': make_match('K2', kickoff),
+        'DONE': make_match('DONE', kickoff, Statut=pronozone.MATCH_STATUS_FINISHED),
+    }
+    feed = [
+        make_match('NEW', kickoff),
+        {'MatchID': 'K1', 'Cote': '2.10', 'Match': 'ignoré pour un match connu'},
+        {'MatchID': 'K2', 'Statut': 'À VENIR', 'Cote': '1.80'}, # même statut, casse près
+        {'MatchID': 'DONE', 'Statut': 'en cours'},
+        {'MatchID': 'NEW', 'Cote': '3'},
+        {'MatchID': '', 'Cote': '2'},
+        {'MatchID': 'BAD', 'Cote': 'abc'},
+    ]
+    records, change_set = pronozone.diff_match_feed(known, feed)
+
+    assert change_set['inserted'] == ['NEW']
+    assert change_set['cote_changes'] == [{'MatchID': 'K1', 'old': '1.80', 'new': '2.10'}]
+    assert change_set['statut_changes'] == []
+    assert change_set['unchanged'] == 1
+    assert [(r['MatchID'], r['error']) for r in change_set['rejected']] == [
+        ('DONE', "Match déjà terminé"), ('NEW', "MatchID en double dans le lot"),
+        ('', "MatchID manquant"), ('BAD', "Cote invalide : abc")]
+    assert records[0]['fields']['Match'] == 'A - B'
+    assert records[1] == {'op': 'upsert', 'MatchID': 'K1', 'fields': {'Cote': '2.10'}}
+    assert len(records) == 2
+
+
+def test_ingest_applies_only_the_diff():
+    match_id = f"ING_{uuid.uuid4().hex[:8]}"
+    kickoff = datetime.now(pronozone.MATCH_TZ) + timedelta(days=2)
+    pronozone.match_catalog.ingest([make_match(match_id, kickoff)])
+    pronozone.match_catalog.ingest([{'MatchID': match_id, 'Statut': pronozone.MATCH_STATUS_FINISHED}])
+    assert pronozone.match_catalog.get(match_id)['Statut'] == pronozone.MATCH_STATUS_FINISHED
+    assert pronozone.match_catalog.get(match_id)['Cote'] == '1.80'
+    assert pronozone.match_catalog.get_upcoming(match_id) is None
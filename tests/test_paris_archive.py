@@ -0,0 +1,50 @@
+"""Index de blocs des archives mensuelles de paris."""
+import bisect
+import gzip
+import json
+import os
+
+import app as pronozone
+from conftest import make_bet
+
+
+def test_archive_block_index_reads_only_user_block(tmp_path, monkeypatch):
+    monkeypatch.setattr(pronozone, 'PARIS_ARCHIVE_BLOCK_BYTES', 512)
+    store = pronozone.BetStore(str(tmp_path / 'paris.csv'), str(tmp_path / 'paris.d'), partitioned=True)
+    os.makedirs(store.partitions_dir)
+    user_ids = [f"arch_{i:02d}" for i in range(12)]
+    bets = [make_bet(user_id, f"2025-01-{day + 10}T12:00:00+00:00", statut='gagne')
+            for user_id in user_ids for day in range(5)]
+    assert store._write_archive('2025-01', bets) == len(bets)
+
+    path = store.partition_path(store.partitions_dir, '2025-01', archived=True)
+    with open(path + '.idx', encoding='utf-8') as f:
+        index = json.load(f)
+    assert index['size'] == os.path.getsize(path)
+    firsts = [first for first, _, _ in index['blocks']]
+    assert len(firsts) > 1 and firsts == sorted(firsts)
+    with gzip.open(path, 'rt', encoding='utf-8') as f: # toujours lisible en entier
+        assert len(f.read().splitlines()) == len(bets) + 1
+
+    expected = sorted(b['bet_id'] for b in bets if b['user_id'] == user_ids[5])
+    assert sorted(r['bet_id'] for r in store._read_archive('2025-01', user_ids[5])) == expected
+    assert store._read_archive('2025-01', 'aaa_avant_tous') == []
+
+    # .idx d'une autre version de l'archive (taille différente) : lecture complète, même résultat.
+    with open(path + '.idx', 'w', encoding='utf-8') as f:
+        json.dump({'size': 1, 'blocks': index['blocks']}, f)
+    store.archive_blocks.clear()
+    assert len(store._read_archive('2025-01', user_ids[5])) == len(bets)
+    assert sorted(r['bet_id'] for r in store._select('2025-01', True, user_ids[5])) == expected
+
+    # Avec l'index à jour, seul le bloc de l'utilisateur est décompressé : les autres peuvent être illisibles.
+    with open(path + '.idx', 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    store.archive_blocks.clear()
+    block = bisect.bisect_right(firsts, user_ids[5]) - 1
+    other = 0 if block else len(firsts) - 1
+    _, offset, length = index['blocks'][other]
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(b'\0' * length)
+    assert sorted(r['bet_id'] for r in store._read_archive('2025-01', user_ids[5])) == expected
@@ -0,0 +1,86 @@
+"""Pagination par curseur (DatePari, bet_id) des paris, partitions chaude et mensuelles comprises."""
+import os
+
+import app as pronozone
+from conftest import make_bet
+
+
+def _pages(client, route, user_id, limit):
+    paris, before, pages = [], None, 0
+    while True:
+        query = {'user_id': user_id, 'limit': limit}
+        if before:
+            query['before'] = before
+        body = client.get(route, query_string=query).get_json()
+        assert len(body['paris']) <= limit
+        paris.extend(body['paris'])
+        pages += 1
+        before = body['next_before']
+        if before is None:
+            return paris, pages
+
+
+def test_cursor_pagination_walks_hot_and_monthly_partitions(client, new_user):
+    user_id = new_user()
+    settled = [make_bet(user_id, f"2026-0{month}-1{day}T10:00:00+00:00", statut='perdu')
+               for month in (1, 2) for day in range(3)]
+    running = [make_bet(user_id, f"2026-03-1{day}T10:00:00+00:00") for day in range(4)]
+    for bet in settled + running:
+        pronozone.bet_store.add(bet)
+    pronozone.bet_store.flush_settled() # réglés déplacés dans paris.d/2026-01.csv et 2026-02.csv
+    if pronozone.storage.name == 'csv':
+        assert os.path.exists(pronozone.BetStore.partition_path(pronozone.PARIS_PARTITIONS_DIR, '2026-01'))
+
+    paris, pages = _pages(client, '/api/historique_paris', user_id, limit=3)
+    expected = sorted(settled + running, key=lambda bet: (bet['DatePari'], bet['bet_id']), reverse=True)
+    assert [p['bet_id'] for p in paris] == [bet['bet_id'] for bet in expected]
+    assert pages == 4
+
+    en_cours, _ = _pages(client, '/api/paris_en_cours', user_id, limit=3)
+    assert [p['bet_id'] for p in en_cours] == [bet['bet_id'] for bet in expected[:4]]
+
+
+def test_pagination_without_limit_returns_full_list(client, new_user):
+    user_id = new_user()
+    for day in range(3):
+        pronozone.bet_store.add(make_bet(user_id, f"2026-04-0{day + 1}T08:00:00+00:00"))
+    body = client.get('/api/historique_paris', query_string={'user_id': user_id}).get_json()
+    assert isinstance(body, list) and len(body) == 3
+    assert client.get('/api/historique_paris', query_string={'user_id': user_id, 'limit': 'x'}).status_code == 400
+
+
+def test_cursor_does_not_skip_bets_with_same_date(client, new_user):
+    user_id = new_user()
+    same_date = "2026-02-20T21:00:00+00:00" # paris enregistrés dans la même seconde
+    settled = [make_bet(user_id, same_date, statut='gagne') for _ in range(3)]
+    running = [make_bet(user_id, same_date) for _ in range(4)]
+    older = make_bet(user_id, "2026-02-19T21:00:00+00:00")
+    for bet in settled + running + [older]:
+        pronozone.bet_store.add(bet)
+    pronozone.bet_store.flush_settled() # même DatePari dans la partition chaude et dans paris.d/2026-02.csv
+
+    paris, pages = _pages(client, '/api/historique_paris', user_id, limit=2)
+    expected = sorted(settled + running, key=lambda bet: bet['bet_id'], reverse=True) + [older]
+    assert [p['bet_id'] for p in paris] == [bet['bet_id'] for bet in expected]
+    assert pages == 4
+
+    body = client.get('/api/historique_paris', query_string={'user_id': user_id, 'limit': 3}).get_json()
+    assert body['next_before'] == f"{same_date}|{expected[2]['bet_id']}"
+
+
+def test_date_cursor_and_to_filter(client, new_user):
+    user_id = new_user()
+    bets = [make_bet(user_id, f"2026-05-0{day}T08:00:00+00:00") for day in range(1, 6)]
+    for bet in bets:
+        pronozone.bet_store.add(bet)
+
+    # Curseur réduit à une date (clients antérieurs au départage par bet_id).
+    body = client.get('/api/historique_paris', query_string={'user_id': user_id, 'before': '2026-05-04'}).get_json()
+    assert [p['bet_id'] for p in body['paris']] == [bet['bet_id'] for bet in bets[2::-1]]
+
+    # Curseur et filtre to : la borne la plus basse l'emporte.
+    cursor = f"{bets[3]['DatePari']}|{bets[3]['bet_id']}"
+    body = client.get('/api/historique_paris', query_string={'user_id': user_id, 'before': cursor, 'to': '2026-05-01'}).get_json()
+    assert [p['bet_id'] for p in body['paris']] == [bets[0]['bet_id']]
+    body = client.get('/api/historique_paris', query_string={'user_id': user_id, 'before': cursor, 'to': '2026-05-05'}).get_json()
+    assert [p['bet_id'] for p in body['paris']] == [bet['bet_id'] for bet in bets[2::-1]]
@@ -0,0 +1,42 @@
+"""Délais des récompenses quotidienne et publicitaire."""
+import time
+
+import pytest
+
+import app as pronozone
+
+
+def test_daily_reward_refused_early_without_lock(client, new_user, monkeypatch):
+    user_id = new_user()
+    assert client.post('/api/claim_daily_reward', json={'user_id': user_id}).status_code == 200
+    assert pronozone.reward_cooldowns.daily_claimed(user_id, pronozone.date.today().isoformat())
+
+    def no_update(*args):
+        raise AssertionError("update_user_atomic appelé malgré le délai")
+    monkeypatch.setattr(pronozone, 'update_user_atomic', no_update)
+    response = client.post('/api/claim_daily_reward', json={'user_id': user_id})
+    assert response.status_code == 403
+    assert response.get_json()['error'] == "Récompense quotidienne déjà réclamée"
+
+
+def test_ad_reward_refused_early_without_lock(client, new_user, monkeypatch):
+    user_id = new_user()
+    assert pronozone.reward_cooldowns.ad_remaining(user_id, time.time()) <= 0
+    assert client.post('/api/claim_ad_reward', json={'user_id': user_id}).status_code == 200
+    assert pronozone.reward_cooldowns.ad_remaining(user_id, time.time()) > 0
+
+    monkeypatch.setattr(pronozone, 'update_user_atomic', lambda *args: pytest.fail("verrou pris malgré le délai"))
+    response = client.post('/api/claim_ad_reward', json={'user_id': user_id})
+    assert response.status_code == 403
+    assert "Veuillez attendre" in response.get_json()['error']
+
+
+def test_reward_cooldowns_follow_other_workers_writes():
+    cooldowns = pronozone.RewardCooldowns()
+    row = pronozone.UserRecord.from_row({'user_id': 'u', 'last_daily_reward_date': '2026-01-01'})
+    cooldowns.rebuild({'u': row})
+    assert cooldowns.daily_claimed('u', '2026-01-01')
+    row.last_daily_reward_date = '2026-01-02'
+    cooldowns.user_changed('u', row, {'last_daily_reward_date': '2026-01-02'})
+    assert not cooldowns.daily_claimed('u', '2026-01-01')
+    assert cooldowns.daily_claimed('u', '2026-01-02')
@@ -0,0 +1,39 @@
+"""Passage en cours au coup d'envoi et fermeture des paris."""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import app as pronozone
+from conftest import make_match
+
+
+def test_scheduler_starts_due_matches_at_kickoff(tmp_path):
+    # Heures du flux dans MATCH_TIMEZONE, comparées à un instant UTC : indépendant du fuseau du serveur.
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0) + timedelta(seconds=30)
+    started_id, later_id = f"KO_{uuid.uuid4().hex[:8]}", f"KO_{uuid.uuid4().hex[:8]}"
+    pronozone.match_catalog.ingest([make_match(started_id, (now - timedelta(minutes=1)).astimezone(pronozone.MATCH_TZ)),
+                                    make_match(later_id, (now + timedelta(minutes=5)).astimezone(pronozone.MATCH_TZ))])
+    assert not pronozone.match_catalog.betting_open(started_id, now)
+    assert pronozone.match_catalog.betting_open(later_id, now)
+    assert started_id in pronozone.match_catalog.due_kickoffs(now)
+
+    scheduler = pronozone.MatchScheduler(pronozone.match_catalog, str(tmp_path / 'scheduler.lock'), max_sleep=3600)
+    delay = scheduler.tick(now)
+
+    assert pronozone.match_catalog.get(started_id)['Statut'] == pronozone.MATCH_STATUS_LIVE
+    assert pronozone.match_catalog.get_upcoming(started_id) is None
+    assert pronozone.match_catalog.get_upcoming(later_id) is not None
+    assert started_id not in pronozone.match_catalog.due_kickoffs(now)
+    assert 0 < delay <= 5 * 60 # réveillé au prochain coup d'envoi, pas après max_sleep
+    assert scheduler.tick(now + timedelta(minutes=5)) <= 3600
+    assert pronozone.match_catalog.get(later_id)['Statut'] == pronozone.MATCH_STATUS_LIVE
+
+
+def test_betting_closes_at_kickoff_before_scheduler(client, new_user):
+    user_id = new_user()
+    match_id = f"PB_{uuid.uuid4().hex[:8]}"
+    kickoff = datetime.now(pronozone.MATCH_TZ) - timedelta(minutes=2)
+    pronozone.match_catalog.ingest([make_match(match_id, kickoff)])
+    response = client.post('/api/parier', json={'user_id': user_id, 'match_id': match_id})
+    assert response.status_code == 403
+    assert response.get_json()['error'] == "Paris fermés : le match a commencé"
+    assert pronozone.get_user(user_id)['bet_count'] == 0
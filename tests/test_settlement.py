@@ -0,0 +1,71 @@
+"""Règlement des paris : gains versés, bilans et paris réglés une seule fois."""
+import pytest
+
+import app as pronozone
+from conftest import make_bet
+
+
+def _user_bets(user_id):
+    return {bet['bet_id']: bet for bet in pronozone.bet_store.page(user_id)}
+
+
+def test_settle_pays_winners_and_updates_bilans(new_user):
+    winner, loser = new_user('gagnant'), new_user('perdant')
+    won = make_bet(winner, "2026-04-02T18:00:00+00:00", montant=10)
+    won['CotePari'] = '2.55'
+    lost = make_bet(loser, "2026-04-02T18:05:00+00:00", montant=20, match_id=f"{won['MatchID']}_x")
+    for bet in (won, lost):
+        pronozone.bet_store.add(bet)
+    balances = {user_id: pronozone.get_user(user_id)['pronocoins_balance'] for user_id in (winner, loser)}
+
+    summary = pronozone.settle_matches({won['MatchID']: 'gagne', lost['MatchID']: 'Perdu '})
+
+    assert summary == {'settled_bets': 2, 'won_bets': 1, 'lost_bets': 1, 'credited_users': 1, 'pronocoins_paid': 25}
+    user = pronozone.get_user(winner)
+    assert user['pronocoins_balance'] == balances[winner] + 25 # 10 * 2.55 arrondi à l'inférieur, mise comprise
+    assert (user['bilan_paris_regles'], user['bilan_paris_gagnes'], user['bilan_gains_nets'], user['bilan_mises_reglees']) == (1, 1, 15, 10)
+    user = pronozone.get_user(loser)
+    assert user['pronocoins_balance'] == balances[loser]
+    assert (user['bilan_paris_regles'], user['bilan_paris_gagnes'], user['bilan_gains_nets'], user['bilan_mises_reglees']) == (1, 0, -20, 20)
+
+    bet = _user_bets(winner)[won['bet_id']]
+    assert bet['StatutPari'] == 'gagne' and int(bet['Gain']) == 15 and bet['CoteGagnante'] == '2.55'
+    assert _user_bets(loser)[lost['bet_id']]['StatutPari'] == 'perdu'
+
+
+def test_settle_twice_credits_once(new_user):
+    user_id = new_user('regle')
+    bet = make_bet(user_id, "2026-04-03T18:00:00+00:00", montant=10)
+    pronozone.bet_store.add(bet)
+    balance = pronozone.get_user(user_id)['pronocoins_balance']
+
+    pronozone.settle_matches({bet['MatchID']: 'gagne'})
+    again = pronozone.settle_matches({bet['MatchID']: 'gagne'})
+
+    assert again['settled_bets'] == 0 and again['pronocoins_paid'] == 0
+    user = pronozone.get_user(user_id)
+    assert user['pronocoins_balance'] == balance + 20
+    assert user['bilan_paris_regles'] == 1
+
+
+def test_settle_refunds_stake_on_invalid_odds(new_user):
+    user_id = new_user('cote')
+    bet = make_bet(user_id, "2026-04-04T18:00:00+00:00", montant=10)
+    bet['CotePari'] = 'n/a'
+    pronozone.bet_store.add(bet)
+    balance = pronozone.get_user(user_id)['pronocoins_balance']
+
+    pronozone.settle_matches({bet['MatchID']: 'gagne'})
+
+    assert pronozone.get_user(user_id)['pronocoins_balance'] == balance + 10
+    assert int(_user_bets(user_id)[bet['bet_id']]['Gain']) == 0
+
+
+def test_settle_rejects_unknown_outcome(new_user):
+    user_id = new_user('invalide')
+    bet = make_bet(user_id, "2026-04-05T18:00:00+00:00")
+    pronozone.bet_store.add(bet)
+
+    with pytest.raises(ValueError):
+        pronozone.settle_matches({bet['MatchID']: 'nul'})
+    assert _user_bets(user_id)[bet['bet_id']]['StatutPari'] == 'en_cours'
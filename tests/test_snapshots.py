@@ -0,0 +1,69 @@
+"""Instantanés des stores : repris tant que la base n'a pas changé, ignorés après une écriture externe."""
+import os
+import uuid
+
+import app as pronozone
+
+
+def _user_store(path):
+    store = pronozone.UserStore(pronozone.USERS_HEADER, pronozone.storage.users_journal(), pronozone.USERS_LOCK_DIR,
+                                pronozone.USER_LOCK_STRIPES,
+                                snapshot=pronozone.Snapshot(str(path), pronozone.UserRecord.__slots__))
+    store.recover()
+    return store
+
+
+def _follow_store(path):
+    store = pronozone.FollowStore(pronozone.storage.follows_journal(), pronozone.SUIVIS_LOCK_DIR, pronozone.USER_LOCK_STRIPES,
+                                  snapshot=pronozone.Snapshot(str(path), pronozone.SUIVIS_HEADER))
+    store.recover()
+    return store
+
+
+def test_user_snapshot_is_loaded_then_journal_replayed(tmp_path, new_user):
+    path = tmp_path / 'users.snap'
+    user_id = new_user('snap')
+    assert not _user_store(path).snapshot_used
+    assert os.path.exists(path)
+
+    def credit(user_p):
+        user_p['pronocoins_balance'] += 5
+        return user_p
+    balance = pronozone.update_user_atomic(user_id, credit)['pronocoins_balance']
+
+    store = _user_store(path)
+    assert store.snapshot_used # base inchangée : pas de relecture de users.csv ni de la table
+    assert store.rows[user_id]['pronocoins_balance'] == balance # enregistrement postérieur rejoué
+
+    # Instantané d'un autre format : ignoré.
+    pronozone.Snapshot(str(path), ['autre']).write(store.journal.base_key(), {})
+    assert not _user_store(path).snapshot_used
+
+
+def test_external_user_write_invalidates_snapshot(tmp_path):
+    path = tmp_path / 'users.snap'
+    _user_store(path)
+    imported = f"import_{uuid.uuid4().hex[:12]}"
+    # Import hors de l'application : ajout direct à users.csv ou à la table users, sans journal.
+    pronozone.append_to_csv(pronozone.USERS_FILE, {'user_id': imported, 'pseudo': 'importé', 'pronocoins_balance': 123},
+                            pronozone.USERS_HEADER)
+
+    store = _user_store(path)
+    assert not store.snapshot_used
+    assert store.rows[imported]['pseudo'] == 'importé'
+    assert pronozone.get_user(imported)['pronocoins_balance'] == 123 # store du worker rechargé au sync
+
+
+def test_external_follow_write_invalidates_snapshot(tmp_path):
+    path = tmp_path / 'suivis.snap'
+    assert not _follow_store(path).snapshot_used
+    assert _follow_store(path).snapshot_used
+
+    user_id = f"import_{uuid.uuid4().hex[:12]}"
+    pronozone.append_to_csv(pronozone.SUIVIS_FILE, {'user_id': user_id, 'MatchID': 'IMPORT1', 'date_suivi': '2026-01-01'},
+                            pronozone.SUIVIS_HEADER)
+
+    store = _follow_store(path)
+    assert not store.snapshot_used
+    assert store.followed_ids(user_id) == ['IMPORT1']
+    assert pronozone.follow_store.followed_ids(user_id) == ['IMPORT1']
@@ -0,0 +1,62 @@
+"""Flux SSE : événements utilisateur et match publiés aux abonnés, resync d'un client trop lent."""
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import app as pronozone
+from conftest import make_match
+
+
+def _events(response):
+    """Événements (event, data) du flux, sans les commentaires ni la ligne retry."""
+    for chunk in response.iter_encoded():
+        text = chunk.decode('utf-8')
+        if text.startswith('event: '):
+            event, data = text.strip().split('\n')
+            yield event[len('event: '):], json.loads(data[len('data: '):])
+
+
+def _open(client, user_id, monkeypatch):
+    monkeypatch.setattr(pronozone, 'SSE_HEARTBEAT_SECONDS', 0.05)
+    response = client.get('/api/stream', query_string={'user_id': user_id}, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    return response, _events(response)
+
+
+def test_stream_publishes_user_and_match_changes(client, new_user, monkeypatch):
+    user_id = new_user('sse')
+    response, events = _open(client, user_id, monkeypatch)
+    event, values = next(events)
+    assert event == 'user' and values == pronozone.EventHub.user_values(pronozone.get_user(user_id))
+    assert user_id in pronozone.event_hub.subscriptions
+
+    def credit(user_p):
+        user_p['pronocoins_balance'] += 7
+        return user_p
+    pronozone.update_user_atomic(user_id, credit)
+    assert next(events) == ('user', {**values, 'pronocoins_balance': values['pronocoins_balance'] + 7})
+
+    match_id = f"SSE_{uuid.uuid4().hex[:8]}"
+    kickoff = datetime.now(pronozone.MATCH_TZ) + timedelta(days=1)
+    pronozone.match_catalog.ingest([make_match(match_id, kickoff)])
+    assert next(events) == ('match', {'MatchID': match_id, 'Statut': pronozone.MATCH_STATUS_UPCOMING})
+
+    response.close()
+    assert user_id not in pronozone.event_hub.subscriptions
+
+
+def test_slow_subscriber_gets_resync(client, new_user, monkeypatch):
+    user_id = new_user('sse')
+    response, events = _open(client, user_id, monkeypatch)
+    next(events)
+    subscription, = pronozone.event_hub.subscriptions[user_id]
+    for i in range(subscription.max_events + 1):
+        pronozone.event_hub.publish('match', {'MatchID': f"M{i}", 'Statut': 'en cours'}, user_id)
+
+    assert list(events) == [('resync', {})] # file vidée, puis fin du flux
+    response.close()
+    assert user_id not in pronozone.event_hub.subscriptions
+
+
+def test_stream_requires_user_id(client):
+    assert client.get('/api/stream').status_code == 400
@@ -0,0 +1,114 @@
+"""telegram_notifier.py : messages, regroupement et reprise des envois, outbox et annonces des matchs suivis."""
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import app as pronozone
+import telegram_notifier
+from conftest import make_match
+
+telegram_error = pytest.importorskip("telegram.error")
+
+
+class FakeBot:
+    """Bot qui enregistre les messages ; errors est consommée avant chaque envoi (None : succès)."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        self.sent.append((chat_id, text))
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.added = []
+
+    def add(self, user_id, text):
+        self.added.append((user_id, text))
+
+    def idle(self):
+        return True
+
+
+def _deliver(bot, messages):
+    async def run():
+        dispatcher = telegram_notifier.Dispatcher(bot, global_rate=1000, chat_rate=1000, batch_seconds=0.01, concurrency=4)
+        for user_id, text in messages:
+            dispatcher.add(user_id, text)
+        await dispatcher.drain(5)
+        return dispatcher
+    return asyncio.run(run())
+
+
+def test_format_and_split_messages():
+    event = {'kind': 'bet_placed', 'data': {'MatchName': 'A - B', 'BetType': '1', 'CotePari': '1.8', 'Montant': 10}}
+    assert telegram_notifier.format_event(event) == "Pari enregistré : A - B (1, cote 1.8), mise de 10 PC."
+    assert telegram_notifier.format_event({'kind': 'inconnu'}) is None
+
+    limit = telegram_notifier.TELEGRAM_MAX_MESSAGE_CHARS
+    messages = telegram_notifier.split_message(['a' * (limit - 10), 'b' * 20, 'c' * (limit + 5)])
+    assert [len(m) for m in messages] == [limit - 10, 20, limit]
+
+
+def test_dispatcher_batches_per_chat_and_ignores_non_telegram_ids():
+    bot = FakeBot()
+    dispatcher = _deliver(bot, [('42', 'un'), ('42', 'deux'), ('7', 'trois'), ('web_abc', 'ignoré')])
+    assert sorted(bot.sent) == [(7, 'trois'), (42, 'un\ndeux')]
+    assert dispatcher.stats == {'sent': 2, 'dropped': 0, 'retried': 0}
+    assert dispatcher.idle()
+
+
+def test_dispatcher_retries_after_rate_limit_and_drops_blocked_chats():
+    bot = FakeBot([telegram_error.RetryAfter(timedelta(0)), None, telegram_error.Forbidden("bot bloqué")])
+    dispatcher = _deliver(bot, [('42', 'réessayé')])
+    assert bot.sent == [(42, 'réessayé')]
+    assert dispatcher.stats == {'sent': 1, 'dropped': 0, 'retried': 1}
+
+    dispatcher = _deliver(bot, [('43', 'abandonné')])
+    assert dispatcher.stats == {'sent': 0, 'dropped': 1, 'retried': 0}
+
+
+def test_outbox_is_read_then_truncated_once_sent(tmp_path):
+    outbox = pronozone.NotificationOutbox(str(tmp_path / 'notifications.outbox'), compact_bytes=1)
+    outbox.append([{'kind': 'bet_placed', 'user_id': '42', 'data': {'MatchName': 'A - B'}},
+                   {'kind': 'inconnu', 'user_id': '42', 'data': {}}])
+    dispatcher = RecordingDispatcher()
+    notifier = telegram_notifier.Notifier(SimpleNamespace(notification_outbox=outbox), dispatcher, 15,
+                                          str(tmp_path / 'notifications.state'))
+
+    assert notifier.read_outbox() == 2
+    assert [user_id for user_id, _ in dispatcher.added] == ['42']
+    notifier._checkpoint()
+    assert notifier.offset == 0 and (tmp_path / 'notifications.outbox').stat().st_size == 0
+    assert json.loads((tmp_path / 'notifications.state').read_text(encoding='utf-8'))['offset'] == 0
+
+
+def test_followed_match_announced_once_before_kickoff(tmp_path):
+    now = datetime.now(timezone.utc)
+    soon, later = f"NOTIF_{uuid.uuid4().hex[:8]}", f"NOTIF_{uuid.uuid4().hex[:8]}"
+    pronozone.match_catalog.ingest([make_match(soon, (now + timedelta(minutes=10)).astimezone(pronozone.MATCH_TZ)),
+                                    make_match(later, (now + timedelta(hours=2)).astimezone(pronozone.MATCH_TZ))])
+    follower = str(uuid.uuid4().int % 10**9)
+    for match_id in (soon, later):
+        pronozone.follow_store.toggle(follower, match_id)
+    dispatcher = RecordingDispatcher()
+    notifier = telegram_notifier.Notifier(pronozone, dispatcher, 15, str(tmp_path / 'notifications.state'))
+
+    notifier.scan_matches(now)
+    match = pronozone.match_catalog.get(soon)
+    expected = telegram_notifier.format_match_start(match, pronozone.match_kickoff(match))
+    assert [text for user_id, text in dispatcher.added if user_id == follower] == [expected]
+    assert soon in notifier.announced and later not in notifier.announced
+
+    dispatcher.added.clear()
+    notifier.scan_matches(now + timedelta(minutes=1))
+    assert [user_id for user_id, _ in dispatcher.added if user_id == follower] == []
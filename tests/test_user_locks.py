@@ -0,0 +1,29 @@
+"""Verrous utilisateurs entre process : update_user_atomic, et stress_user_locks.py sur les deux moteurs de stockage."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app as pronozone
+from conftest import BASE_DIR
+
+
+@pytest.mark.parametrize('backend', ['csv', 'sqlite'])
+def test_stress_user_locks(backend):
+    env = {**os.environ, 'PRONOZONE_STORAGE': backend}
+    result = subprocess.run([sys.executable, os.path.join(BASE_DIR, 'stress_user_locks.py'),
+                             '--workers', '2', '--threads', '2', '--ops', '20', '--users', '3'],
+                            env=env, cwd=BASE_DIR, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.startswith('OK')
+
+
+def test_update_user_atomic_unknown_user_returns_none():
+    assert pronozone.update_user_atomic('inconnu_xyz', lambda user_p: user_p) is None
+
+
+def test_add_row_does_not_overwrite_existing_user(new_user):
+    user_id = new_user()
+    pronozone.user_store.add_row({'user_id': user_id, 'pseudo': 'autre', 'pronocoins_balance': 0})
+    assert pronozone.get_user(user_id)['pronocoins_balance'] == pronozone.PRONOCOINS_INITIAL_BALANCE